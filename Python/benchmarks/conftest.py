@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import shutil
+import resource
+import pytest
+
+# The scripts in Python/src import each other as top level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from config_parser import parse_config
+from synth_design import SyntheticDesign, write_design, parse_size
+from fault_db import read_faults
+
+# Benchmarks of the Python side of the flow (pytest-benchmark).
+# Every benchmark runs on synthetic designs (synth_design.py) of the sizes
+# given with --bench_sizes, generated once per session (or kept in
+# --bench_fixtures). The measured call runs --bench_rounds times and the
+# fastest round counts; its peak memory is measured once in a forked
+# process (growth of the high-water mark, or the largest child process).
+# Throughput (units of work per second) and peak memory are stored in the
+# extra_info of the pytest-benchmark results.
+#
+# --bench_baseline takes the --benchmark-json output of an earlier run; a
+# benchmark whose fastest round or peak memory grew past --bench_tolerance
+# (and by more than a small absolute amount, to ignore timer noise) fails.
+# Baselines only compare on the same machine: CI runs the suite on the base
+# commit first and checks the change against it
+# (.github/workflows/benchmarks.yml).
+
+DEFAULT_TOLERANCE = 0.1
+# absolute slack of the regression checks
+MIN_SECONDS = 0.02
+MIN_MB = 8.0
+
+def pytest_addoption(parser):
+    group = parser.getgroup("bench", "tetramax_automation benchmarks")
+    group.addoption("--bench_sizes", nargs="+", default=["10k"], help="Design sizes in cells, e.g. 10k 100k 1M 10M (default: 10k)")
+    group.addoption("--bench_fixtures", default=None, help="Keep the generated designs here (default: a temporary directory)")
+    group.addoption("--bench_rounds", type=int, default=3, help="Rounds per benchmark, the fastest counts (default: 3)")
+    group.addoption("--bench_baseline", default=None, help="--benchmark-json output to check against")
+    group.addoption("--bench_tolerance", type=float, default=DEFAULT_TOLERANCE,
+                    help=f"Allowed time and peak memory growth over the baseline (default: {DEFAULT_TOLERANCE})")
+
+def pytest_generate_tests(metafunc):
+    if "design" in metafunc.fixturenames:
+        metafunc.parametrize("design", metafunc.config.getoption("bench_sizes"), indirect=True, scope="session")
+
+# Function to get the fixture of a size, generating it on first use
+def load_fixture(fixtures_dir, cells, patterns=64, seed=1):
+    fixture_dir = os.path.abspath(os.path.join(fixtures_dir, f"{cells}_p{patterns}_s{seed}"))
+    stamp_file = os.path.join(fixture_dir, "fixture.json")
+    if os.path.isfile(stamp_file):
+        with open(stamp_file) as f:
+            stamp = json.load(f)
+        design, files = SyntheticDesign(cells, seed=seed), stamp["files"]
+    else:
+        shutil.rmtree(fixture_dir, ignore_errors=True)
+        design, files = write_design(fixture_dir, cells, patterns=patterns, seed=seed)
+        stamp = {"files": files, "faults": sum(1 for _ in read_faults(files["faults"]))}
+        with open(stamp_file, "w") as f:
+            json.dump(stamp, f, indent=1)
+    return {"dir": fixture_dir, "design": design, "files": files, "faults": stamp["faults"], "patterns": patterns,
+            "config": parse_config(files["config"])}
+
+@pytest.fixture(scope="session")
+def design(request, tmp_path_factory):
+    fixtures_dir = request.config.getoption("bench_fixtures") or tmp_path_factory.mktemp("bench_fixtures")
+    return load_fixture(fixtures_dir, parse_size(request.param))
+
+@pytest.fixture(scope="session")
+def baseline(request):
+    baseline_file = request.config.getoption("bench_baseline")
+    if baseline_file is None:
+        return None
+    with open(baseline_file) as f:
+        return {entry["name"]: entry for entry in json.load(f)["benchmarks"]}
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / float(1 << 20)
+
+# Function to read the high-water mark of the process, in MB
+def _peak_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024.0
+    # Linux reports ru_maxrss in KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+# Function to reset the high-water mark to the current RSS, so the setup's
+# peak does not hide the one of the measured call
+def _reset_peak():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+# Function to run a call once in a forked process; returns its peak memory
+# growth in MB
+def peak_memory(function, *args):
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        result = {}
+        try:
+            sys.stdout = open(os.devnull, "w")
+            _reset_peak()
+            start_mb = _rss_mb()
+            function(*args)
+            children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0
+            result = {"peak_mb": max(_peak_mb() - start_mb, children, 0.0)}
+        except Exception as error:
+            result = {"error": f"{type(error).__name__}: {error}"}
+        finally:
+            os.write(write_end, json.dumps(result).encode())
+            os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as f:
+        text = f.read()
+    os.waitpid(pid, 0)
+    result = json.loads(text) if text else {"error": "benchmark process died"}
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result["peak_mb"]
+
+# Function to compare a result with its baseline entry; returns the regressions
+def find_regressions(seconds, peak_mb, base, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+    base_seconds = base["stats"]["min"]
+    if seconds > base_seconds * (1 + tolerance) and seconds - base_seconds > MIN_SECONDS:
+        regressions.append(f"{seconds:.3f} s, baseline {base_seconds:.3f} s")
+    base_mb = base.get("extra_info", {}).get("peak_mb")
+    if base_mb is not None and peak_mb > base_mb * (1 + tolerance) and peak_mb - base_mb > MIN_MB:
+        regressions.append(f"peak {peak_mb:.1f} MB, baseline {base_mb:.1f} MB")
+    return regressions
+
+# bench(function, *args, units=, unit=) measures a call: rounds, peak
+# memory, throughput and the baseline check. Returns the call's result.
+@pytest.fixture
+def bench(benchmark, baseline, request, tmp_path):
+    def run(function, *args, units=1, unit="runs"):
+        # files the call writes go to a scratch directory
+        cwd = os.getcwd()
+        os.chdir(tmp_path)
+        try:
+            peak_mb = peak_memory(function, *args)
+            result = benchmark.pedantic(function, args, rounds=request.config.getoption("bench_rounds"))
+        finally:
+            os.chdir(cwd)
+        if benchmark.stats is None:
+            # --benchmark-disable
+            return result
+        seconds = benchmark.stats.stats.min
+        benchmark.extra_info.update({"peak_mb": round(peak_mb, 1), "units": units, "unit": unit,
+                                     "throughput": units / seconds if seconds > 0 else None})
+        base = baseline.get(benchmark.name) if baseline is not None else None
+        if base is not None:
+            regressions = find_regressions(seconds, peak_mb, base, request.config.getoption("bench_tolerance"))
+            if regressions:
+                pytest.fail(f"REGRESSION {benchmark.name}: {'; '.join(regressions)}")
+        return result
+    return run
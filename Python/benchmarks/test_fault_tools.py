@@ -0,0 +1,88 @@
+import random
+import numpy as np
+from bit_fault_sim import CircuitModel, fault_rows, run_fault_sim
+from fault_collapse import FaultCollapser
+from fault_dict import FaultDictionary, build_dictionary
+from fault_sample import draw_sample, estimate_from_run
+from netlist_graph import open_graph
+from pattern_reorder import reorder_patterns
+from config_sweep import pareto_layers, parse_param, sweep_points
+
+def pin_faults(design):
+    return len(fault_rows(CircuitModel(design["files"]["netlist"], design["config"].top_module)))
+
+def test_bit_fault_sim(bench, design):
+    files = design["files"]
+    bench(lambda: run_fault_sim(files["netlist"], files["stil"], "stuck", summary_file="bench.rpt",
+                                top=design["config"].top_module),
+          units=pin_faults(design), unit="faults")
+
+def test_bit_fault_sim_transition(bench, design):
+    files = design["files"]
+    bench(lambda: run_fault_sim(files["netlist"], files["stil"], "transition", top=design["config"].top_module),
+          units=pin_faults(design), unit="faults")
+
+def test_fault_collapse(bench, design):
+    graph = open_graph(design["files"]["netlist"], top=design["config"].top_module)
+    try:
+        bench(lambda: FaultCollapser(graph, "stuck").collapse(), units=2 * graph.num_pins, unit="faults")
+    finally:
+        graph.close()
+
+def test_fault_dict_build(bench, design):
+    files = design["files"]
+    bench(lambda: build_dictionary(files["netlist"], files["stil"], "bench.fdict", top=design["config"].top_module),
+          units=pin_faults(design), unit="faults")
+
+def test_fault_dict_diagnose(bench, design, tmp_path):
+    files = design["files"]
+    dict_file = str(tmp_path / "bench.fdict")
+    build_dictionary(files["netlist"], files["stil"], dict_file, top=design["config"].top_module)
+    with FaultDictionary(dict_file) as dictionary:
+        # a multiple fault defect: the union of three detected faults
+        rng = random.Random(1)
+        detected = [f for f in range(dictionary.num_faults) if dictionary.fault_patterns[f] > 0]
+        fails = np.unique(np.concatenate([dictionary.signature(f) for f in rng.sample(detected, 3)]))
+        bench(lambda: [dictionary.diagnose(fails) for _ in range(10)], units=10, unit="fail logs")
+
+def test_pattern_reorder(bench, design):
+    files = design["files"]
+    bench(lambda: reorder_patterns(files["netlist"], files["stil"], coverage=95.0, output_file="bench.stil",
+                                   top=design["config"].top_module),
+          units=pin_faults(design), unit="faults")
+
+def test_fault_sample_draw(bench, design):
+    graph = open_graph(design["files"]["netlist"], top=design["config"].top_module)
+    try:
+        bench(lambda: draw_sample(graph, "bench_sample.fault", collapsed=True), units=2 * graph.num_pins, unit="faults")
+    finally:
+        graph.close()
+
+def test_fault_sample_estimate(bench, design, tmp_path):
+    sample_file = str(tmp_path / "bench_sample.fault")
+    graph = open_graph(design["files"]["netlist"], top=design["config"].top_module)
+    try:
+        draw_sample(graph, sample_file)
+    finally:
+        graph.close()
+    # a run that detected about 90% of the sample
+    rng = random.Random(1)
+    faults_file = str(tmp_path / "bench_run.fault")
+    sampled = 0
+    with open(sample_file) as sample, open(faults_file, "w") as out:
+        for line in sample:
+            fault_type, _, pin = line.split()
+            out.write(f"{fault_type} {rng.choice(['DS'] * 9 + ['NO'])} {pin}\n")
+            sampled += 1
+    bench(estimate_from_run, sample_file, faults_file, units=sampled, unit="faults")
+
+def test_config_sweep_pareto(bench, design):
+    # rung results of a large sweep, e.g. 5 x 5 x 4 x 5 points
+    config = design["config"]
+    params = [parse_param(option, config) for option in ("num_scan_chain=4,8,16,32,64", "n_detect=1:5",
+                                                        "capture_cycle=1:4", "launch_cycle=1:5")]
+    points = sweep_points(params)
+    rng = random.Random(1)
+    results = [{"patterns": rng.randint(500, 5000), "test_coverage": round(rng.uniform(95.0, 99.9), 2),
+                "cpu_time": rng.uniform(10.0, 1000.0), "wall_time": 0.0} for _ in points]
+    bench(pareto_layers, results, units=len(results), unit="points")
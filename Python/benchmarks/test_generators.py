@@ -0,0 +1,29 @@
+import copy
+import shutil
+import pytest
+from dft import DFTScriptGenerator
+from atpg import ATPG_GENERATORS, BaseATPGScriptGenerator
+from faultsim import FAULT_SIM_GENERATORS
+
+def generate(bench, design, generator_class, model=None):
+    config = copy.copy(design["config"])
+    if model:
+        config.fault_model = model
+    bench(lambda: generator_class(copy.copy(config)).generate_tcl("bench.tcl"), unit="scripts")
+
+def test_generate_tcl_dft(bench, design):
+    generate(bench, design, DFTScriptGenerator)
+
+@pytest.mark.parametrize("model", sorted(ATPG_GENERATORS))
+def test_generate_tcl_atpg(bench, design, model):
+    if model in ("path_delay", "hold_time") and not shutil.which("pt_shell"):
+        # the path delay generators extract their paths with pt_shell
+        pytest.skip("pt_shell not found")
+    generate(bench, design, ATPG_GENERATORS[model], model)
+
+def test_generate_tcl_atpg_base(bench, design):
+    generate(bench, design, BaseATPGScriptGenerator)
+
+@pytest.mark.parametrize("model", sorted(FAULT_SIM_GENERATORS))
+def test_generate_tcl_faultsim(bench, design, model):
+    generate(bench, design, FAULT_SIM_GENERATORS[model], model)
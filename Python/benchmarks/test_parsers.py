@@ -0,0 +1,50 @@
+from config_parser import parse_config
+from summary_parser import parse_summary
+from gen_bridging_site import extract_nodes, generate_random_pairs
+from gen_spef_bridging_site import read_coupling_caps, top_coupled_pairs, resolve_names
+from fault_db import FaultDB, read_faults
+from stil_reader import open_patterns
+from netlist_graph import open_graph
+from scan_balance import read_spf_chains
+
+def test_parse_config(bench, design):
+    bench(lambda path: [parse_config(path) for _ in range(100)], design["files"]["config"], units=100, unit="configs")
+
+def test_parse_summary(bench, design):
+    bench(lambda path: [parse_summary(path) for _ in range(100)], design["files"]["summary"], units=100, unit="reports")
+
+def test_extract_nodes(bench, design):
+    bench(extract_nodes, design["files"]["netlist"], units=design["design"].cells, unit="cells")
+
+def test_generate_random_pairs(bench, design):
+    nodes = extract_nodes(design["files"]["netlist"])
+    pairs = min(100000, len(nodes))
+    bench(lambda: generate_random_pairs(nodes, pairs, seed=1), units=pairs, unit="pairs")
+
+def test_generate_random_pairs_dedup(bench, design):
+    nodes = extract_nodes(design["files"]["netlist"])
+    pairs = min(100000, len(nodes))
+    bench(lambda: generate_random_pairs(nodes, pairs, seed=1, dedup=True), units=pairs, unit="pairs")
+
+def test_netlist_graph(bench, design):
+    bench(lambda: open_graph(design["files"]["netlist"], "bench.ngraph", rebuild=True).close(),
+          units=design["design"].cells, unit="cells")
+
+def test_read_faults(bench, design):
+    bench(lambda path: sum(1 for _ in read_faults(path)), design["files"]["faults"], units=design["faults"], unit="faults")
+
+def test_fault_db(bench, design):
+    bench(FaultDB.from_faults_file, design["files"]["faults"], units=design["faults"], unit="faults")
+
+def test_open_patterns(bench, design):
+    bench(lambda: open_patterns(design["files"]["stil"], "bench.pstore", rebuild=True).close(),
+          units=design["patterns"], unit="patterns")
+
+def test_read_spf_chains(bench, design):
+    bench(read_spf_chains, design["files"]["spf"], units=design["design"].flops, unit="scan cells")
+
+def test_spef_coupled_pairs(bench, design):
+    def run(path):
+        pairs = top_coupled_pairs(read_coupling_caps(path), 1000)
+        return resolve_names(path, {net for pair in pairs for net in pair[:2]})
+    bench(run, design["files"]["spef"], units=design["design"].gates, unit="nets")
@@ -1,10 +1,52 @@
 import os
+import argparse
 from config_parser import Config, parse_config
+from pt_paths import extract_delay_paths
+from tool_runner import run_tool
+from fault_collapse import write_collapsed_faults
+from fault_sample import sample_fault_list, write_fault_sample
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 class BaseATPGScriptGenerator:
+    # fault model of the structurally collapsed list, if the model has one
+    collapse_model = None
+    # pattern budget of a truncated run (config sweeps), None for no limit
+    max_patterns = None
+
     def __init__(self, config: Config):
         self.config = config
         self.config.summary_file = self.config.summary_file.replace('_report', '_ATPG_report')
+        # optional fault list to target instead of the whole fault universe
+        # (sampled or structurally collapsed, built from the scan inserted
+        # netlist by write_fault_list)
+        self.fault_list = self.config_fault_list()
+
+    # Function to name the sampled / collapsed fault list of the config
+    def config_fault_list(self):
+        if self.collapse_model and self.config.fault_sampling:
+            return sample_fault_list(self.config, self.collapse_model)
+        if self.collapse_model and self.config.structural_collapsing:
+            return f"{self.config.top_module}_{self.collapse_model}_collapsed.fault"
+        return None
+
+    # Function to build the sampled / collapsed fault list from the scan
+    # inserted netlist. `make all` generates the scripts before scan
+    # insertion, so the atpg rule builds the list again (atpg.py
+    # --fault_list) right before tmax runs.
+    # Returns False if the netlist does not exist yet.
+    def write_fault_list(self):
+        if not self.fault_list or self.fault_list != self.config_fault_list():
+            # no list, or one given by the caller (shards, top-up ATPG)
+            return True
+        if not os.path.isfile(self.config.netlist_file):
+            return False
+        if self.config.fault_sampling:
+            write_fault_sample(self.config, self.collapse_model, self.fault_list)
+        else:
+            write_collapsed_faults(self.config.netlist_file, self.fault_list, self.collapse_model,
+                                   self.config.top_module, with_equivalents=True)
+        return True
     
     def set(self, file):
         file.write("""##############################################
@@ -25,10 +67,13 @@ class BaseATPGScriptGenerator:
 
     def set_atpg(self, file):
         # Set ATPG
-        file.write("set_atpg -coverage 100\n")
+        file.write(f"set_atpg -coverage {self.config.fault_coverage}\n")
         
         if self.config.pattern_specification == "partial":
             file.write("set_atpg -fill X\n")
+
+        if self.max_patterns:
+            file.write(f"set_atpg -patterns {self.max_patterns}\n")
         
         # file.write("set_atpg -decision random\n")
         # self.set_atpg_option(file)
@@ -64,7 +109,16 @@ class BaseATPGScriptGenerator:
 
     def add_fault(self, file):
         # Add fault list to ATPG
-        file.write("add_faults -all\n\n")
+        if self.fault_list:
+            if not self.write_fault_list():
+                print(f"Warning: {self.config.netlist_file} does not exist yet, "
+                      f"{self.fault_list} is built when ATPG runs.")
+            file.write(f"read_faults {self.fault_list}\n\n")
+        else:
+            file.write("add_faults -all\n\n")
+            if self.config.remove_fault:
+                # tmax keeps a random sample of the faults
+                file.write(f"remove_faults -retain_sample {100 - self.config.remove_fault}\n\n")
 
     def run_atpg(self, file):
         # Run ATPG
@@ -85,6 +139,8 @@ class BaseATPGScriptGenerator:
             self.write_output(file)
 
 class StuckATPGScriptGenerator(BaseATPGScriptGenerator):
+    collapse_model = "stuck"
+
     def __init__(self, config: Config):
         super().__init__(config)
         
@@ -100,6 +156,8 @@ class StuckATPGScriptGenerator(BaseATPGScriptGenerator):
             file.write(f"run_atpg -ndetect {self.config.n_detect}\n\n")
         
 class TransitionATPGScriptGenerator(BaseATPGScriptGenerator):
+    collapse_model = "transition"
+
     def __init__(self, config: Config):
         super().__init__(config)
         if config.capture_cycle == None:
@@ -142,7 +200,13 @@ class BridgingATPGScriptGenerator(BaseATPGScriptGenerator):
     def __init__(self, config: Config):
         super().__init__(config)
         # generate node.txt
-        os.system(f"python3 gen_bridging_site.py ./Netlist/{self.config.top_module}_dft.v")
+        if self.config.bridging_site_source == "spef":
+            # strongest coupled net pairs from the extracted parasitics
+            command = f"python3 {SCRIPT_DIR}/gen_spef_bridging_site.py {self.config.spef_file} --num_pairs {self.config.bridging_num_pairs}"
+        else:
+            command = f"python3 {SCRIPT_DIR}/gen_bridging_site.py {self.config.netlist_file} --num_pairs {self.config.bridging_num_pairs}"
+        if run_tool(command, "bridging_site.log") != 0:
+            print("Warning: bridging site generation failed, see bridging_site.log.")
         
     def set_fault_option(self, file):
         # Set fault model
@@ -150,7 +214,10 @@ class BridgingATPGScriptGenerator(BaseATPGScriptGenerator):
     
     def add_fault(self, file):
         # override default
-        file.write("add_faults -node_file nodes.txt\n\n")
+        if self.fault_list:
+            super().add_fault(file)
+        else:
+            file.write("add_faults -node_file nodes.txt\n\n")
     
     def set_atpg_option(self, file):
         # Set ATPG
@@ -158,11 +225,13 @@ class BridgingATPGScriptGenerator(BaseATPGScriptGenerator):
         file.write("set_atpg -merge high \n")
         
 class PathDelayATPGScriptGenerator(BaseATPGScriptGenerator):
+    # write_delay_paths -delay_type of the extracted paths
+    delay_type = "max"
+
     def __init__(self, config: Config):
         super().__init__(config)
         # generate critical paths
-        self.writePrimeTimeScript()
-        os.system("pt_shell -f pt_path.tcl")
+        extract_delay_paths(self.config, self.delay_type, self.config.path_delay_partition, self.config.path_delay_jobs)
         
     def set_fault_option(self, file):
         # Set fault model
@@ -172,33 +241,10 @@ class PathDelayATPGScriptGenerator(BaseATPGScriptGenerator):
     # def set_atpg_option(self, file):
     #     # Set ATPG
     #     file.write("set_atpg -merge high \n")
-    
-    def writePrimeTimeScript(self):
-        with open("pt_path.tcl", "w") as f:
-            f.write("remove_design -all\n")
-            f.write(f'set search_path ". {self.config.db_library}"\n')
-            f.write('set link_path "* typical.db  fast.db  slow.db"\n\n')
-            
-            f.write(f"read_verilog {self.config.netlist_file}\n")
-            f.write(f"link_design {self.config.top_module}\n")
-            f.write(f"read_parasitics {self.config.spef_file}\n")
-            f.write("set_operating_conditions typical -library typical\n\n")
-            
-            f.write(f"set CLK_PERIOD {self.config.slack}\n")
-            f.write("set CLK CK\n")
-            f.write("create_clock -period $CLK_PERIOD [get_ports $CLK]\n")
-            f.write("set_clock_transition -rise 0.05 [get_clocks $CLK]\n")
-            f.write("set_clock_transition -fall 0.03 [get_clocks $CLK]\n")
-            f.write("set_clock_latency -rise 0.01 [get_clocks $CLK]\n")
-            f.write("set_clock_latency -fall 0.03 [get_clocks $CLK]\n")
-            f.write("set_ideal_network [get_ports CK]\n\n")
-            
-            f.write("source pt2tmax.tcl\n")
-            f.write(f"write_delay_paths -max_paths 200 -nworst 1 -delay_type max ./{self.config.top_module}_delay.rpt\n\n")
-            
-            f.write("exit")
 
 class HoldTimeATPGScriptGenerator(PathDelayATPGScriptGenerator):
+    delay_type = "min"
+
     def __init__(self, config: Config):
         super().__init__(config)
     
@@ -215,26 +261,38 @@ class ExperimentATPGScriptGenerator(BaseATPGScriptGenerator):
         file.write(f"set_static {self.config.experiment_static}")
         
 
+# Generator class for each supported fault model
+ATPG_GENERATORS = {
+    "stuck": StuckATPGScriptGenerator,
+    "transition": TransitionATPGScriptGenerator,
+    "bridging": BridgingATPGScriptGenerator,
+    "iddq": IDDQATPGScriptGenerator,
+    "path_delay": PathDelayATPGScriptGenerator,
+    "hold_time": HoldTimeATPGScriptGenerator,
+}
+
 if __name__ == "__main__":
-    config_file = "../../Python/src/config.txt"
-    config = parse_config(config_file)
+    parser = argparse.ArgumentParser(description='Generate atpg.tcl, or build its fault list.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--fault_list', action='store_true',
+                        help='Only build the sampled / collapsed fault list of atpg.tcl (atpg stage, after scan insertion)')
+    args = parser.parse_args()
+    config = parse_config(args.config)
 
     output_file = "../../Script/tcl/atpg.tcl"
     
-    if config.fault_model == "stuck":
-        generator = StuckATPGScriptGenerator(config)
-    elif config.fault_model == "transition":
-        generator = TransitionATPGScriptGenerator(config)
-    elif config.fault_model == "bridging":
-        generator = BridgingATPGScriptGenerator(config)
-    elif config.fault_model == "iddq":
-        generator = IDDQATPGScriptGenerator(config)
-    elif config.fault_model == "path_delay":
-        generator = PathDelayATPGScriptGenerator(config)
-    elif config.fault_model == "hold_time":
-        generator = HoldTimeATPGScriptGenerator(config)
-    else:
-        generator = BaseATPGScriptGenerator(config)
+    generator_class = ATPG_GENERATORS.get(config.fault_model, BaseATPGScriptGenerator)
+
+    if args.fault_list:
+        # only the stuck / transition generators have a fault list to build
+        if generator_class.collapse_model:
+            generator = generator_class(config)
+            if not generator.write_fault_list():
+                print(f"Error: {config.netlist_file} not found, run scan insertion first.")
+                raise SystemExit(1)
+        raise SystemExit(0)
+
+    generator = generator_class(config)
     
     generator.generate_tcl(output_file)
 
@@ -0,0 +1,140 @@
+import os
+import re
+import sys
+import shlex
+import signal
+import argparse
+import threading
+import subprocess
+from collections import deque
+from config_parser import Config, parse_config
+from campaign import TMAX
+
+# Coverage plateau watchdog for tmax ATPG.
+# tmax prints one row per ATPG pass while run_atpg works:
+#   #patterns  #faults        #ATPG faults  test      process
+#   stored     detect/active  red/au/abort  coverage  CPU time
+#   512        4518   2682    0/0/12        91.32%    35.20
+# The watchdog feeds the ATPG script to tmax over stdin, reads these rows as
+# they stream out and interrupts run_atpg (SIGINT, Ctrl-C for tmax) once the
+# test coverage grows slower than plateau_slope percent per CPU minute over
+# the last plateau_window CPU seconds. tmax keeps the patterns found so far
+# and goes on with the rest of the script, so the summary, the fault list and
+# the patterns are still written. The fault_coverage target is not watched:
+# tmax stops there itself (set_atpg -coverage in atpg.tcl).
+# tmax runs in its own session and the interrupt goes to the whole process
+# group, as the tmax command is a wrapper script around the real binary.
+#
+# Without a plateau rule (plateau_slope = 0) nothing can trigger, and the
+# script runs as `tmax -shell -tcl <script>`.
+
+_PASS_RE = re.compile(r"^\s*(\d+)\s+\d+\s+\d+\s+\d+/\d+/\d+\s+([\d.]+)%\s+([\d.]+)\s*$")
+
+class PlateauMonitor:
+    # Decides from the ATPG pass rows when to stop
+    def __init__(self, min_slope=0.0, window=120.0):
+        self.min_slope = min_slope
+        self.window = window
+        self.history = deque()   # (CPU seconds, test coverage) of the window
+        self.patterns = None
+        self.coverage = None
+        self.cpu = None
+
+    def enabled(self):
+        return self.min_slope > 0
+
+    def feed(self, line):
+        # Returns the reason to stop, or None
+        match = _PASS_RE.match(line)
+        if not match:
+            return None
+        patterns, coverage, cpu = int(match.group(1)), float(match.group(2)), float(match.group(3))
+        if self.cpu is not None and cpu < self.cpu:
+            # a new run_atpg starts its CPU time from zero
+            self.history.clear()
+        self.patterns, self.coverage, self.cpu = patterns, coverage, cpu
+        if self.min_slope <= 0:
+            return None
+        self.history.append((cpu, coverage))
+        while len(self.history) > 2 and cpu - self.history[1][0] >= self.window:
+            self.history.popleft()
+        start_cpu, start_coverage = self.history[0]
+        if cpu - start_cpu < self.window:
+            return None
+        slope = (coverage - start_coverage) / ((cpu - start_cpu) / 60.0)
+        if slope < self.min_slope:
+            return (f"coverage grew {slope:.4f}%/CPU min over the last {cpu - start_cpu:.0f} CPU s "
+                    f"(plateau_slope {self.min_slope:g})")
+        return None
+
+# Function to feed a script to the tool's stdin; the tool reads the next
+# command only when the previous one is done
+def _feed_script(stdin, text):
+    try:
+        stdin.write(text.encode())
+        stdin.close()
+    except BrokenPipeError:
+        pass
+
+# Function to signal the tool and every process it started
+def _signal_group(process, signum):
+    try:
+        os.killpg(process.pid, signum)
+    except ProcessLookupError:
+        pass
+
+# Main function
+def run_watched(config: Config, tcl_file, tmax=TMAX, echo=True) -> int:
+    monitor = PlateauMonitor(config.plateau_slope, config.plateau_window)
+    if not monitor.enabled():
+        return subprocess.call(shlex.split(tmax) + [tcl_file])
+
+    with open(tcl_file) as f:
+        script = f.read()
+    process = subprocess.Popen(shlex.split(tmax), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, bufsize=0, start_new_session=True)
+    feeder = threading.Thread(target=_feed_script, args=(process.stdin, script if script.endswith("\n") else script + "\n"),
+                              daemon=True)
+    feeder.start()
+    stopped = None
+    try:
+        for line in iter(process.stdout.readline, b""):
+            text = line.decode(errors="replace")
+            if echo:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            if stopped is None:
+                stopped = monitor.feed(text)
+                if stopped:
+                    print(f"# watchdog: {stopped}, interrupting run_atpg")
+                    sys.stdout.flush()
+                    _signal_group(process, signal.SIGINT)
+    except KeyboardInterrupt:
+        # its own session does not get the terminal's Ctrl-C
+        _signal_group(process, signal.SIGTERM)
+        raise
+    finally:
+        process.stdout.close()
+    returncode = process.wait()
+    feeder.join(1.0)
+    if monitor.coverage is not None:
+        state = f"stopped early: {stopped}" if stopped else "ran to completion"
+        print(f"# watchdog: {state}; last pass {monitor.coverage:.2f}% test coverage, {monitor.patterns} patterns, "
+              f"{monitor.cpu:.1f} CPU s")
+    return returncode
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run an ATPG script in tmax and stop run_atpg once the coverage plateaus.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--tool', default=TMAX, help=f'Tool command, e.g. "python3 fake_tmax.py" (default: {TMAX})')
+    parser.add_argument('--plateau_slope', type=float, default=None, help='Override plateau_slope, %% per CPU minute')
+    parser.add_argument('--plateau_window', type=float, default=None, help='Override plateau_window, CPU seconds')
+    parser.add_argument('tcl_file', help='ATPG script, e.g. atpg.tcl')
+    args = parser.parse_args()
+
+    config = parse_config(args.config)
+    if args.plateau_slope is not None:
+        config.plateau_slope = args.plateau_slope
+    if args.plateau_window is not None:
+        config.plateau_window = args.plateau_window
+    raise SystemExit(run_watched(config, args.tcl_file, args.tool))
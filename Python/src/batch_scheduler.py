@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import shlex
+import hashlib
+import argparse
+import resource
+import statistics
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from config_parser import parse_config
+from campaign import job_config, run_dft, run_atpg, run_faultsim
+from faultsim import FAULT_SIM_GENERATORS
+from stage_cache import StageCache, DEFAULT_CACHE_DIR
+from metrics_store import DEFAULT_METRICS_DB, MetricsStore, config_hash, record_summary
+
+# Multi design batch runs.
+# A manifest lists one design per line:
+#   <name> <config.txt> [fault model ...] [base_dir=<dir>] [cpus=N] [memory=MB] [dft=false]
+# (models default to the fault_model of the config, relative paths in a
+# config refer to base_dir, by default the directory of the config). Every
+# design becomes a chain of tasks, scan insertion then ATPG and fault
+# simulation per fault model, run like campaign.py under
+# <work_dir>/<design>[/<model>].
+#
+# Each task's peak memory and runtime is estimated from the netlist size:
+# scaled from the last run of the same task, else from the per MB rates of
+# the other designs' runs, else from DEFAULT_RATES (the ATPG CPU time in
+# metrics.db is used when there is no batch history yet). Ready tasks are
+# started longest critical path first as long as they fit into the free
+# CPUs, memory and tool licenses; when the first one does not fit, only
+# tasks expected to end before the running ones do are backfilled.
+# Every finished task is checkpointed to <work_dir>/batch_state.json, so
+# running the same batch again resumes where it stopped; tasks of a design
+# whose config changed run again.
+
+STATE_FILE = "batch_state.json"
+HISTORY_FILE = "batch_history.json"
+
+STAGE_LICENSES = {"dft": "dc_shell", "atpg": "tmax", "faultsim": "tmax"}
+DEFAULT_LICENSES = {"tmax": 4, "dc_shell": 1}
+# seconds and MB of peak memory per MB of netlist, and the memory floor in MB
+DEFAULT_RATES = {
+    "dft": (60.0, 40.0, 500.0),
+    "atpg": (120.0, 60.0, 300.0),
+    "faultsim": (30.0, 60.0, 300.0),
+}
+
+Design = namedtuple("Design", ["name", "config_file", "base_dir", "models", "cpus", "memory", "dft"])
+
+class Task:
+    # One stage of one design (and fault model)
+    def __init__(self, design, stage, model=None, deps=()):
+        self.design = design
+        self.stage = stage
+        self.model = model
+        self.deps = list(deps)
+        self.id = "/".join(part for part in (design.name, model, stage) if part)
+        self.license = STAGE_LICENSES[stage]
+        self.dir = None
+        self.size = 0
+        self.runtime = 0.0
+        self.memory = 0.0
+        self.priority = 0.0
+
+    def __repr__(self):
+        return f"Task({self.id}, runtime={self.runtime:.0f}s, memory={self.memory:.0f}MB)"
+
+# Function to read a batch manifest
+def read_manifest(manifest_file):
+    designs = []
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_file))
+    with open(manifest_file) as f:
+        for number, line in enumerate(f, 1):
+            tokens = shlex.split(line, comments=True)
+            if not tokens:
+                continue
+            if len(tokens) < 2:
+                raise ValueError(f"{manifest_file}:{number}: expected <name> <config> [models] [options]")
+            name, config_file = tokens[0], os.path.join(manifest_dir, tokens[1])
+            options = dict(token.split("=", 1) for token in tokens[2:] if "=" in token)
+            models = [token for token in tokens[2:] if "=" not in token]
+            if not models:
+                models = [parse_config(config_file).fault_model]
+            base_dir = os.path.join(manifest_dir, options["base_dir"]) if "base_dir" in options \
+                else os.path.dirname(config_file)
+            designs.append(Design(name, config_file, os.path.abspath(base_dir), models,
+                                  int(options.get("cpus", 1)), float(options["memory"]) if "memory" in options else None,
+                                  options.get("dft", "true").lower() == "true"))
+    names = [design.name for design in designs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"{manifest_file}: duplicate design names {', '.join(duplicates)}")
+    return designs
+
+# Function to fingerprint a design; its checkpoints only hold while the
+# config, the base directory and the models stay the same
+def design_fingerprint(design):
+    digest = hashlib.sha256()
+    with open(design.config_file, "rb") as f:
+        digest.update(f.read())
+    digest.update(json.dumps([design.base_dir, design.models, design.dft]).encode())
+    return digest.hexdigest()[:16]
+
+# Function to size the netlist a stage reads, in bytes
+def netlist_size(config, base_dir, stage):
+    fields = ["synthesized_files"] if stage == "dft" else ["netlist_file", "synthesized_files"]
+    for field in fields:
+        paths = [os.path.join(base_dir, path) for path in getattr(config, field).split()]
+        if paths and all(os.path.isfile(path) for path in paths):
+            return sum(os.path.getsize(path) for path in paths)
+    return 0
+
+# Function to build the tasks of the designs
+def build_tasks(designs, work_dir):
+    tasks = []
+    for design in designs:
+        dft = Task(design, "dft") if design.dft else None
+        if dft:
+            tasks.append(dft)
+        for model in design.models:
+            atpg = Task(design, "atpg", model, [dft] if dft else [])
+            tasks.append(atpg)
+            if model in FAULT_SIM_GENERATORS:
+                tasks.append(Task(design, "faultsim", model, [atpg]))
+    for task in tasks:
+        config = parse_config(task.design.config_file)
+        task.size = netlist_size(config, task.design.base_dir, task.stage)
+        task.dir = os.path.join(work_dir, task.design.name, task.model or "")
+    return tasks
+
+# Function to estimate the runtime (s) and peak memory (MB) of a task from
+# the batch history and the recorded ATPG runs
+def estimate(task, history, metrics_db=None):
+    size_mb = max(task.size / float(1 << 20), 0.01)
+    same = [run for run in history if (run["design"], run["stage"], run["model"]) ==
+            (task.design.name, task.stage, task.model)]
+    seconds_rate, memory_rate, floor = DEFAULT_RATES[task.stage]
+    if same:
+        scale = size_mb / max(same[-1]["size_mb"], 0.01)
+        runtime, memory = same[-1]["wall_time"] * scale, same[-1]["peak_rss_mb"] * scale
+    else:
+        rates = [(run["wall_time"] / run["size_mb"], run["peak_rss_mb"] / run["size_mb"])
+                 for run in history if run["stage"] == task.stage and run["size_mb"] > 0]
+        if rates:
+            seconds_rate = statistics.median(rate[0] for rate in rates)
+            memory_rate = statistics.median(rate[1] for rate in rates)
+        runtime, memory = seconds_rate * size_mb, max(floor, memory_rate * size_mb)
+        if not rates and task.stage != "dft" and metrics_db and os.path.isfile(metrics_db):
+            config = job_config(parse_config(task.design.config_file), task.model, task.dir, task.design.base_dir)
+            store = MetricsStore(metrics_db)
+            try:
+                runs = store.history(config_hash(config), task.stage)
+            finally:
+                store.close()
+            if runs and runs[-1]["cpu_time"]:
+                runtime = runs[-1]["cpu_time"]
+    return runtime, task.design.memory or memory
+
+# Function to rank the tasks by their critical path: own runtime plus the
+# longest chain of tasks waiting for them
+def set_priorities(tasks):
+    dependents = {task.id: [] for task in tasks}
+    for task in tasks:
+        for dep in task.deps:
+            dependents[dep.id].append(task)
+    by_id = {task.id: task for task in tasks}
+
+    def path(task_id):
+        task = by_id[task_id]
+        if not task.priority:
+            task.priority = task.runtime + max((path(t.id) for t in dependents[task_id]), default=0.0)
+        return task.priority
+
+    for task in tasks:
+        path(task.id)
+
+def _load_json(path, default):
+    if not os.path.isfile(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+def _save_json(path, data):
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, path)
+
+# Function to run one task; runs in a fresh worker process so its peak
+# memory is the one of this task's tools
+def run_task(stage, config_file, base_dir, model, task_dir, cache, force=False, metrics_db=None):
+    start = time.monotonic()
+    os.makedirs(task_dir, exist_ok=True)
+    # scan insertion reads the config's relative paths from base_dir
+    os.chdir(base_dir if stage == "dft" else task_dir)
+    config = parse_config(config_file)
+    if stage == "dft":
+        returncode = run_dft(config, base_dir, task_dir, cache, force)
+    else:
+        config = job_config(config, model, task_dir, base_dir)
+        run = run_atpg if stage == "atpg" else run_faultsim
+        returncode = run(config, model, task_dir, cache, force)
+        if returncode == 0 and metrics_db:
+            record_summary(config, stage, metrics_db, task_dir)
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # Linux reports ru_maxrss in KB
+    return returncode, time.monotonic() - start, usage.ru_maxrss / 1024.0
+
+# Function to take the resources of a task, or return False if they are not free
+def _take(free, task, sign=-1, force=False):
+    need = {"cpus": task.design.cpus, "memory": task.memory}
+    if task.license in free:
+        need[task.license] = 1
+    if sign < 0 and not force and any(free[name] < amount for name, amount in need.items()):
+        return False
+    for name, amount in need.items():
+        free[name] += sign * amount
+    return True
+
+# Main function
+def run_batch(manifest_file, work_dir="batch", cpus=None, memory=None, licenses=None, cache_dir=DEFAULT_CACHE_DIR,
+              force=False, restart=False, dry_run=False, metrics_db=DEFAULT_METRICS_DB):
+    designs = read_manifest(manifest_file)
+    work_dir = os.path.abspath(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    state_file = os.path.join(work_dir, STATE_FILE)
+    history_file = os.path.join(work_dir, HISTORY_FILE)
+    metrics_db = metrics_db and os.path.abspath(metrics_db)
+    cpus = cpus or os.cpu_count() or 1
+    memory = memory or os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / float(1 << 20)
+    licenses = DEFAULT_LICENSES if licenses is None else licenses
+    cache = StageCache(os.path.abspath(cache_dir))
+
+    tasks = build_tasks(designs, work_dir)
+    history = _load_json(history_file, [])
+    for task in tasks:
+        task.runtime, task.memory = estimate(task, history, metrics_db)
+    set_priorities(tasks)
+
+    # checkpoints of unchanged designs; a task only counts as done after its dependencies
+    fingerprints = {design.name: design_fingerprint(design) for design in designs}
+    state = {} if restart else _load_json(state_file, {})
+    done = set()
+    for task in tasks:
+        entry = state.get(task.id)
+        if entry and entry["status"] == "done" and entry["fingerprint"] == fingerprints[task.design.name] \
+                and all(dep.id in done for dep in task.deps):
+            done.add(task.id)
+    state = {task_id: entry for task_id, entry in state.items() if task_id in done}
+    pending = [task for task in tasks if task.id not in done]
+    print(f"{len(designs)} designs, {len(tasks)} tasks, {len(done)} already done; "
+          f"limits: {cpus} CPUs, {memory:.0f} MB, " + ", ".join(f"{n} {name}" for name, n in licenses.items()))
+    if dry_run:
+        print(f"{'task':<40} {'netlist MB':>10} {'runtime s':>10} {'memory MB':>10} {'path s':>10}")
+        for task in sorted(pending, key=lambda t: -t.priority):
+            print(f"{task.id:<40} {task.size / float(1 << 20):>10.2f} {task.runtime:>10.0f} {task.memory:>10.0f} "
+                  f"{task.priority:>10.0f}")
+        return state
+
+    free = {"cpus": cpus, "memory": memory, **licenses}
+    failed = set()
+    running = {}
+    # one process per task (max_tasks_per_child needs spawn) so peak memory is per task
+    pool = ProcessPoolExecutor(max_workers=cpus, mp_context=multiprocessing.get_context("spawn"),
+                               max_tasks_per_child=1)
+    try:
+        while pending or running:
+            for task in [t for t in pending if any(dep.id in failed for dep in t.deps)]:
+                print(f"{task.id}: skipped, a task it depends on failed")
+                failed.add(task.id)
+                pending.remove(task)
+            ready = sorted((t for t in pending if all(dep.id in done for dep in t.deps)), key=lambda t: -t.priority)
+            now = time.monotonic()
+            # the running tasks are expected to be done by then
+            shadow = max((start + task.runtime - now for task, start in running.values()), default=0.0)
+            blocked = False
+            for task in ready:
+                if blocked and task.runtime > shadow:
+                    continue
+                if not _take(free, task):
+                    if running:
+                        blocked = True
+                        continue
+                    # larger than the limits: run it alone
+                    print(f"Warning: {task.id} needs more than the limits, running it alone")
+                    _take(free, task, force=True)
+                print(f"{task.id}: started (~{task.runtime:.0f} s, ~{task.memory:.0f} MB)")
+                future = pool.submit(run_task, task.stage, task.design.config_file, task.design.base_dir, task.model,
+                                     task.dir, cache, force, metrics_db)
+                running[future] = (task, now)
+                pending.remove(task)
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task, start = running.pop(future)
+                _take(free, task, sign=1)
+                try:
+                    returncode, wall, peak = future.result()
+                except Exception as error:
+                    returncode, wall, peak = f"{type(error).__name__}: {error}", time.monotonic() - start, 0.0
+                ok = returncode == 0
+                print(f"{task.id}: {'done' if ok else 'FAILED'} (returncode {returncode}) in {wall:.0f} s, "
+                      f"peak {peak:.0f} MB")
+                state[task.id] = {"status": "done" if ok else "failed", "returncode": returncode,
+                                  "fingerprint": fingerprints[task.design.name], "wall_time": wall,
+                                  "peak_rss_mb": peak, "finished": time.time()}
+                _save_json(state_file, state)
+                if ok:
+                    done.add(task.id)
+                    history.append({"design": task.design.name, "stage": task.stage, "model": task.model,
+                                    "size_mb": task.size / float(1 << 20), "wall_time": wall, "peak_rss_mb": peak})
+                    _save_json(history_file, history)
+                else:
+                    failed.add(task.id)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; {len(done)} of {len(tasks)} tasks are checkpointed in {state_file}, "
+              f"run the batch again to resume.")
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    print(f"Batch finished: {len(done)} of {len(tasks)} tasks done, {len(failed)} failed or skipped.")
+    return state
+
+# Function to parse license limits given as name=count
+def parse_licenses(values):
+    licenses = dict(DEFAULT_LICENSES)
+    for value in values or []:
+        name, _, count = value.partition("=")
+        licenses[name] = int(count)
+    return licenses
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the flow for many designs, packing their stages into CPU, memory and license limits, with checkpoint/resume.')
+    parser.add_argument('manifest', help='Manifest: <name> <config.txt> [models] [base_dir=] [cpus=] [memory=] [dft=] per line')
+    parser.add_argument('--work_dir', default='batch', help='Directory holding one sub-directory per design (default: batch)')
+    parser.add_argument('--cpus', type=int, default=None, help='CPUs to use (default: all)')
+    parser.add_argument('--memory', type=float, default=None, help='Memory to use in MB (default: physical memory)')
+    parser.add_argument('--licenses', nargs='+', default=None,
+                        help='License limits as tool=count (default: ' + ' '.join(f'{k}={v}' for k, v in DEFAULT_LICENSES.items()) + ')')
+    parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help=f'Stage cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--force', action='store_true', help='Run every stage even if its outputs are cached')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoints and run every task again')
+    parser.add_argument('--dry_run', action='store_true', help='Only print the tasks with their estimates')
+    parser.add_argument('--metrics_db', default=DEFAULT_METRICS_DB, help=f'Metrics database the summaries are appended to (default: {DEFAULT_METRICS_DB})')
+    args = parser.parse_args()
+    state = run_batch(args.manifest, args.work_dir, args.cpus, args.memory, parse_licenses(args.licenses),
+                      args.cache_dir, args.force, args.restart, args.dry_run, args.metrics_db)
+    if not args.dry_run and any(entry["status"] != "done" for entry in state.values()):
+        raise SystemExit(1)
@@ -0,0 +1,820 @@
+import os
+import sys
+import heapq
+import argparse
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from config_parser import parse_config
+from verilog_reader import flatten
+from stil_reader import open_patterns
+from fault_db import open_faults
+from cell_library import lookup, compile_expression
+
+# Bit-parallel fault simulator for screening patterns before a tmax run.
+# The scan inserted netlist is flattened and levelized; scan flops become
+# pseudo inputs (loaded from the STIL scan loads) and pseudo outputs
+# (observed where the STIL unload has an expected value). Patterns are
+# simulated in blocks of NumPy uint64 words, 64 patterns per word, and the
+# good machine is evaluated level by level with one vectorized call per cell
+# function and level. Blocks are decoded and simulated as the fault
+# simulation reaches them, so only one block's net values are held at a time.
+# Faults are not propagated one by one. A net read by a single pin of a
+# single output gate (and not a primary output) lies in a fanout free
+# region: flipping it only shows through that gate's output, on the patterns
+# where the gate is sensitized to the pin. These sensitizations are ANDed
+# back from the root of every region in one vectorized pass per level, so a
+# fault detects where it is active, its path to the root is sensitized and
+# the root is observed. Only the roots (fanout stems, and inputs of flops and
+# multi output cells) are flipped and propagated event driven, a batch of
+# neighbouring roots at a time with one slot per root, so each gate event is
+# one NumPy call for the whole batch.
+# A fault is dropped at the first block that detects it. Transition faults
+# use launch on capture: the first capture launches, the second one observes.
+# Wider blocks amortize the interpreter overhead per root and fault,
+# narrower ones drop faults earlier. On a synthetic 10k cell design (48k
+# faults, 8192 patterns) the detection lists of the first 8 detections per
+# fault take about 8 s on one core.
+
+WORD_BITS = 64
+DEFAULT_BLOCK_BITS = 2048
+# Words one propagation carries: roots per batch x words per block
+BATCH_WORDS = 4096
+
+# Stuck value the fault forces in the observing frame
+FAULT_VALUES = {"sa0": 0, "sa1": 1, "str": 0, "stf": 1}
+MODEL_TYPES = {"stuck": ("sa0", "sa1"), "transition": ("str", "stf")}
+
+# kind is "stem" (net), "branch" (input k of gate) or "po" (output port)
+Site = namedtuple("Site", ["kind", "net", "gate", "pin", "value"])
+# Word arrays of one block: values is nets x words, state / next_state /
+# flop_care are flops x words; launch holds the first frame's values for
+# transition faults
+Block = namedtuple("Block", ["start", "mask", "count", "launch", "values", "state", "next_state", "po_care", "flop_care"])
+
+class CircuitModel:
+    def __init__(self, netlist_file, top=None):
+        top, ports, instances = flatten(netlist_file, top)
+        self.top = top
+        self.net_ids = {}
+        self.net_names = []
+        self.zero = self._net("1'b0")
+        self.one = self._net("1'b1")
+        self.inputs = {name: self._net(net) for direction, name, net in ports if direction != "output"}
+        self.outputs = {name: self._net(net) for direction, name, net in ports if direction == "output"}
+
+        self.gate_path, self.gate_cell, self.gate_pins = [], [], []
+        self.gate_inputs, self.gate_outputs, self.flop_index = [], [], []
+        self.flop_gate, self.flop_next, self.flop_outputs = [], [], []
+        self.unknown_cells = set()
+        for path, cell, pins in instances:
+            self._add_gate(path, cell, pins)
+        self.gate_index = {path: g for g, path in enumerate(self.gate_path)}
+        self._levelize()
+        self._regions()
+        self._plans()
+
+    def _net(self, name):
+        net = self.net_ids.get(name)
+        if net is None:
+            net = self.net_ids[name] = len(self.net_names)
+            self.net_names.append(name)
+        return net
+
+    def _add_gate(self, path, cell, pins):
+        if cell in ("and", "or", "xor", "nand", "nor", "xnor", "buf", "not"):
+            # primitives: output first, then the inputs
+            nets = [net for _, net in sorted(pins.items(), key=lambda item: item[0])]
+            function = lookup(cell, len(nets) - 1)
+            pins = {"Y": nets[0], **{f"I{i}": net for i, net in enumerate(nets[1:])}}
+        else:
+            function = lookup(cell)
+        if function is None:
+            self.unknown_cells.add(cell)
+            return
+        inputs = tuple(self._net(pins[pin]) if pins.get(pin) else self.zero for pin in function.inputs)
+        outputs = [(pin, self._net(pins[pin]), expression) for pin, expression in function.outputs.items() if pins.get(pin)]
+        g = len(self.gate_path)
+        self.gate_path.append(path)
+        self.gate_cell.append(cell)
+        self.gate_pins.append((function.inputs, tuple(pin for pin, _, _ in outputs)))
+        self.gate_inputs.append(inputs)
+        if function.next_state is None:
+            self.flop_index.append(-1)
+            self.gate_outputs.append(tuple((net, compile_expression(function.inputs, expression))
+                                           for _, net, expression in outputs))
+        else:
+            self.flop_index.append(len(self.flop_gate))
+            self.flop_gate.append(g)
+            self.flop_next.append(compile_expression(function.inputs + ("IQ",), function.next_state))
+            self.flop_outputs.append(tuple((net, compile_expression(("IQ",), expression))
+                                           for _, net, expression in outputs))
+            self.gate_outputs.append(tuple(net for _, net, _ in outputs))
+
+    def _levelize(self):
+        # Kahn's algorithm over the combinational gates; flops cut the loops
+        n_nets = len(self.net_names)
+        driver = [-1] * n_nets
+        self.fanout = [[] for _ in range(n_nets)]
+        for g, inputs in enumerate(self.gate_inputs):
+            if self.flop_index[g] < 0:
+                for net, _ in self.gate_outputs[g]:
+                    driver[net] = g
+            for net in set(inputs):
+                self.fanout[net].append(g)
+        self.level = [0] * len(self.gate_path)
+        pending = [0] * len(self.gate_path)
+        ready = []
+        for g, inputs in enumerate(self.gate_inputs):
+            if self.flop_index[g] < 0:
+                pending[g] = sum(1 for net in set(inputs) if driver[net] >= 0)
+                if pending[g] == 0:
+                    ready.append(g)
+        order = []
+        while ready:
+            g = ready.pop()
+            order.append(g)
+            for net, _ in self.gate_outputs[g]:
+                for h in self.fanout[net]:
+                    if self.flop_index[h] < 0:
+                        self.level[h] = max(self.level[h], self.level[g] + 1)
+                        pending[h] -= 1
+                        if pending[h] == 0:
+                            ready.append(h)
+        depth = max(self.level, default=0) + 1
+        looped = [g for g in range(len(self.gate_path)) if self.flop_index[g] < 0 and pending[g] > 0]
+        if looped:
+            print(f"Warning: {len(looped)} gates sit on combinational loops and are evaluated once, last.")
+            for g in looped:
+                self.level[g] = depth
+            order += looped
+            depth += 1
+        self.looped = set(looped)
+        for g in self.flop_gate:
+            # observation points come after every combinational gate
+            self.level[g] = depth
+        self.order = sorted(order, key=self.level.__getitem__)
+        # event queue keys: position in evaluation order, flops last
+        self.gate_at = self.order + self.flop_gate
+        self.rank = [0] * len(self.gate_path)
+        for r, g in enumerate(self.gate_at):
+            self.rank[g] = r
+        self.fanout_ranks = [[self.rank[g] for g in gates] for gates in self.fanout]
+        # rank of the gate driving each net; -1 for inputs, flop outputs and constants
+        self.net_rank = [-1] * n_nets
+        for g in self.order:
+            for net, _ in self.gate_outputs[g]:
+                self.net_rank[net] = self.rank[g]
+
+    def _single_output(self, g):
+        return self.flop_index[g] < 0 and len(self.gate_outputs[g]) == 1 and g not in self.looped
+
+    def _regions(self):
+        # tree_pin: the only (gate, pin) reading a net inside a fanout free
+        # region, None for the nets that root one
+        n_nets = len(self.net_names)
+        readers = [0] * n_nets
+        for inputs in self.gate_inputs:
+            for net in inputs:
+                readers[net] += 1
+        po_nets = set(self.outputs.values())
+        self.tree_pin = [None] * n_nets
+        for g, inputs in enumerate(self.gate_inputs):
+            if self._single_output(g):
+                for k, net in enumerate(inputs):
+                    if readers[net] == 1 and net not in po_nets:
+                        self.tree_pin[net] = (g, k)
+        self.net_root = list(range(n_nets))
+        for g in reversed(self.order):
+            if self._single_output(g):
+                out = self.gate_outputs[g][0][0]
+                for net in self.gate_inputs[g]:
+                    if self.tree_pin[net] is not None:
+                        self.net_root[net] = self.net_root[out]
+
+    def _plans(self):
+        # Vectorized evaluation plans, as (function, input net columns,
+        # output nets) grouped by level and function
+        frame = {}
+        for g in self.order:
+            if g not in self.looped:
+                for net, function in self.gate_outputs[g]:
+                    group = frame.setdefault((self.level[g], function), ([], []))
+                    group[0].append(self.gate_inputs[g])
+                    group[1].append(net)
+        self.frame_plan = [(function, _columns(inputs, len(inputs[0])), np.array(outputs))
+                           for (_, function), (inputs, outputs) in frame.items()]
+        flop_out = {}
+        flop_next = {}
+        for fi, g in enumerate(self.flop_gate):
+            for net, function in self.flop_outputs[fi]:
+                group = flop_out.setdefault(function, ([], []))
+                group[0].append(fi)
+                group[1].append(net)
+            group = flop_next.setdefault(self.flop_next[fi], ([], []))
+            group[0].append(fi)
+            group[1].append(self.gate_inputs[g])
+        self.flop_out_plan = [(function, np.array(fis), np.array(nets)) for function, (fis, nets) in flop_out.items()]
+        self.flop_next_plan = [(function, np.array(fis), _columns(inputs, len(inputs[0])))
+                               for function, (fis, inputs) in flop_next.items()]
+        # fanout free regions: the sensitization of every tree pin by cell
+        # function and pin, then the AND chains towards the roots, deepest
+        # gates first
+        sensitize = {}
+        chains = {}
+        for net, tree_pin in enumerate(self.tree_pin):
+            if tree_pin is not None:
+                g, k = tree_pin
+                out, function = self.gate_outputs[g][0]
+                group = sensitize.setdefault((function, k), ([], [], []))
+                group[0].append(self.gate_inputs[g])
+                group[1].append(out)
+                group[2].append(net)
+                group = chains.setdefault(self.level[g], ([], []))
+                group[0].append(net)
+                group[1].append(out)
+        self.sensitize_plan = [(function, k, _columns(inputs, len(inputs[0])), np.array(outs), np.array(nets))
+                               for (function, k), (inputs, outs, nets) in sensitize.items()]
+        self.chain_plan = [(np.array(chains[level][0]), np.array(chains[level][1]))
+                           for level in sorted(chains, reverse=True)]
+
+    # Function to simulate the good machine over one frame.
+    # Returns the words of every net and the next state of every flop.
+    def good_frame(self, mask, pi_nets, pi_words, state):
+        values = np.zeros((len(self.net_names), len(mask)), np.uint64)
+        values[self.one] = mask
+        values[pi_nets] = pi_words
+        for function, fis, nets in self.flop_out_plan:
+            values[nets] = function(state[fis], mask)
+        for function, columns, outputs in self.frame_plan:
+            values[outputs] = function(*[values[column] for column in columns], mask)
+        for g in self.order[len(self.order) - len(self.looped):]:
+            ins = [values[net].copy() for net in self.gate_inputs[g]]
+            for net, function in self.gate_outputs[g]:
+                values[net] = function(*ins, mask)
+        next_state = np.zeros_like(state)
+        for function, fis, columns in self.flop_next_plan:
+            next_state[fis] = function(*[values[column] for column in columns], state[fis], mask)
+        return values, next_state
+
+    # Function to compute, for every net of a block, the patterns on which
+    # flipping it flips the root of its fanout free region (all of them for
+    # the roots)
+    def reach(self, block):
+        mask, values = block.mask, block.values
+        reach = np.empty_like(values)
+        reach[:] = mask
+        for function, k, columns, outs, nets in self.sensitize_plan:
+            ins = [values[column] for column in columns]
+            ins[k] = ins[k] ^ mask
+            reach[nets] = function(*ins, mask) ^ values[outs]
+        for nets, outs in self.chain_plan:
+            reach[nets] &= reach[outs]
+        return reach
+
+    # Function to map a fault pin path to its Site, None if it is not simulated
+    def fault_site(self, pin, fault_type):
+        value = FAULT_VALUES.get(fault_type)
+        if value is None:
+            return None
+        pin = pin.lstrip("/")
+        if pin in self.inputs:
+            return Site("stem", self.inputs[pin], -1, -1, value)
+        if pin in self.outputs:
+            return Site("po", self.outputs[pin], -1, -1, value)
+        path, _, name = pin.rpartition("/")
+        g = self.gate_index.get(path)
+        if g is None:
+            return None
+        inputs, outputs = self.gate_pins[g]
+        if name in inputs:
+            return Site("branch", self.gate_inputs[g][inputs.index(name)], g, inputs.index(name), value)
+        if name in outputs:
+            out = self.gate_outputs[g][outputs.index(name)]
+            return Site("stem", out if isinstance(out, int) else out[0], -1, -1, value)
+        # clock pins and unconnected pins
+        return None
+
+    # Function to list every port and data pin of the design as fault pins
+    def fault_pins(self):
+        pins = list(self.inputs) + list(self.outputs)
+        for g, path in enumerate(self.gate_path):
+            inputs, outputs = self.gate_pins[g]
+            pins += [f"{path}/{pin}" for pin in inputs + outputs]
+        return pins
+
+    # Function to find the root a fault's effect has to pass: a net, or
+    # (gate, pin) for inputs of flops and multi output cells; None for
+    # output port faults
+    def site_root(self, site):
+        if site.kind == "po":
+            return None
+        if site.kind == "branch":
+            if self._single_output(site.gate):
+                return self.net_root[self.gate_outputs[site.gate][0][0]]
+            return (site.gate, site.pin)
+        return self.net_root[site.net]
+
+    # Function to order roots by level, a net right after the gate driving
+    # it and a (gate, pin) root right before it, so that neighbouring roots
+    # share most of their fanout cone
+    def root_order(self, site):
+        root = self.site_root(site)
+        if root is None:
+            return (2 * len(self.gate_at) + 2, site.net)
+        if isinstance(root, tuple):
+            return (2 * self.rank[root[0]],) + root
+        return (2 * self.net_rank[root] + 1, root)
+
+    # Function to find the patterns of a block on which a fault is active
+    def activation(self, block, site):
+        good = block.values[site.net]
+        if block.launch is not None:
+            # launch on capture: the site has to toggle between the frames
+            before = block.launch[site.net]
+            return (good & ~before) if site.value == 0 else (before & ~good)
+        return good if site.value == 0 else ~good & block.mask
+
+    # Function to find the patterns on which a fault's effect reaches its root
+    def fault_path(self, block, site, reach):
+        if site.kind == "branch" and self._single_output(site.gate):
+            mask, values = block.mask, block.values
+            out, function = self.gate_outputs[site.gate][0]
+            ins = [values[net] for net in self.gate_inputs[site.gate]]
+            ins[site.pin] = ins[site.pin] ^ mask
+            return (function(*ins, mask) ^ values[out]) & reach[out]
+        if site.kind == "stem":
+            return reach[site.net]
+        return block.mask
+
+    # Function to find the patterns of a block on which flipping each of a
+    # batch of roots is observed. Every root gets a slot: the faulty words
+    # of a net are (roots x words) and slot r only carries root r's flip,
+    # so one propagation through the union of their fanout cones serves the
+    # whole batch. Returns (roots x words); observed, when given, is a list
+    # of one dict per root that collects the observing patterns per
+    # observation point: the flop index for scan cells, ~net for primary
+    # outputs.
+    def observe(self, block, roots, observed=None):
+        mask, values, po_care = block.mask, block.values, block.po_care
+        gate_inputs, gate_outputs, flop_index, gate_at, fanout_ranks = (
+            self.gate_inputs, self.gate_outputs, self.flop_index, self.gate_at, self.fanout_ranks)
+        shape = (len(roots), len(mask))
+        # net roots are forced to their flipped value in their slot, pin
+        # roots flip the pin in theirs
+        forced, pin_flips = {}, {}
+        for r, root in enumerate(roots):
+            if isinstance(root, tuple):
+                flips = pin_flips.setdefault(root[0], {})
+                flips.setdefault(root[1], np.zeros(shape, np.uint64))[r] = mask
+            else:
+                forced.setdefault(root, []).append(r)
+        # faulty words of the nets the batch changed; the rest keep their good value
+        faulty = {}
+        detected = np.zeros(shape, np.uint64)
+        queue = [self.rank[g] for g in pin_flips]
+        for net, slots in forced.items():
+            word = np.broadcast_to(values[net], shape).copy()
+            word[slots] ^= mask
+            faulty[net] = word
+            queue += fanout_ranks[net]
+            care = po_care.get(net)
+            if care is not None:
+                detected[slots] |= care
+                if observed is not None:
+                    for r in slots:
+                        observed[r][~net] = care
+        queue = list(set(queue))
+        heapq.heapify(queue)
+        queued = set(queue)
+        while queue:
+            g = gate_at[heapq.heappop(queue)]
+            ins = [faulty[net] if net in faulty else values[net] for net in gate_inputs[g]]
+            flips = pin_flips.get(g)
+            if flips:
+                for k, flip in flips.items():
+                    ins[k] = ins[k] ^ flip
+            fi = flop_index[g]
+            if fi >= 0:
+                seen = (self.flop_next[fi](*ins, block.state[fi], mask) ^ block.next_state[fi]) & block.flop_care[fi]
+                if seen.any():
+                    detected |= seen
+                    if observed is not None:
+                        for r in np.flatnonzero(seen.any(axis=1)):
+                            observed[r][fi] = seen[r]
+                continue
+            for net, function in gate_outputs[g]:
+                word = function(*ins, mask)
+                slots = forced.get(net)
+                if slots:
+                    word = np.broadcast_to(word, shape).copy()
+                    word[slots] = values[net] ^ mask
+                diff = word ^ values[net]
+                if not diff.any():
+                    continue
+                faulty[net] = word
+                care = po_care.get(net)
+                if care is not None:
+                    seen = diff & care
+                    detected |= seen
+                    if observed is not None:
+                        for r in np.flatnonzero(seen.any(axis=1)):
+                            observed[r][~net] = seen[r]
+                for r in fanout_ranks[net]:
+                    if r not in queued:
+                        queued.add(r)
+                        heapq.heappush(queue, r)
+        return detected
+
+    # Function to find the observed patterns of every root the sites need.
+    # Returns {root: words}.
+    def observe_roots(self, block, sites):
+        roots = list(dict.fromkeys(self.site_root(site) for site in sites if site.kind != "po"))
+        batch_roots = batch_size(block)
+        known = {}
+        for i in range(0, len(roots), batch_roots):
+            batch = roots[i:i + batch_roots]
+            known.update(zip(batch, self.observe(block, batch)))
+        return known
+
+    # Function to find the patterns of a block that detect a fault, given
+    # the observed patterns of its root
+    def detect(self, block, site, reach, known):
+        active = self.activation(block, site)
+        if site.kind == "po":
+            care = block.po_care.get(site.net)
+            return active & care if care is not None else np.zeros_like(active)
+        return active & self.fault_path(block, site, reach) & known[self.site_root(site)]
+
+    # Function to find per observation point the patterns of a block that
+    # detect a fault, given the observed dict of its root
+    def detect_points(self, block, site, reach, observed):
+        active = self.activation(block, site)
+        if site.kind == "po":
+            care = block.po_care.get(site.net)
+            seen = active & care if care is not None else None
+            return {~site.net: seen} if seen is not None and seen.any() else {}
+        active = active & self.fault_path(block, site, reach)
+        points = {}
+        if active.any():
+            for point, word in observed.items():
+                seen = word & active
+                if seen.any():
+                    points[point] = seen
+        return points
+
+# Function to size the root batches of a block
+def batch_size(block):
+    return max(1, BATCH_WORDS // len(block.mask))
+
+# Function to turn a list of per gate input nets into one index array per pin
+def _columns(inputs, width):
+    table = np.array(inputs, dtype=np.intp).reshape(len(inputs), width)
+    return [table[:, j].copy() for j in range(width)]
+
+# Function to list the set bits of a word array (pattern offsets in a block)
+def word_bits(word):
+    return np.flatnonzero(np.unpackbits(word.view(np.uint8), bitorder="little"))
+
+# Function to resolve the STIL ScanCells of every chain to flop indexes.
+# Returns (flop, chain position, inverted) for every cell; vector character
+# j of a chain belongs to its cell length-1-j (the first bit shifted in ends
+# next to the scan output).
+def scan_cells(model, store):
+    cells = []
+    for chain in store.chains:
+        names = store.scan_cells.get(chain.name)
+        if not names:
+            continue
+        resolved = []
+        inverted = False
+        for name in names:
+            if name == "!":
+                inverted = not inverted
+                continue
+            parts = name.split(".")
+            if parts[0] == model.top and len(parts) > 1:
+                parts = parts[1:]
+            g = model.gate_index.get("/".join(parts))
+            if g is None:
+                # last part is the scan pin (SI, D, ...)
+                g = model.gate_index.get("/".join(parts[:-1]))
+            resolved.append((model.flop_index[g] if g is not None else -1, inverted))
+        for index, (fi, inverted) in enumerate(resolved):
+            if fi >= 0:
+                cells.append((fi, chain.name, len(resolved) - 1 - index, inverted))
+    return cells
+
+# Function to transpose count pattern rows into words: row i of the result
+# holds bit position i of every pattern, pattern 0 in bit 0 of word 0
+def _transpose(store, start, count, words):
+    raw = store.rows(start, count)
+    planes = np.empty((2, store.plane_bytes * 8, words), np.uint64)
+    # a few MB of unpacked bits at a time
+    step = max(1, (1 << 20) // count)
+    for b in range(0, store.plane_bytes, step):
+        bits = np.unpackbits(raw[:, :, b:b + step], axis=2, bitorder="little")
+        bits = np.moveaxis(bits, 0, 2)
+        padded = np.zeros(bits.shape[:2] + (words * WORD_BITS,), np.uint8)
+        padded[:, :, :count] = bits
+        packed = np.packbits(padded, axis=2, bitorder="little")
+        planes[:, 8 * b:8 * b + bits.shape[1]] = packed.view(np.uint64)
+    return planes[0], planes[1]
+
+class PatternBlocks:
+    # The patterns as simulation blocks. A block is decoded and its good
+    # machine simulated when the iteration reaches it, so only the block in
+    # use is held in memory; every pass (every worker) simulates them again.
+    def __init__(self, model, store, transition=False, block_bits=DEFAULT_BLOCK_BITS):
+        self.model = model
+        self.store = store
+        self.transition = transition
+        pi_nets, pi_positions = [], []
+        field = store.fields.get("pi")
+        if field:
+            for j, signal in enumerate(field.signals):
+                if signal in model.inputs:
+                    pi_nets.append(model.inputs[signal])
+                    pi_positions.append(field.offset + j)
+        self.po_positions = []
+        field = store.fields.get("po")
+        if field:
+            self.po_positions = [(model.outputs[signal], field.offset + j) for j, signal in enumerate(field.signals)
+                                 if signal in model.outputs]
+        load_fis, load_positions, load_inverted = [], [], []
+        unload_fis, unload_positions = [], []
+        for fi, chain, position, inverted in scan_cells(model, store):
+            load = store.fields.get(f"load:{chain}")
+            unload = store.fields.get(f"unload:{chain}")
+            if load and position < load.width:
+                load_fis.append(fi)
+                load_positions.append(load.offset + position)
+                load_inverted.append(inverted)
+            if unload and position < unload.width:
+                unload_fis.append(fi)
+                unload_positions.append(unload.offset + position)
+        if store.chains and not load_positions:
+            print("Warning: no scan cell of the STIL matches a flop of the netlist; scan loads are ignored.")
+        self.pi_nets, self.pi_positions = np.array(pi_nets, np.intp), np.array(pi_positions, np.intp)
+        self.load_fis, self.load_positions = np.array(load_fis, np.intp), np.array(load_positions, np.intp)
+        self.load_inverted = np.array(load_inverted, bool)
+        self.unload_fis, self.unload_positions = np.array(unload_fis, np.intp), np.array(unload_positions, np.intp)
+        self.block_patterns = max(1, -(-block_bits // WORD_BITS)) * WORD_BITS
+        self.num_patterns = len(store)
+
+    def __len__(self):
+        return -(-self.num_patterns // self.block_patterns)
+
+    def __iter__(self):
+        for start in range(0, self.num_patterns, self.block_patterns):
+            yield self.block(start)
+
+    def block(self, start):
+        # Decode the block of patterns from start and simulate its good machine
+        model = self.model
+        count = min(self.block_patterns, self.num_patterns - start)
+        n_words = -(-count // WORD_BITS)
+        mask = np.full(n_words, np.iinfo(np.uint64).max, np.uint64)
+        if count % WORD_BITS:
+            mask[-1] = np.uint64((1 << (count % WORD_BITS)) - 1)
+        values, cares = _transpose(self.store, start, count, n_words)
+
+        n_flops = len(model.flop_gate)
+        state = np.zeros((n_flops, n_words), np.uint64)
+        loads = values[self.load_positions]
+        loads[self.load_inverted] ^= mask
+        state[self.load_fis] = loads
+        flop_care = np.zeros((n_flops, n_words), np.uint64)
+        np.bitwise_or.at(flop_care, self.unload_fis, cares[self.unload_positions])
+        po_care = {}
+        for net, position in self.po_positions:
+            po_care[net] = po_care[net] | cares[position] if net in po_care else cares[position]
+
+        pi_words = values[self.pi_positions]
+        frame, next_state = model.good_frame(mask, self.pi_nets, pi_words, state)
+        launch = None
+        if self.transition:
+            launch, state = frame, next_state
+            frame, next_state = model.good_frame(mask, self.pi_nets, pi_words, state)
+        return Block(start, mask, count, launch, frame, state, next_state, po_care, flop_care)
+
+# Function to read the faults to simulate as rows of (fault type, pin,
+# class kept when not simulated, equivalent); every pin of the design when
+# no fault list is given
+def fault_rows(model, faults_file=None, fault_model="stuck"):
+    rows = []
+    if faults_file:
+        db = open_faults(faults_file)
+        for row in range(len(db)):
+            fault = db.fault(row)
+            rows.append((fault.model, fault.pin, fault.fault_class, fault.equivalent))
+    else:
+        for pin in model.fault_pins():
+            for fault_type in MODEL_TYPES[fault_model]:
+                rows.append((fault_type, pin, "ND", False))
+    return rows
+
+# Function to map the primary rows to Sites; equivalent faults share the
+# result of their primary. Returns the sites (None: not simulated) and the
+# number of rows each of them stands for.
+def fault_sites(model, rows):
+    sites = []
+    weights = []
+    for fault_type, pin, fault_class, equivalent in rows:
+        if not equivalent or not sites:
+            sites.append(None if fault_class == "UD" else model.fault_site(pin, fault_type))
+            weights.append(0)
+        weights[-1] += 1
+    return sites, weights
+
+# Function to split the simulated faults into jobs slices, sorted by root so
+# the faults of a root sit together in one slice
+def fault_slices(model, sites, jobs):
+    order = sorted((i for i, site in enumerate(sites) if site is not None),
+                   key=lambda i: model.root_order(sites[i]), reverse=True)
+    if jobs <= 1 or len(order) < 2 * jobs:
+        return [order]
+    size = -(-len(order) // jobs)
+    return [order[i:i + size] for i in range(0, len(order), size)]
+
+_STATE = None
+
+# Function to get the state run_slices hands to the slice functions (also
+# in the forked workers)
+def slice_state():
+    return _STATE
+
+# Function to simulate a slice of the faults over every block with dropping
+def _simulate_slice(indices):
+    model, blocks, sites = slice_state()
+    detected = []
+    remaining = list(indices)
+    for block in blocks:
+        reach = model.reach(block)
+        known = model.observe_roots(block, [sites[i] for i in remaining])
+        still = []
+        for i in remaining:
+            if model.detect(block, sites[i], reach, known).any():
+                detected.append(i)
+            else:
+                still.append(i)
+        remaining = still
+        if not remaining:
+            break
+    return detected
+
+# Function to collect the detecting patterns of every fault in a slice as
+# (fault, pattern) pairs; with n_detect a fault keeps its first n_detect
+# patterns and is dropped once it has them
+def _detection_slice(indices):
+    model, blocks, sites, n_detect = slice_state()
+    owners, lengths, patterns = [], [], []
+    found = np.zeros(len(indices), np.int64)
+    remaining = list(range(len(indices)))
+    for block in blocks:
+        reach = model.reach(block)
+        known = model.observe_roots(block, [sites[indices[j]] for j in remaining])
+        still = []
+        for j in remaining:
+            word = model.detect(block, sites[indices[j]], reach, known)
+            if not word.any():
+                still.append(j)
+                continue
+            bits = word_bits(word)
+            if n_detect:
+                bits = bits[:n_detect - found[j]]
+                found[j] += len(bits)
+                if found[j] < n_detect:
+                    still.append(j)
+            else:
+                still.append(j)
+            if len(bits):
+                owners.append(indices[j])
+                lengths.append(len(bits))
+                patterns.append(bits + block.start)
+        remaining = still
+        if not remaining:
+            break
+    if not patterns:
+        return np.zeros(0, np.uint32), np.zeros(0, np.uint32)
+    return np.repeat(np.array(owners, np.uint32), lengths), np.concatenate(patterns).astype(np.uint32)
+
+# Function to run a slice function over the fault slices, forking one
+# worker per slice. function(indices) reads the shared state (model,
+# blocks, sites, ...) through slice_state() and returns a picklable result.
+def run_slices(function, state, slices):
+    global _STATE
+    _STATE = state
+    try:
+        if len(slices) <= 1:
+            return [function(indices) for indices in slices]
+        with ProcessPoolExecutor(len(slices), mp_context=multiprocessing.get_context("fork")) as pool:
+            return list(pool.map(function, slices))
+    finally:
+        _STATE = None
+
+# Function to fault simulate a list of sites; returns a bytearray of flags
+def simulate(model, blocks, sites, jobs=1):
+    flags = bytearray(len(sites))
+    for detected in run_slices(_simulate_slice, (model, blocks, sites), fault_slices(model, sites, jobs)):
+        for i in detected:
+            flags[i] = 1
+    return flags
+
+# Function to list the faults every pattern detects, as CSR arrays: the
+# faults of pattern p are faults[start[p]:start[p + 1]], ascending. With
+# n_detect a fault is only listed for its first n_detect patterns, so the
+# lists hold at most faults x n_detect entries.
+def detection_lists(model, blocks, sites, n_detect=0, jobs=1):
+    parts = run_slices(_detection_slice, (model, blocks, sites, n_detect), fault_slices(model, sites, jobs))
+    faults = np.concatenate([part[0] for part in parts]) if parts else np.zeros(0, np.uint32)
+    patterns = np.concatenate([part[1] for part in parts]) if parts else np.zeros(0, np.uint32)
+    order = np.lexsort((faults, patterns))
+    start = np.zeros(blocks.num_patterns + 1, np.int64)
+    np.cumsum(np.bincount(patterns, minlength=blocks.num_patterns), out=start[1:])
+    return start, faults[order]
+
+# Function to write a summary in the report_summaries layout
+def write_summary(output, fault_model, counts, total, patterns):
+    detected = counts.get("DS", 0)
+    untestable = counts.get("UD", 0)
+    output.write(f" Uncollapsed {fault_model.capitalize()} Fault Summary Report\n")
+    output.write(" -----------------------------------------------\n")
+    output.write(" fault class                     code   #faults\n")
+    output.write(" ------------------------------  ----  ---------\n")
+    output.write(f" Detected                         DT  {detected:9d}\n")
+    output.write(f"   detected_by_simulation         DS  {'(' + str(detected) + ')':>9}\n")
+    output.write(f" Undetectable                     UD  {untestable:9d}\n")
+    output.write(f" ATPG untestable                  AU  {counts.get('AU', 0):9d}\n")
+    output.write(f" Not detected                     ND  {counts.get('ND', 0):9d}\n")
+    output.write(" -----------------------------------------------\n")
+    output.write(f" total faults                         {total:9d}\n")
+    testable = total - untestable
+    output.write(f" test coverage                           {100.0 * detected / testable if testable else 0:6.2f}%\n")
+    output.write(f" fault coverage                          {100.0 * detected / total if total else 0:6.2f}%\n")
+    output.write(" -----------------------------------------------\n")
+    output.write(f" #external patterns                   {patterns:9d}\n")
+
+# Main function
+def run_fault_sim(netlist_file, patterns_file, fault_model="stuck", faults_file=None, output_file=None,
+                  summary_file=None, jobs=1, block_bits=DEFAULT_BLOCK_BITS, top=None):
+    transition = fault_model == "transition"
+    model = CircuitModel(netlist_file, top)
+    if model.unknown_cells:
+        print(f"Warning: no function for {', '.join(sorted(model.unknown_cells))}; their outputs are tied to 0.")
+    store = open_patterns(patterns_file)
+    blocks = PatternBlocks(model, store, transition, block_bits)
+
+    rows = fault_rows(model, faults_file, fault_model)
+    sites, _ = fault_sites(model, rows)
+    print(f"{len(model.gate_path)} gates, {len(model.flop_gate)} flops, {len(store)} patterns, "
+          f"{len(sites)} faults to simulate ({sum(site is None for site in sites)} skipped)")
+    flags = simulate(model, blocks, sites, jobs)
+
+    counts = {}
+    codes = []
+    primary = -1
+    for index, (fault_type, pin, fault_class, equivalent) in enumerate(rows):
+        if not equivalent or primary < 0:
+            primary += 1
+        if flags[primary]:
+            code = "DS"
+        elif sites[primary] is None:
+            code = fault_class if fault_class in ("UD", "AU", "ND") else "ND"
+        else:
+            code = "AU" if fault_class == "AU" else "ND"
+        counts[code] = counts.get(code, 0) + 1
+        codes.append(code)
+
+    if output_file:
+        with open(output_file, "w") as f:
+            previous = None
+            for (fault_type, pin, _, equivalent), code in zip(rows, codes):
+                f.write(f"{fault_type} {'--' if equivalent and previous == code else code} {pin}\n")
+                previous = code
+    write_summary(sys.stdout, fault_model, counts, len(rows), len(store))
+    if summary_file:
+        with open(summary_file, "w") as f:
+            write_summary(f, fault_model, counts, len(rows), len(store))
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Bit-parallel stuck-at / transition fault simulation of STIL patterns.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--netlist', default=None, help='Scan inserted netlist (default: netlist_file)')
+    parser.add_argument('--patterns', default=None, help='STIL patterns (default: patterns_file)')
+    parser.add_argument('--fault_model', choices=sorted(MODEL_TYPES), default=None,
+                        help='Fault model (default: fault_model if stuck or transition, else stuck)')
+    parser.add_argument('--faults', default=None, help='Fault list to simulate (default: every pin of the netlist)')
+    parser.add_argument('--output', default=None, help='Write the classified fault list here')
+    parser.add_argument('--summary', default=None, help='Write a report_summaries style summary here')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Worker processes (default: all cores)')
+    parser.add_argument('--block', type=int, default=DEFAULT_BLOCK_BITS,
+                        help=f'Patterns per block, rounded up to 64 (default: {DEFAULT_BLOCK_BITS})')
+    args = parser.parse_args()
+
+    config = parse_config(args.config)
+    fault_model = args.fault_model or (config.fault_model if config.fault_model in MODEL_TYPES else "stuck")
+    run_fault_sim(args.netlist or config.netlist_file, args.patterns or config.patterns_file, fault_model,
+                  args.faults, args.output, args.summary, args.jobs, args.block, config.top_module)
@@ -0,0 +1,133 @@
+import os
+import copy
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from config_parser import Config, parse_config
+from dft import DFTScriptGenerator
+from atpg import ATPG_GENERATORS, BaseATPGScriptGenerator
+from faultsim import FAULT_SIM_GENERATORS
+from stage_cache import StageCache, DEFAULT_CACHE_DIR, run_cached
+from metrics_store import DEFAULT_METRICS_DB, record_summary
+from tool_runner import run_tool
+
+# Multi fault model campaign.
+# Scan insertion runs once, then ATPG (and fault simulation where the model
+# supports it) for every fault model runs in its own working directory on a
+# process pool. The pool size is the number of tmax licenses/slots we may use.
+
+TMAX = "tmax -shell -tcl"
+DCSHELL = "dc_shell -f"
+
+DEFAULT_MODELS = ["stuck", "transition", "bridging", "iddq"]
+
+# Inputs shared by every job; made absolute since jobs run in other directories
+INPUT_FIELDS = ["netlist_file", "tech_library", "db_library", "synthesized_files", "spf_file", "spef_file"]
+# Outputs written per job; renamed into the job directory
+OUTPUT_FIELDS = ["faults_file", "summary_file", "patterns_file"]
+
+# Function to derive the config of one fault model job.
+# s15850.fault becomes <job_dir>/s15850_stuck.fault and so on; tag replaces
+# the model name in the output names when given.
+def job_config(config: Config, model: str, job_dir: str, base_dir: str, tag: str = None) -> Config:
+    tag = tag or model
+    job = copy.copy(config)
+    job.fault_model = model
+    for field in INPUT_FIELDS:
+        path = getattr(job, field)
+        if path:
+            setattr(job, field, os.path.normpath(os.path.join(base_dir, path)))
+    for field in OUTPUT_FIELDS:
+        name = os.path.basename(getattr(job, field))
+        if config.top_module in name:
+            name = name.replace(config.top_module, f"{config.top_module}_{tag}", 1)
+        else:
+            name = f"{tag}_{name}"
+        setattr(job, field, os.path.join(job_dir, name))
+    return job
+
+# Function to run scan insertion once for the whole campaign
+def run_dft(config: Config, base_dir: str, work_dir: str, cache: StageCache, force=False) -> int:
+    tcl_file = os.path.join(work_dir, "dft_dc.tcl")
+    DFTScriptGenerator(config).generate_tcl(tcl_file)
+    print(f"Scan Insertion: Running {tcl_file} with dc_shell...")
+    return run_cached(cache, "dft", tcl_file, config,
+                      lambda: run_tool(f"{DCSHELL} {tcl_file}", os.path.join(work_dir, "dft_dc.log"), base_dir),
+                      force=force, cwd=base_dir)
+
+# Function to run the ATPG stage of one fault model job in its directory
+def run_atpg(config: Config, model: str, job_dir: str, cache: StageCache, force=False) -> int:
+    generator = ATPG_GENERATORS.get(model, BaseATPGScriptGenerator)(copy.copy(config))
+    generator.generate_tcl("atpg.tcl")
+    return run_cached(cache, "atpg", "atpg.tcl", config,
+                      lambda: run_tool(f"{TMAX} atpg.tcl", "atpg.log", job_dir),
+                      force=force, cwd=job_dir)
+
+# Function to run the fault simulation stage of one fault model job
+def run_faultsim(config: Config, model: str, job_dir: str, cache: StageCache, force=False) -> int:
+    generator = FAULT_SIM_GENERATORS[model](copy.copy(config))
+    generator.generate_tcl("faultsim.tcl")
+    return run_cached(cache, "faultsim", "faultsim.tcl", config,
+                      lambda: run_tool(f"{TMAX} faultsim.tcl", "faultsim.log", job_dir),
+                      force=force, cwd=job_dir)
+
+# Function to run ATPG and fault simulation of one fault model.
+# Runs in a pool worker; generators that shell out (bridging sites, PT
+# paths) write into the current directory, so the worker moves into the job
+# directory first.
+def run_job(config: Config, model: str, job_dir: str, cache: StageCache, force=False):
+    os.makedirs(job_dir, exist_ok=True)
+    os.chdir(job_dir)
+    result = {"model": model, "job_dir": job_dir, "atpg": None, "faultsim": None}
+    result["atpg"] = run_atpg(config, model, job_dir, cache, force)
+    if result["atpg"] == 0 and model in FAULT_SIM_GENERATORS:
+        result["faultsim"] = run_faultsim(config, model, job_dir, cache, force)
+    return result
+
+# Main function
+def run_campaign(config_file, models=None, slots=4, work_dir="campaign", base_dir=".", skip_dft=False,
+                 cache_dir=DEFAULT_CACHE_DIR, force=False, metrics_db=DEFAULT_METRICS_DB):
+    config = parse_config(config_file)
+    models = models or DEFAULT_MODELS
+    base_dir = os.path.abspath(base_dir)
+    work_dir = os.path.abspath(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    cache = StageCache(os.path.abspath(cache_dir))
+
+    if not skip_dft and run_dft(config, base_dir, work_dir, cache, force) != 0:
+        print("Error: scan insertion failed, see dft_dc.log.")
+        return []
+
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, min(slots, len(models)))) as pool:
+        futures = {}
+        for model in models:
+            job_dir = os.path.join(work_dir, model)
+            job = job_config(config, model, job_dir, base_dir)
+            futures[pool.submit(run_job, job, model, job_dir, cache, force)] = job
+        for future in as_completed(futures):
+            result = future.result()
+            status = "ok" if result["atpg"] == 0 and result["faultsim"] in (None, 0) else "FAILED"
+            print(f"{result['model']}: {status} (atpg={result['atpg']}, faultsim={result['faultsim']}) in {result['job_dir']}")
+            if metrics_db:
+                for stage in ("atpg", "faultsim"):
+                    if result[stage] == 0:
+                        record_summary(futures[future], stage, metrics_db, result["job_dir"])
+            results.append(result)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run DFT once, then ATPG and fault simulation for several fault models in parallel.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--models', nargs='+', default=DEFAULT_MODELS, choices=sorted(ATPG_GENERATORS), help='Fault models to run')
+    parser.add_argument('--slots', type=int, default=4, help='Maximum number of concurrent tmax jobs / licenses (default: 4)')
+    parser.add_argument('--work_dir', default='campaign', help='Directory holding one sub-directory per job (default: campaign)')
+    parser.add_argument('--base_dir', default='.', help='Directory the relative paths in config.txt refer to (default: .)')
+    parser.add_argument('--skip_dft', action='store_true', help='Reuse the existing scan inserted netlist')
+    parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help=f'Stage cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--force', action='store_true', help='Run every stage even if its outputs are cached')
+    parser.add_argument('--metrics_db', default=DEFAULT_METRICS_DB, help=f'Metrics database the summaries are appended to (default: {DEFAULT_METRICS_DB})')
+    args = parser.parse_args()
+    results = run_campaign(args.config, args.models, args.slots, args.work_dir, args.base_dir, args.skip_dft,
+                           args.cache_dir, args.force, args.metrics_db)
+    if not results or any(r["atpg"] != 0 or r["faultsim"] not in (None, 0) for r in results):
+        raise SystemExit(1)
@@ -0,0 +1,207 @@
+import re
+import operator
+from collections import namedtuple
+
+# Logic functions of the tsmc13_neg.v standard cells (CBDK IC Contest) and
+# the Verilog gate primitives, for the Python side simulators and netlist
+# tools. Expressions are written with the bitwise operators ~ & ^ | and
+# compiled into operator.and_ / or_ / xor / invert calls, so one call
+# evaluates a whole word of patterns; they are masked to the word width
+# afterwards.
+# Sequential cells expose their state as IQ; next_state is what a capture
+# clock loads into IQ. Drive strength suffixes (X1, X2, XL, ...) are
+# stripped before the lookup, so AOI21X1 and AOI21XL share AOI21.
+
+# inputs: data pins in order; outputs: {pin: expression}
+# next_state: expression loaded on the clock (None for combinational cells)
+# clocks: clock pins, which carry no data
+Cell = namedtuple("Cell", ["inputs", "outputs", "next_state", "clocks"])
+
+_DRIVE_RE = re.compile(r"^(.+?)(X\d+|XL)$")
+
+def _comb(inputs, **outputs):
+    return Cell(tuple(inputs.split()), outputs, None, ())
+
+def _flop(inputs, next_state, clocks="CK", outputs=None):
+    return Cell(tuple(inputs.split()), outputs or {"Q": "IQ", "QN": "~IQ"}, next_state, tuple(clocks.split()))
+
+_SCAN = "(SE & SI) | (~SE & {d})"
+
+CELLS = {
+    "BUF": _comb("A", Y="A"), "CLKBUF": _comb("A", Y="A"),
+    "DLY1": _comb("A", Y="A"), "DLY2": _comb("A", Y="A"), "DLY3": _comb("A", Y="A"), "DLY4": _comb("A", Y="A"),
+    "INV": _comb("A", Y="~A"), "CLKINV": _comb("A", Y="~A"),
+    "TIEHI": _comb("", Y="M"), "TIELO": _comb("", Y="0"),
+    # tri-state buffers are simulated as always enabled
+    "TBUF": _comb("A OE", Y="A"), "TBUFI": _comb("A OE", Y="~A"),
+    "AND2": _comb("A B", Y="A & B"), "AND3": _comb("A B C", Y="A & B & C"),
+    "AND4": _comb("A B C D", Y="A & B & C & D"),
+    "OR2": _comb("A B", Y="A | B"), "OR3": _comb("A B C", Y="A | B | C"),
+    "OR4": _comb("A B C D", Y="A | B | C | D"),
+    "NAND2": _comb("A B", Y="~(A & B)"), "NAND3": _comb("A B C", Y="~(A & B & C)"),
+    "NAND4": _comb("A B C D", Y="~(A & B & C & D)"),
+    "NAND2B": _comb("AN B", Y="~(~AN & B)"), "NAND3B": _comb("AN B C", Y="~(~AN & B & C)"),
+    "NAND4B": _comb("AN B C D", Y="~(~AN & B & C & D)"), "NAND4BB": _comb("AN BN C D", Y="~(~AN & ~BN & C & D)"),
+    "NOR2": _comb("A B", Y="~(A | B)"), "NOR3": _comb("A B C", Y="~(A | B | C)"),
+    "NOR4": _comb("A B C D", Y="~(A | B | C | D)"),
+    "NOR2B": _comb("AN B", Y="~(~AN | B)"), "NOR3B": _comb("AN B C", Y="~(~AN | B | C)"),
+    "NOR4B": _comb("AN B C D", Y="~(~AN | B | C | D)"), "NOR4BB": _comb("AN BN C D", Y="~(~AN | ~BN | C | D)"),
+    "XOR2": _comb("A B", Y="A ^ B"), "XOR3": _comb("A B C", Y="A ^ B ^ C"),
+    "XNOR2": _comb("A B", Y="~(A ^ B)"), "XNOR3": _comb("A B C", Y="~(A ^ B ^ C)"),
+    "AO21": _comb("A0 A1 B0", Y="(A0 & A1) | B0"),
+    "AO22": _comb("A0 A1 B0 B1", Y="(A0 & A1) | (B0 & B1)"),
+    "AOI21": _comb("A0 A1 B0", Y="~((A0 & A1) | B0)"),
+    "AOI211": _comb("A0 A1 B0 C0", Y="~((A0 & A1) | B0 | C0)"),
+    "AOI22": _comb("A0 A1 B0 B1", Y="~((A0 & A1) | (B0 & B1))"),
+    "AOI221": _comb("A0 A1 B0 B1 C0", Y="~((A0 & A1) | (B0 & B1) | C0)"),
+    "AOI222": _comb("A0 A1 B0 B1 C0 C1", Y="~((A0 & A1) | (B0 & B1) | (C0 & C1))"),
+    "AOI2BB1": _comb("A0N A1N B0", Y="~((~A0N & ~A1N) | B0)"),
+    "AOI2BB2": _comb("A0N A1N B0 B1", Y="~((~A0N & ~A1N) | (B0 & B1))"),
+    "AOI31": _comb("A0 A1 A2 B0", Y="~((A0 & A1 & A2) | B0)"),
+    "AOI32": _comb("A0 A1 A2 B0 B1", Y="~((A0 & A1 & A2) | (B0 & B1))"),
+    "AOI33": _comb("A0 A1 A2 B0 B1 B2", Y="~((A0 & A1 & A2) | (B0 & B1 & B2))"),
+    "OA21": _comb("A0 A1 B0", Y="(A0 | A1) & B0"),
+    "OA22": _comb("A0 A1 B0 B1", Y="(A0 | A1) & (B0 | B1)"),
+    "OAI21": _comb("A0 A1 B0", Y="~((A0 | A1) & B0)"),
+    "OAI211": _comb("A0 A1 B0 C0", Y="~((A0 | A1) & B0 & C0)"),
+    "OAI22": _comb("A0 A1 B0 B1", Y="~((A0 | A1) & (B0 | B1))"),
+    "OAI221": _comb("A0 A1 B0 B1 C0", Y="~((A0 | A1) & (B0 | B1) & C0)"),
+    "OAI222": _comb("A0 A1 B0 B1 C0 C1", Y="~((A0 | A1) & (B0 | B1) & (C0 | C1))"),
+    "OAI2BB1": _comb("A0N A1N B0", Y="~((~A0N | ~A1N) & B0)"),
+    "OAI2BB2": _comb("A0N A1N B0 B1", Y="~((~A0N | ~A1N) & (B0 | B1))"),
+    "OAI31": _comb("A0 A1 A2 B0", Y="~((A0 | A1 | A2) & B0)"),
+    "OAI32": _comb("A0 A1 A2 B0 B1", Y="~((A0 | A1 | A2) & (B0 | B1))"),
+    "OAI33": _comb("A0 A1 A2 B0 B1 B2", Y="~((A0 | A1 | A2) & (B0 | B1 | B2))"),
+    "MX2": _comb("A B S0", Y="(A & ~S0) | (B & S0)"),
+    "MXI2": _comb("A B S0", Y="~((A & ~S0) | (B & S0))"),
+    "MX4": _comb("A B C D S0 S1", Y="(((A & ~S0) | (B & S0)) & ~S1) | (((C & ~S0) | (D & S0)) & S1)"),
+    "MXI4": _comb("A B C D S0 S1", Y="~((((A & ~S0) | (B & S0)) & ~S1) | (((C & ~S0) | (D & S0)) & S1))"),
+    "ADDH": _comb("A B", S="A ^ B", CO="A & B"),
+    "ADDF": _comb("A B CI", S="A ^ B ^ CI", CO="(A & B) | (A & CI) | (B & CI)"),
+    "ADDFH": _comb("A B CI", S="A ^ B ^ CI", CO="(A & B) | (A & CI) | (B & CI)"),
+    # latches are simulated as transparent
+    "TLAT": _comb("D G", Q="D", QN="~D"), "TLATN": _comb("D GN", Q="D", QN="~D"),
+    "TLATSR": _comb("D G RN SN", Q="(D | ~SN) & RN", QN="~((D | ~SN) & RN)"),
+    "TLATNSR": _comb("D GN RN SN", Q="(D | ~SN) & RN", QN="~((D | ~SN) & RN)"),
+    "DFF": _flop("D", "D"), "DFFHQ": _flop("D", "D", outputs={"Q": "IQ"}),
+    "DFFR": _flop("D RN", "D & RN"), "DFFRHQ": _flop("D RN", "D & RN", outputs={"Q": "IQ"}),
+    "DFFS": _flop("D SN", "D | ~SN"), "DFFSHQ": _flop("D SN", "D | ~SN", outputs={"Q": "IQ"}),
+    "DFFSR": _flop("D RN SN", "(D | ~SN) & RN"),
+    "DFFTR": _flop("D RN", "D & RN"),
+    "DFFN": _flop("D", "D", "CKN"), "DFFNR": _flop("D RN", "D & RN", "CKN"),
+    "DFFNS": _flop("D SN", "D | ~SN", "CKN"), "DFFNSR": _flop("D RN SN", "(D | ~SN) & RN", "CKN"),
+    "EDFF": _flop("D E", "(E & D) | (~E & IQ)"),
+    "EDFFTR": _flop("D E RN", "((E & D) | (~E & IQ)) & RN"),
+    "SDFF": _flop("D SI SE", _SCAN.format(d="D")),
+    "SDFFHQ": _flop("D SI SE", _SCAN.format(d="D"), outputs={"Q": "IQ"}),
+    "SDFFR": _flop("D SI SE RN", f"({_SCAN.format(d='D')}) & RN"),
+    "SDFFRHQ": _flop("D SI SE RN", f"({_SCAN.format(d='D')}) & RN", outputs={"Q": "IQ"}),
+    "SDFFS": _flop("D SI SE SN", f"({_SCAN.format(d='D')}) | ~SN"),
+    "SDFFSHQ": _flop("D SI SE SN", f"({_SCAN.format(d='D')}) | ~SN", outputs={"Q": "IQ"}),
+    "SDFFSR": _flop("D SI SE RN SN", f"(({_SCAN.format(d='D')}) | ~SN) & RN"),
+    "SDFFTR": _flop("D SI SE RN", _SCAN.format(d="(D & RN)")),
+    "SDFFN": _flop("D SI SE", _SCAN.format(d="D"), "CKN"),
+    "SDFFNR": _flop("D SI SE RN", f"({_SCAN.format(d='D')}) & RN", "CKN"),
+    "SDFFNS": _flop("D SI SE SN", f"({_SCAN.format(d='D')}) | ~SN", "CKN"),
+    "SDFFNSR": _flop("D SI SE RN SN", f"(({_SCAN.format(d='D')}) | ~SN) & RN", "CKN"),
+    "EDFFHQ": _flop("D E", "(E & D) | (~E & IQ)", outputs={"Q": "IQ"}),
+    "SEDFF": _flop("D E SI SE", _SCAN.format(d="((E & D) | (~E & IQ))")),
+    "SEDFFHQ": _flop("D E SI SE", _SCAN.format(d="((E & D) | (~E & IQ))"), outputs={"Q": "IQ"}),
+    "SEDFFTR": _flop("D E SI SE RN", _SCAN.format(d="(((E & D) | (~E & IQ)) & RN)")),
+}
+
+# Verilog gate primitives: positional pins, output first
+PRIMITIVES = {
+    "and": "&", "or": "|", "xor": "^", "nand": "&", "nor": "|", "xnor": "^", "buf": None, "not": None,
+}
+
+# Function to strip the drive strength suffix of a cell name
+def base_name(cell):
+    match = _DRIVE_RE.match(cell)
+    return match.group(1) if match and match.group(1) in CELLS else cell
+
+# Function to look up a cell, or a primitive with n_inputs inputs.
+# Returns None for cells that are not in the table.
+def lookup(cell, n_inputs=None):
+    if cell in PRIMITIVES:
+        names = [f"I{i}" for i in range(n_inputs or 1)]
+        if cell in ("buf", "not"):
+            expression = "I0"
+        else:
+            expression = f" {PRIMITIVES[cell]} ".join(names)
+        if cell in ("nand", "nor", "xnor", "not"):
+            expression = f"~({expression})"
+        return Cell(tuple(names), {"Y": expression}, None, ())
+    return CELLS.get(base_name(cell))
+
+# Binary operators of the expressions, loosest binding first (as in Python)
+_BINARY = [("|", operator.or_), ("^", operator.xor), ("&", operator.and_)]
+_TOKEN_RE = re.compile(r"\s*(?:(\w+)|(\S))")
+
+_compiled = {}
+
+# Function to split an expression into names and operator characters
+def _tokens(expression):
+    tokens = []
+    for name, symbol in _TOKEN_RE.findall(expression):
+        tokens.append(name or symbol)
+    return tokens
+
+# Function to build the evaluator of tokens[pos:] at the given operator
+# level; returns (evaluator, next position). An evaluator takes the tuple of
+# call arguments (pin values, then M).
+def _parse(tokens, pos, args, level=0):
+    if level == len(_BINARY):
+        return _parse_unary(tokens, pos, args)
+    symbol, function = _BINARY[level]
+    operands = []
+    while True:
+        operand, pos = _parse(tokens, pos, args, level + 1)
+        operands.append(operand)
+        if pos >= len(tokens) or tokens[pos] != symbol:
+            break
+        pos += 1
+    if len(operands) == 1:
+        return operands[0], pos
+    first, rest = operands[0], operands[1:]
+    def evaluate(values):
+        result = first(values)
+        for operand in rest:
+            result = function(result, operand(values))
+        return result
+    return evaluate, pos
+
+def _parse_unary(tokens, pos, args):
+    if pos >= len(tokens):
+        raise ValueError("unexpected end of expression")
+    token = tokens[pos]
+    if token == "~":
+        operand, pos = _parse_unary(tokens, pos + 1, args)
+        return (lambda values: operator.invert(operand(values))), pos
+    if token == "(":
+        inner, pos = _parse(tokens, pos + 1, args)
+        if pos >= len(tokens) or tokens[pos] != ")":
+            raise ValueError("unbalanced parentheses")
+        return inner, pos + 1
+    if token.isdigit():
+        constant = int(token)
+        return (lambda values: constant), pos + 1
+    if token not in args:
+        raise ValueError(f"unknown pin {token}")
+    return operator.itemgetter(args.index(token)), pos + 1
+
+# Function to compile an expression over the given pins into a function
+# f(*values, M) that returns the result masked to M. The expression is
+# parsed once into nested operator calls, no code is generated.
+def compile_expression(pins, expression):
+    key = (tuple(pins), expression)
+    function = _compiled.get(key)
+    if function is None:
+        tokens = _tokens(expression)
+        evaluate, pos = _parse(tokens, 0, list(pins) + ["M"])
+        if pos != len(tokens):
+            raise ValueError(f"unexpected {tokens[pos]!r} in {expression!r}")
+        def function(*values):
+            return evaluate(values) & values[-1]
+        _compiled[key] = function
+    return function
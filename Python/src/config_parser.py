@@ -30,6 +30,8 @@ from typing import Optional
 # pattern_specification = full
 # fault_collapsing = true
 # fault_coverage = 100
+# # start stuck/transition ATPG from a structurally collapsed fault list
+# structural_collapsing = false
 
 # [STUCK_FAULT_OPTIONS]
 # N_detect = 1
@@ -48,15 +50,32 @@ from typing import Optional
 
 # [BRIDGING_FAULT_OPTIONS]
 # bridging_optimize_bridge_strengths = true
+# # bridging site source: <random | spef>
+# bridging_site_source = random
+# bridging_num_pairs = 1000
 
 # [PATH_DELAY_FAULT_OPTIONS]
 # path_delay_slack = 0.15
 # path_delay_max_paths = 200
+# # concurrent pt_shell jobs and how paths are split over them: <endpoint | group>
+# path_delay_jobs = 4
+# path_delay_partition = endpoint
 
 # [ATPG_GENERAL_OPTIONS]
 # auto_compression = true
 # # optional: remove p% faults
 # # remove_fault = 50
+# # statistical fault sampling: stuck / transition ATPG and fault simulation
+# # on a stratified random sample sized for +-sample_precision % test coverage
+# # at sample_confidence (see fault_sample.py)
+# fault_sampling = false
+# sample_precision = 0.5
+# sample_confidence = 0.95
+# sample_seed = 1
+# # stop ATPG once test coverage grows slower than plateau_slope % per CPU
+# # minute, measured over the last plateau_window CPU seconds (0: never)
+# plateau_slope = 0
+# plateau_window = 120
 
 # [SIMULATION_OPTION]
 # simulation_sequential = true
@@ -97,6 +116,17 @@ class Config:
                  bridging_optimize_bridge_strengths: bool = True,
                  path_delay_max_paths: int = 200,
                  fault_coverage: int = 100,
+                 bridging_site_source: str = "random",
+                 bridging_num_pairs: int = 1000,
+                 path_delay_jobs: int = 4,
+                 path_delay_partition: str = "endpoint",
+                 structural_collapsing: bool = False,
+                 plateau_slope: float = 0.0,
+                 plateau_window: float = 120.0,
+                 fault_sampling: bool = False,
+                 sample_precision: float = 0.5,
+                 sample_confidence: float = 0.95,
+                 sample_seed: int = 1,
                  ):
         # error detect
         if not all([top_module, netlist_file, tech_library, db_library, synthesized_files, spf_file, faults_file, summary_file, patterns_file]):
@@ -134,6 +164,17 @@ class Config:
         self.bridging_optimize_bridge_strengths = bridging_optimize_bridge_strengths
         self.path_delay_max_paths = path_delay_max_paths
         self.fault_coverage = fault_coverage
+        self.bridging_site_source = bridging_site_source
+        self.bridging_num_pairs = bridging_num_pairs
+        self.path_delay_jobs = path_delay_jobs
+        self.path_delay_partition = path_delay_partition
+        self.structural_collapsing = structural_collapsing
+        self.plateau_slope = plateau_slope
+        self.plateau_window = plateau_window
+        self.fault_sampling = fault_sampling
+        self.sample_precision = sample_precision
+        self.sample_confidence = sample_confidence
+        self.sample_seed = sample_seed
 
     def __repr__(self):
         return (f"ATPGConfig(top_module={self.top_module}, netlist_file={self.netlist_file}, tech_library={self.tech_library}, "
@@ -150,7 +191,13 @@ class Config:
                 f"iddq_float={self.iddq_float}, iddq_strong={self.iddq_strong}, "
                 f"iddq_interval_size={self.iddq_interval_size}, n_detect={self.n_detect}, "
                 f"path_delay_slack={self.path_delay_slack}, bridging_optimize_bridge_strengths={self.bridging_optimize_bridge_strengths}, "
-                f"path_delay_max_paths={self.path_delay_max_paths}, fault_coverage={self.fault_coverage})")
+                f"path_delay_max_paths={self.path_delay_max_paths}, fault_coverage={self.fault_coverage}, "
+                f"bridging_site_source={self.bridging_site_source}, bridging_num_pairs={self.bridging_num_pairs}, "
+                f"path_delay_jobs={self.path_delay_jobs}, path_delay_partition={self.path_delay_partition}, "
+                f"structural_collapsing={self.structural_collapsing}, plateau_slope={self.plateau_slope}, "
+                f"plateau_window={self.plateau_window}, fault_sampling={self.fault_sampling}, "
+                f"sample_precision={self.sample_precision}, sample_confidence={self.sample_confidence}, "
+                f"sample_seed={self.sample_seed})")
 
 def parse_config(file_path: str) -> Config:
     config = configparser.ConfigParser()
@@ -203,6 +250,7 @@ def parse_config(file_path: str) -> Config:
         pattern_specification=pattern_section.get("pattern_specification", "full"),
         fault_collapsing=parse_bool(pattern_section.get("fault_collapsing", "true")),
         fault_coverage=pattern_section.getint("fault_coverage", 100),
+        structural_collapsing=parse_bool(pattern_section.get("structural_collapsing", "false")),
 
         # TRANSITION_FAULT_OPTIONS section
         launch_cycle=transition_section.get("launch_cycle", "any"),
@@ -212,6 +260,12 @@ def parse_config(file_path: str) -> Config:
         # ATPG_GENERAL_OPTIONS section
         auto_compression=parse_bool(general_section.get("auto_compression", "true")),
         remove_fault=parse_optional_int(general_section.get("remove_fault", "0")),
+        plateau_slope=float(general_section.get("plateau_slope", "0")),
+        plateau_window=float(general_section.get("plateau_window", "120")),
+        fault_sampling=parse_bool(general_section.get("fault_sampling", "false")),
+        sample_precision=float(general_section.get("sample_precision", "0.5")),
+        sample_confidence=float(general_section.get("sample_confidence", "0.95")),
+        sample_seed=general_section.getint("sample_seed", 1),
 
         # SIMULATION_OPTION section
         simulation_sequential=parse_bool(simulation_section.get("simulation_sequential", "false")),
@@ -230,9 +284,13 @@ def parse_config(file_path: str) -> Config:
         # PATH_DELAY_FAULT_OPTIONS section
         path_delay_slack=float(path_delay_section.get("path_delay_slack", "0.15")),
         path_delay_max_paths=path_delay_section.getint("path_delay_max_paths", 200),
+        path_delay_jobs=path_delay_section.getint("path_delay_jobs", 4),
+        path_delay_partition=path_delay_section.get("path_delay_partition", "endpoint"),
 
         # BRIDGING_FAULT_OPTIONS section
-        bridging_optimize_bridge_strengths=parse_bool(bridging_section.get("bridging_optimize_bridge_strengths", "true"))
+        bridging_optimize_bridge_strengths=parse_bool(bridging_section.get("bridging_optimize_bridge_strengths", "true")),
+        bridging_site_source=bridging_section.get("bridging_site_source", "random"),
+        bridging_num_pairs=bridging_section.getint("bridging_num_pairs", 1000),
     )
 
 def main():
@@ -0,0 +1,280 @@
+import os
+import copy
+import csv
+import json
+import math
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from config_parser import Config, parse_config
+from dft import DFTScriptGenerator
+from atpg import ATPG_GENERATORS, BaseATPGScriptGenerator
+from campaign import job_config, OUTPUT_FIELDS, TMAX, DCSHELL
+from stage_cache import StageCache, DEFAULT_CACHE_DIR, STAGE_FIELDS, run_cached
+from metrics_store import DEFAULT_METRICS_DB, record_summary
+from summary_parser import parse_summary
+from tool_runner import run_tool
+
+# Design space sweep over config.txt parameters.
+# Every combination of the swept values (--param num_scan_chain=4,8,16
+# --param n_detect=1:3) is one point. Points sharing the scan insertion
+# fields (num_scan_chain, scan_style) share one dc_shell run; ATPG of the
+# points runs on a process pool, one working directory per point and rung.
+#
+# Successive halving prunes the space before the full runs: rung r caps
+# ATPG at min_patterns * eta^r patterns (set_atpg -patterns), the points are
+# sorted into Pareto layers of pattern count, test coverage and runtime
+# within the cap, and whole layers, best first, go on to the next rung until
+# at least 1/eta of the points do, so no point of the current front is
+# pruned for trading coverage against patterns or runtime.
+# The last rung runs without a cap. The Pareto front of the full runs
+# (fewest patterns, highest test coverage, least runtime) is printed and
+# written with every rung result to <work_dir>/sweep.json and sweep.csv.
+
+DFT_FIELDS = STAGE_FIELDS["dft"]
+
+# Function to convert one swept value to the type of the config attribute
+def _typed(name, text, current):
+    if isinstance(current, bool):
+        if text.lower() not in ("true", "false"):
+            raise ValueError(f"{name} takes true or false, not {text}")
+        return text.lower() == "true"
+    if isinstance(current, int):
+        return int(text)
+    if isinstance(current, float):
+        return float(text)
+    if current is None:
+        try:
+            return int(text)
+        except ValueError:
+            return text
+    return text
+
+# Function to parse a --param option: name=v1,v2,... or name=first:last[:step]
+def parse_param(option: str, config: Config):
+    name, sep, values = option.partition("=")
+    name = name.strip()
+    if not sep or not values:
+        raise ValueError(f"Expected name=values, got: {option}")
+    if name == "N_detect":
+        name = "n_detect"
+    if not hasattr(config, name):
+        raise ValueError(f"Unknown config parameter: {name}")
+    current = getattr(config, name)
+    if ":" in values:
+        bounds = [int(v) for v in values.split(":")]
+        first, last, step = (bounds + [1])[:3]
+        return name, list(range(first, last + 1, step))
+    return name, [_typed(name, v.strip(), current) for v in values.split(",") if v.strip()]
+
+# Function to expand the swept values into points (dicts of parameter values)
+def sweep_points(params):
+    names = [name for name, _ in params]
+    return [dict(zip(names, values)) for values in itertools.product(*(values for _, values in params))]
+
+def point_label(values):
+    return ",".join(f"{name}={value}" for name, value in values.items())
+
+# Function to run scan insertion for one group of points
+def run_group_dft(config: Config, group_dir: str, cache: StageCache, force=False) -> int:
+    os.makedirs(os.path.join(group_dir, "Netlist"), exist_ok=True)
+    tcl_file = os.path.join(group_dir, "dft_dc.tcl")
+    DFTScriptGenerator(config).generate_tcl(tcl_file)
+    return run_cached(cache, "dft", tcl_file, config,
+                      lambda: run_tool(f"{DCSHELL} {tcl_file}", os.path.join(group_dir, "dft_dc.log"), group_dir),
+                      force=force, cwd=group_dir)
+
+# Function to point the output files of a point's config into a rung directory
+def rung_config(config: Config, run_dir: str) -> Config:
+    config = copy.copy(config)
+    for field in OUTPUT_FIELDS:
+        setattr(config, field, os.path.join(run_dir, os.path.basename(getattr(config, field))))
+    return config
+
+# Function to run ATPG of one point within a pattern budget (None: no cap).
+# Runs in a pool worker; returns the parsed summary with the run time.
+def run_point(config: Config, run_dir: str, budget, cache: StageCache, force=False):
+    os.makedirs(run_dir, exist_ok=True)
+    os.chdir(run_dir)
+    config = rung_config(config, run_dir)
+    generator = ATPG_GENERATORS.get(config.fault_model, BaseATPGScriptGenerator)(copy.copy(config))
+    generator.max_patterns = budget
+    generator.generate_tcl("atpg.tcl")
+    start = time.monotonic()
+    returncode = run_cached(cache, "atpg", "atpg.tcl", config,
+                            lambda: run_tool(f"{TMAX} atpg.tcl", "atpg.log", run_dir),
+                            force=force, cwd=run_dir)
+    result = {"run_dir": run_dir, "budget": budget, "returncode": returncode,
+              "wall_time": time.monotonic() - start, "test_coverage": None, "fault_coverage": None,
+              "patterns": None, "cpu_time": None}
+    summary_file = generator.config.summary_file
+    if returncode == 0 and os.path.isfile(summary_file):
+        report = parse_summary(summary_file)
+        if report is not None:
+            for field in ("test_coverage", "fault_coverage", "patterns", "cpu_time"):
+                result[field] = getattr(report, field)
+    return result
+
+def runtime(result):
+    # the CPU time tmax reports survives a stage cache hit, the wall time does not
+    return result["cpu_time"] if result["cpu_time"] is not None else result["wall_time"]
+
+# Function to rank rung results: highest coverage, then fewest patterns,
+# then least runtime
+def rank_key(result):
+    return (-(result["test_coverage"] or 0.0), result["patterns"] or 0, runtime(result))
+
+# Function to sort results into Pareto layers (non-dominated sorting):
+# layer 0 is the front, layer k the front once layers 0..k-1 are removed.
+# Returns lists of indices into results, each ordered by rank_key.
+def pareto_layers(results):
+    objectives = [(r["patterns"] or 0, -(r["test_coverage"] or 0.0), runtime(r)) for r in results]
+    remaining = list(range(len(results)))
+    layers = []
+    while remaining:
+        layer = [i for i in remaining
+                 if not any(all(x <= y for x, y in zip(objectives[j], objectives[i]))
+                            and objectives[j] != objectives[i] for j in remaining if j != i)]
+        layers.append(sorted(layer, key=lambda i: rank_key(results[i])))
+        remaining = [i for i in remaining if i not in layer]
+    return layers
+
+# Function to find the points no other point beats on every objective
+def pareto_front(results):
+    layers = pareto_layers(results)
+    return [results[i] for i in layers[0]] if layers else []
+
+# Function to print the final results, Pareto points marked with *
+def print_results(points, front):
+    print(f"\n  {'point':<40} {'patterns':>8} {'TC%':>7} {'FC%':>7} {'runtime s':>10}")
+    for point in sorted(points, key=lambda p: rank_key(p["final"])):
+        result = point["final"]
+        mark = "*" if point in front else " "
+        print(f"{mark} {point['label']:<40} {result['patterns'] if result['patterns'] is not None else '-':>8} "
+              f"{result['test_coverage'] if result['test_coverage'] is not None else '-':>7} "
+              f"{result['fault_coverage'] if result['fault_coverage'] is not None else '-':>7} "
+              f"{runtime(result):>10.2f}")
+
+# Function to write every point with its rung results as JSON and the final
+# results as CSV
+def write_results(points, front, work_dir):
+    with open(os.path.join(work_dir, "sweep.json"), "w") as f:
+        json.dump([{"id": p["id"], "label": p["label"], "values": p["values"], "rungs": p["rungs"],
+                    "final": p.get("final"), "pareto": p in front} for p in points], f, indent=1)
+    names = list(points[0]["values"]) if points else []
+    with open(os.path.join(work_dir, "sweep.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id"] + names + ["patterns", "test_coverage", "fault_coverage", "cpu_time",
+                                          "wall_time", "pareto"])
+        for p in points:
+            if p.get("final"):
+                r = p["final"]
+                writer.writerow([p["id"]] + [p["values"][n] for n in names] +
+                                [r["patterns"], r["test_coverage"], r["fault_coverage"], r["cpu_time"],
+                                 f"{r['wall_time']:.2f}", int(p in front)])
+
+# Main function
+def run_sweep(config_file, params, slots=4, rungs=3, eta=2, min_patterns=64, work_dir="sweep", base_dir=".",
+              skip_dft=False, cache_dir=DEFAULT_CACHE_DIR, force=False, metrics_db=DEFAULT_METRICS_DB):
+    config = parse_config(config_file)
+    params = [parse_param(option, config) for option in params]
+    base_dir = os.path.abspath(base_dir)
+    work_dir = os.path.abspath(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    cache = StageCache(os.path.abspath(cache_dir))
+
+    points = []
+    groups = {}
+    for index, values in enumerate(sweep_points(params)):
+        point_config = copy.copy(config)
+        for name, value in values.items():
+            setattr(point_config, name, value)
+        point_dir = os.path.join(work_dir, f"point_{index}")
+        point = {"id": index, "label": point_label(values), "values": values, "dir": point_dir, "rungs": [],
+                 "config": job_config(point_config, point_config.fault_model, point_dir, base_dir, f"p{index}")}
+        points.append(point)
+        groups.setdefault(tuple(getattr(point_config, field) for field in DFT_FIELDS), []).append(point)
+    print(f"Sweeping {len(points)} points in {len(groups)} scan insertion groups")
+
+    swept_dft = any(name in DFT_FIELDS for name, _ in params)
+    if swept_dft and not skip_dft:
+        for index, members in enumerate(groups.values()):
+            group_dir = os.path.join(work_dir, f"dft_{index}")
+            dft_config = job_config(members[0]["config"], config.fault_model, group_dir, base_dir)
+            print(f"Scan Insertion: {group_dir} ({len(members)} points)...")
+            if run_group_dft(dft_config, group_dir, cache, force) != 0:
+                print(f"Error: scan insertion failed, see {group_dir}/dft_dc.log; dropping its points.")
+                for point in members:
+                    point["failed"] = True
+                continue
+            for point in members:
+                for field, ext in (("netlist_file", ".v"), ("spf_file", ".spf"), ("spef_file", ".spef")):
+                    setattr(point["config"], field, os.path.join(group_dir, "Netlist", f"{config.top_module}_dft{ext}"))
+
+    alive = [point for point in points if not point.get("failed")]
+    rungs = max(1, rungs)
+    with ProcessPoolExecutor(max_workers=max(1, slots)) as pool:
+        for rung in range(rungs):
+            budget = None if rung == rungs - 1 else min_patterns * eta ** rung
+            print(f"\nRung {rung}: {len(alive)} points, "
+                  f"{'no pattern cap' if budget is None else f'at most {budget} patterns'}")
+            futures = {pool.submit(run_point, point["config"], os.path.join(point["dir"], f"rung_{rung}"),
+                                   budget, cache, force): point for point in alive}
+            for future in as_completed(futures):
+                point = futures[future]
+                result = future.result()
+                point["rungs"].append(result)
+                status = "ok" if result["returncode"] == 0 and result["test_coverage"] is not None else "FAILED"
+                print(f"  {point['label']}: {status} (TC {result['test_coverage']}%, {result['patterns']} patterns)")
+            finished = [point for point in alive
+                        if point["rungs"][-1]["returncode"] == 0 and point["rungs"][-1]["test_coverage"] is not None]
+            if budget is None:
+                for point in finished:
+                    point["final"] = point["rungs"][-1]
+                    if metrics_db:
+                        run_dir = point["final"]["run_dir"]
+                        record_summary(rung_config(point["config"], run_dir), "atpg", metrics_db, run_dir)
+                alive = finished
+                break
+            keep = max(1, math.ceil(len(finished) / eta))
+            alive = []
+            for layer in pareto_layers([point["rungs"][-1] for point in finished]):
+                if len(alive) < keep:
+                    alive += [finished[i] for i in layer]
+                    continue
+                for i in layer:
+                    print(f"  pruned {finished[i]['label']}")
+
+    finals = [point for point in alive if point.get("final")]
+    front = [point for point in finals if point["final"] in pareto_front([p["final"] for p in finals])]
+    if finals:
+        print_results(finals, front)
+    else:
+        print("Error: no point finished its full ATPG run.")
+    write_results(points, front, work_dir)
+    print(f"\nResults written to {os.path.join(work_dir, 'sweep.json')} and sweep.csv "
+          f"({len(front)} Pareto points, marked *)")
+    return points, front
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Sweep config parameters with successive halving and report the Pareto front of patterns, coverage and runtime.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--param', action='append', required=True,
+                        help='Swept parameter, name=v1,v2,... or name=first:last[:step]; repeat for more')
+    parser.add_argument('--slots', type=int, default=4, help='Maximum number of concurrent tmax jobs / licenses (default: 4)')
+    parser.add_argument('--rungs', type=int, default=3, help='Successive halving rungs including the full run (default: 3)')
+    parser.add_argument('--eta', type=int, default=2, help='Keep at least 1/eta of the points (whole Pareto layers) per rung, grow the budget eta times (default: 2)')
+    parser.add_argument('--min_patterns', type=int, default=64, help='Pattern budget of the first rung (default: 64)')
+    parser.add_argument('--work_dir', default='sweep', help='Directory holding one sub-directory per point (default: sweep)')
+    parser.add_argument('--base_dir', default='.', help='Directory the relative paths in config.txt refer to (default: .)')
+    parser.add_argument('--skip_dft', action='store_true', help='Reuse the existing scan inserted netlist for every point')
+    parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help=f'Stage cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--force', action='store_true', help='Run every stage even if its outputs are cached')
+    parser.add_argument('--metrics_db', default=DEFAULT_METRICS_DB, help=f'Metrics database the full runs are appended to (default: {DEFAULT_METRICS_DB})')
+    args = parser.parse_args()
+    points, front = run_sweep(args.config, args.param, args.slots, args.rungs, args.eta, args.min_patterns,
+                              args.work_dir, args.base_dir, args.skip_dft, args.cache_dir, args.force,
+                              args.metrics_db)
+    if not front:
+        raise SystemExit(1)
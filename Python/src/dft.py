@@ -73,10 +73,10 @@ class DFTScriptGenerator:
     def write_reports(self, file):
         # Scan path and cell reports
         file.write("set filename [format \"%s%s\"  $my_toplevel \"_dft.scan_path\"]\n")
-        file.write("redirect [format \"%s%s\"  \"./rpt/\" $filename] { report_constraint -all_violators -verbose }\n\n")
+        file.write("redirect [format \"%s%s\"  \"./rpt/\" $filename] { report_scan_path -view existing_design -chain all }\n\n")
 
         file.write("set filename [format \"%s%s\"  $my_toplevel \"_dft.cell\"]\n")
-        file.write("redirect [format \"%s%s\"  \"./rpt/\" $filename] { report_constraint -all_violators -verbose }\n\n")
+        file.write("redirect [format \"%s%s\"  \"./rpt/\" $filename] { report_scan_path -view existing_design -cell all }\n\n")
 
         # Various analysis reports
         file.write("redirect [format \"%s%s\"  \"./rpt/\" violation.rpt] { report_constraint -all_violators -verbose }\n")
@@ -0,0 +1,120 @@
+import os
+import re
+import sys
+import time
+import shlex
+import argparse
+
+# Stand-in for `tmax -shell -tcl` so the session broker and the flows can be
+# exercised without a license. Reads commands from stdin (or a script file),
+# prints a BUILD/DRC/TEST prompt like tmax, answers `puts`, creates the
+# files write_faults / write_patterns / `report_summaries >` name and prints
+# an "Error:" line for commands listed with --fail. With --atpg_passes,
+# run_atpg prints that many ATPG pass rows with slowly rising coverage and
+# stops early on SIGINT, like tmax does on Ctrl-C.
+
+SUMMARY = """ Uncollapsed Stuck Fault Summary Report
+ -----------------------------------------------
+ fault class                     code   #faults
+ ------------------------------  ----  ---------
+ Detected                         DT        990
+ Possibly detected                PT          0
+ Undetectable                     UD          6
+ ATPG untestable                  AU          2
+ Not detected                     ND          2
+ -----------------------------------------------
+ total faults                              1000
+ test coverage                            99.60%
+ fault coverage                           99.00%
+ -----------------------------------------------
+ #internal patterns                          42
+ CPU_time = 0.01 sec
+"""
+
+# Function to print the pass rows of a fake run_atpg until it is interrupted
+def run_atpg_passes(passes, delay):
+    print(" #patterns     #faults     #ATPG faults  test      process")
+    print(" stored     detect/active  red/au/abort  coverage  CPU time")
+    print(" ---------  -------------  ------------  --------  --------")
+    try:
+        for n in range(1, passes + 1):
+            time.sleep(delay)
+            coverage = 99.6 - 40.0 / n
+            print(f" {32 * n:<9}  {1000 // n:>6} {100 // n:>6}  {0}/{0}/{n:<8}  {coverage:6.2f}%  {n * 10.0:8.2f}")
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        print(" Warning: run_atpg interrupted by user (fake).")
+
+# Function to run one command; returns the new mode, or None on exit
+def run_command(line, mode, fail, delay, passes=0):
+    try:
+        words = shlex.split(line)
+    except ValueError:
+        words = line.split()
+    if not words:
+        return mode
+    command = words[0]
+    if command == "exit":
+        return None
+    time.sleep(delay)
+    if command in fail:
+        print(f"Error: {command} failed (fake).")
+        return mode
+    if command == "puts":
+        print(" ".join(words[1:]))
+    elif command == "run_atpg" and passes:
+        run_atpg_passes(passes, delay)
+    elif command == "cd":
+        os.chdir(words[1])
+    elif command == "read_netlist":
+        print(f" Reading {words[1]} (fake)")
+    elif command == "run_build_model":
+        print(f" Building model {words[1] if len(words) > 1 else ''} (fake)")
+        mode = "DRC"
+    elif command == "run_drc":
+        print(" DRC Summary Report: 0 violations (fake)")
+        mode = "TEST"
+    elif command == "report_summaries":
+        if ">" in words:
+            with open(words[words.index(">") + 1], "w") as f:
+                f.write(SUMMARY)
+        else:
+            print(SUMMARY, end="")
+    elif command in ("write_faults", "write_patterns"):
+        path = words[1]
+        # keep an existing fault list, like a run that only reclassified it
+        if command == "write_patterns" or not os.path.isfile(path) or not os.path.getsize(path):
+            with open(path, "w") as f:
+                f.write("sa0 DS x/A\n" if command == "write_faults" else "STIL 1.0;\n")
+    return mode
+
+# Main function
+def main(script=None, fail=(), delay=0.0, passes=0):
+    source = open(script) if script else sys.stdin
+    mode = "BUILD"
+    while True:
+        sys.stdout.write(f"{mode}-T> ")
+        sys.stdout.flush()
+        line = source.readline()
+        if not line:
+            break
+        if script:
+            # tmax echoes the commands of a script after the prompt
+            sys.stdout.write(line if line.endswith("\n") else line + "\n")
+        line = re.sub(r"\s+#.*$", "", line.strip()) if not line.lstrip().startswith("#") else ""
+        mode = run_command(line, mode, fail, delay, passes)
+        sys.stdout.flush()
+        if mode is None:
+            break
+    print("")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fake tmax shell for testing without a license.')
+    parser.add_argument('script', nargs='?', default=None, help='TCL script to run instead of reading stdin')
+    parser.add_argument('-shell', action='store_true', help='Accepted for command line compatibility')
+    parser.add_argument('-tcl', action='store_true', help='Accepted for command line compatibility')
+    parser.add_argument('--fail', nargs='*', default=[], help='Commands that report an error')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds every command takes (default: 0)')
+    parser.add_argument('--atpg_passes', type=int, default=0, help='ATPG pass rows run_atpg prints (default: none)')
+    args = parser.parse_args()
+    main(args.script, set(args.fail), args.delay, args.atpg_passes)
@@ -0,0 +1,198 @@
+import argparse
+from array import array
+from cell_library import lookup, compile_expression
+from netlist_graph import open_graph, PIN_IN, PIN_OUT
+
+# Structural fault collapsing.
+# Stuck-at or transition faults are enumerated on every pin of the netlist
+# graph (two per pin) and merged with cell-type rules derived from the
+# cell_library truth tables:
+#   wire         a net with one driver and one load: the driver's and the
+#                load's faults of the same value are equivalent
+#   buffer/inv   input faults are equivalent to the (inverted) output faults
+#   controlling  input stuck-at v forcing the output to w (AND input sa0 ->
+#                output sa0, NOR input sa1 -> output sa0, ...) is equivalent
+#                to output stuck-at w; the output stuck-at !w dominates the
+#                input stuck-at !v and is dropped (stuck-at only)
+# Transition faults only collapse over wires, buffers and inverters; a
+# controlling input does not make the launch transitions equivalent.
+# Sequential cells and cells missing from the library are left alone.
+#
+# One fault per remaining class is written in the format read_faults takes,
+# as NC (not controlled, the undetected class ATPG starts from). Faults
+# dropped by dominance are detected by the tests of the faults they
+# dominate. Such a list only holds the collapsed faults, so tmax reports
+# coverage over them; with_equivalents writes the whole uncollapsed
+# universe instead (every class, dominated ones included, followed by its
+# members as "--" rows), so the reported coverage is the uncollapsed one
+# and only the class representatives are targeted. The ATPG flow uses it.
+
+FAULT_TYPES = {"stuck": ("sa0", "sa1"), "transition": ("str", "stf")}
+
+# Function to derive the controlling values of a single output cell.
+# Returns [(input, v, w)]: input at v forces the output to w.
+def controlling_values(cell):
+    function = lookup(cell)
+    if function is None or function.next_state is not None or len(function.outputs) != 1:
+        return []
+    inputs = function.inputs
+    if not inputs or len(inputs) > 8:
+        return []
+    n = 1 << len(inputs)
+    mask = (1 << n) - 1
+    # input i is the word of the truth table rows where bit i is set
+    words = [sum(1 << row for row in range(n) if row >> i & 1) for i in range(len(inputs))]
+    expression = next(iter(function.outputs.values()))
+    table = compile_expression(inputs, expression)(*words, mask)
+    rules = []
+    for i, pin in enumerate(inputs):
+        for v in (0, 1):
+            rows = words[i] if v else ~words[i] & mask
+            if table & rows == 0:
+                rules.append((pin, v, 0))
+            elif table & rows == rows:
+                rules.append((pin, v, 1))
+    return rules
+
+class FaultCollapser:
+    def __init__(self, graph, fault_model="stuck", dominance=True):
+        if fault_model not in FAULT_TYPES:
+            raise ValueError(f"Unsupported fault model for collapsing: {fault_model}")
+        self.graph = graph
+        self.fault_model = fault_model
+        self.dominance = dominance and fault_model == "stuck"
+        # fault id = 2 * pin row + value; the root of a class is its smallest id
+        self.parent = array("i", range(2 * graph.num_pins))
+        self.dropped = bytearray(2 * graph.num_pins)
+        self._rules = {}
+
+    def find(self, f):
+        parent = self.parent
+        root = f
+        while parent[root] != root:
+            root = parent[root]
+        while parent[f] != root:
+            parent[f], f = root, parent[f]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            if b < a:
+                a, b = b, a
+            self.parent[b] = a
+
+    def collapse(self):
+        graph = self.graph
+        pin_dir = graph.pin_dir
+        dominated = []
+        for n in range(graph.num_nets):
+            pins = graph.net_pins[graph.net_pin_start[n]:graph.net_pin_start[n + 1]]
+            if len(pins) == 2:
+                drivers = [p for p in pins if pin_dir[p] != PIN_IN]
+                loads = [p for p in pins if pin_dir[p] != PIN_OUT]
+                if len(drivers) == 1 and len(loads) == 1 and drivers[0] != loads[0]:
+                    self.union(2 * drivers[0], 2 * loads[0])
+                    self.union(2 * drivers[0] + 1, 2 * loads[0] + 1)
+
+        for c in range(graph.num_cells):
+            if graph.is_port(c) or graph.is_sequential(c):
+                continue
+            cell = graph.cell_type_name(c)
+            rules = self._rules.get(cell)
+            if rules is None:
+                rules = self._rules[cell] = controlling_values(cell)
+            if not rules:
+                continue
+            start, end = graph.cell_pin_start[c], graph.cell_pin_start[c + 1]
+            outputs = [p for p in range(start, end) if pin_dir[p] == PIN_OUT]
+            if len(outputs) != 1:
+                continue
+            out = outputs[0]
+            rows = {graph.pin_names[graph.pin_name[p]]: p for p in range(start, end)}
+            single_input = len(lookup(cell).inputs) == 1
+            for pin, v, w in rules:
+                p = rows.get(pin)
+                if p is None or graph.pin_net[p] < 0:
+                    continue
+                if single_input or self.fault_model == "stuck":
+                    self.union(2 * p + v, 2 * out + w)
+                if self.dominance and not single_input:
+                    dominated.append((2 * out + (1 - w), 2 * p + (1 - v)))
+
+        for dominating, kept in dominated:
+            a, b = self.find(dominating), self.find(kept)
+            # never drop a class whose only witness is already dropped
+            if a != b and not self.dropped[b]:
+                self.dropped[a] = 1
+        return self
+
+    def fault_name(self, f):
+        graph = self.graph
+        p = f >> 1
+        c = graph.pin_cell(p)
+        pin = graph.pin_names[graph.pin_name[p]]
+        return pin if graph.is_port(c) else f"{graph.cell_name(c)}/{pin}"
+
+    # Function to write the collapsed list in the read_faults format.
+    # with_equivalents keeps every fault (see above).
+    # Returns (total faults, equivalence classes, faults written as NC).
+    def write(self, faults_file, with_equivalents=False):
+        types = FAULT_TYPES[self.fault_model]
+        total = len(self.parent)
+        roots = array("i", (self.find(f) for f in range(total)))
+        classes = sum(1 for f in range(total) if roots[f] == f)
+        members = None
+        if with_equivalents:
+            # counting sort of the faults by class root
+            start = array("i", bytes(4 * (total + 1)))
+            for r in roots:
+                start[r + 1] += 1
+            for f in range(total):
+                start[f + 1] += start[f]
+            fill = array("i", start)
+            members = array("i", bytes(4 * total))
+            for f in range(total):
+                members[fill[roots[f]]] = f
+                fill[roots[f]] += 1
+        kept = 0
+        with open(faults_file, "w", buffering=1 << 22) as out:
+            for f in range(total):
+                if roots[f] != f or (self.dropped[f] and members is None):
+                    continue
+                kept += 1
+                out.write(f"{types[f & 1]} NC {self.fault_name(f)}\n")
+                if members is not None:
+                    for g in members[start[f] + 1:start[f + 1]]:
+                        out.write(f"{types[g & 1]} -- {self.fault_name(g)}\n")
+        return total, classes, kept
+
+# Main function
+def write_collapsed_faults(netlist_file, faults_file, fault_model="stuck", top=None, dominance=True,
+                           with_equivalents=False):
+    graph = open_graph(netlist_file, top=top)
+    try:
+        total, classes, kept = FaultCollapser(graph, fault_model, dominance).collapse().write(faults_file, with_equivalents)
+    finally:
+        graph.close()
+    print(f"{fault_model} faults: {total} uncollapsed, {classes} after equivalence, {kept} targeted in {faults_file} "
+          f"({100.0 * (total - kept) / max(total, 1):.1f}% fewer)")
+    return faults_file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Enumerate and structurally collapse stuck-at / transition faults of a netlist.')
+    parser.add_argument('netlist_file', help='Scan inserted netlist, e.g. s15850_dft.v')
+    parser.add_argument('--fault_model', choices=sorted(FAULT_TYPES), default='stuck', help='Fault model (default: stuck)')
+    parser.add_argument('--output', default=None, help='Collapsed fault list (default: <top>_<model>_collapsed.fault)')
+    parser.add_argument('--top', default=None, help='Top module (default: the uninstantiated module)')
+    parser.add_argument('--no_dominance', action='store_true', help='Only collapse equivalent faults')
+    parser.add_argument('--with_equivalents', action='store_true', help='Write every fault, the equivalent ones as "--" rows, so coverage is uncollapsed')
+    args = parser.parse_args()
+
+    output_file = args.output
+    if output_file is None:
+        graph = open_graph(args.netlist_file, top=args.top)
+        output_file = f"{graph.top}_{args.fault_model}_collapsed.fault"
+        graph.close()
+    write_collapsed_faults(args.netlist_file, output_file, args.fault_model, args.top, not args.no_dominance,
+                           args.with_equivalents)
@@ -0,0 +1,318 @@
+import os
+import json
+import struct
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+import numpy as np
+
+# Indexed fault database for the lists written by
+# `write_faults <file> -all -replace`, one fault per line:
+#
+#   sa0   DS   u_core/U12/A
+#   sa1   --   u_core/U12/A      (-- : equivalent to the fault above)
+#
+# The file is streamed into columnar arrays (fault type, class and pin path
+# interned to small ids) plus two indexes: rows sorted by fault code, and
+# rows grouped by pin path in sorted order, so a hierarchy prefix is two
+# bisects. The arrays and the pin path bytes are saved next to the fault
+# list; a reopen maps them as NumPy views of the file and only decodes the
+# pin paths a query touches.
+
+DB_MAGIC = b"FAULTDB2"
+DB_SUFFIX = ".fdb"
+# sections of the saved database start on this boundary
+ALIGN = 8
+
+Fault = namedtuple("Fault", ["model", "fault_class", "pin", "equivalent"])
+
+# Two letter fault codes and the class they belong to
+FAULT_CLASSES = {
+    "DT": "DT", "DR": "DT", "DS": "DT", "DI": "DT", "D2": "DT", "TP": "DT",
+    "PT": "PT", "AP": "PT", "NP": "PT", "P0": "PT", "P1": "PT",
+    "UD": "UD", "UU": "UD", "UO": "UD", "UT": "UD", "UB": "UD", "UR": "UD",
+    "AU": "AU", "AN": "AU", "AX": "AU", "AB": "AU",
+    "ND": "ND", "NC": "ND", "NO": "ND",
+}
+
+# Function to stream (model, code, pin, equivalent) from a fault list.
+# An equivalent fault ("--") inherits the code of the fault above it.
+def read_faults(faults_file):
+    code = None
+    with open(faults_file, "r", buffering=1 << 22) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 3 or fields[0].startswith(("//", "#")):
+                continue
+            equivalent = fields[1] == "--"
+            if not equivalent or code is None:
+                code = fields[1]
+            # bridging faults name two nodes
+            pin = fields[2] if len(fields) == 3 else " ".join(fields[2:])
+            yield fields[0], code, pin, equivalent
+
+class PinPaths:
+    # Pin paths stored as one byte string and offsets; a path is decoded
+    # when it is read
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, pins):
+        encoded = [pin.encode() for pin in pins]
+        offsets = np.zeros(len(encoded) + 1, np.uint64)
+        np.cumsum([len(pin) for pin in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, pid):
+        return self.data[self.offsets[pid]:self.offsets[pid + 1]].tobytes().decode()
+
+class FaultDB:
+    def __init__(self, models, codes, pins, model_ids, code_ids, pin_ids, equivalent, leading_slash,
+                 pin_order=None, rank_start=None, row_order=None, class_order=None, class_start=None):
+        self.models = models              # model id -> fault type (sa0, sa1, str, ...)
+        self.codes = codes                # code id -> fault code (DS, UD, --, ...)
+        self.pins = pins                  # pin id -> path without leading '/' (PinPaths)
+        self.model_ids = model_ids        # per row
+        self.code_ids = code_ids          # per row
+        self.pin_ids = pin_ids            # per row
+        self.equivalent = equivalent      # per row, 1 for "--" faults
+        self.leading_slash = leading_slash
+        if pin_order is None:
+            pin_order, rank_start, row_order = self._build_pin_index()
+        self.pin_order = pin_order        # pin ids sorted by path
+        self.rank_start = rank_start      # rank -> first position in row_order
+        self.row_order = row_order        # rows grouped by pin path order
+        if class_order is None:
+            class_order = np.argsort(code_ids, kind="stable").astype(np.uint32)
+            class_start = np.zeros(len(codes) + 1, np.uint64)
+            np.cumsum(np.bincount(code_ids, minlength=len(codes)), out=class_start[1:])
+        self.class_order = class_order    # rows sorted by code id
+        self.class_start = class_start    # code id -> first position in class_order
+        self.classes = [FAULT_CLASSES.get(code, code) for code in codes]
+
+    @classmethod
+    def from_faults_file(cls, faults_file):
+        models, codes, pins = [], [], []
+        model_index, code_index, pin_index = {}, {}, {}
+        model_ids, code_ids, pin_ids, equivalent = array("B"), array("B"), array("I"), array("B")
+        leading_slash = None
+        for model, code, pin, equiv in read_faults(faults_file):
+            if leading_slash is None:
+                leading_slash = pin.startswith("/")
+            if pin.startswith("/"):
+                pin = pin[1:]
+            mid = model_index.get(model)
+            if mid is None:
+                mid = model_index[model] = len(models)
+                models.append(model)
+            cid = code_index.get(code)
+            if cid is None:
+                cid = code_index[code] = len(codes)
+                codes.append(code)
+            pid = pin_index.get(pin)
+            if pid is None:
+                pid = pin_index[pin] = len(pins)
+                pins.append(pin)
+            model_ids.append(mid)
+            code_ids.append(cid)
+            pin_ids.append(pid)
+            equivalent.append(equiv)
+        return cls(models, codes, PinPaths.from_list(pins), np.array(model_ids, np.uint8),
+                   np.array(code_ids, np.uint8), np.array(pin_ids, np.uint32), np.array(equivalent, np.uint8),
+                   bool(leading_slash))
+
+    def _build_pin_index(self):
+        # rows stably sorted by the rank of their pin path
+        pins = self.pins
+        pin_order = np.array(sorted(range(len(pins)), key=pins.__getitem__), np.uint32)
+        rank = np.empty(len(pins), np.uint32)
+        rank[pin_order] = np.arange(len(pins), dtype=np.uint32)
+        row_rank = rank[self.pin_ids]
+        row_order = np.argsort(row_rank, kind="stable").astype(np.uint32)
+        rank_start = np.zeros(len(pins) + 1, np.uint64)
+        np.cumsum(np.bincount(row_rank, minlength=len(pins)), out=rank_start[1:])
+        return pin_order, rank_start, row_order
+
+    def __len__(self):
+        return len(self.pin_ids)
+
+    def fault(self, row):
+        pin = self.pins[self.pin_ids[row]]
+        return Fault(self.models[self.model_ids[row]], self.classes[self.code_ids[row]],
+                     "/" + pin if self.leading_slash else pin, bool(self.equivalent[row]))
+
+    def _code_ids(self, fault_class):
+        return [cid for cid, code in enumerate(self.codes) if fault_class in (code, self.classes[cid])]
+
+    def by_class(self, fault_class):
+        # Rows of one fault class (DT, PT, UD, AU, ND) or code (DS, UU, ...)
+        parts = [self.class_order[self.class_start[cid]:self.class_start[cid + 1]]
+                 for cid in self._code_ids(fault_class)]
+        return np.concatenate(parts) if parts else np.zeros(0, np.uint32)
+
+    def _rank_range(self, lo, hi):
+        # pin ranks of the paths in [lo, hi), hi=None for no upper bound
+        key = self.pins.__getitem__
+        first = bisect_left(self.pin_order, lo, key=key)
+        last = len(self.pin_order) if hi is None else bisect_left(self.pin_order, hi, key=key)
+        return first, last
+
+    def prefix_rows(self, prefix):
+        # Rows whose pin path lies under a hierarchy prefix: "u_core" and
+        # "u_core/*" match u_core itself and u_core/..., not u_core2; a
+        # trailing "*" after a partial name ("u_co*") matches the plain
+        # string prefix
+        prefix = prefix.lstrip("/")
+        if prefix.endswith("*") and not prefix.endswith("/*"):
+            stem = prefix.rstrip("*")
+            ranges = [self._rank_range(stem, stem + "\U0010ffff")] if stem else [(0, len(self.pin_order))]
+        else:
+            stem = prefix.rstrip("*").rstrip("/")
+            if not stem:
+                return np.arange(len(self), dtype=np.uint32)
+            first, _ = self._rank_range(stem, None)
+            last = bisect_right(self.pin_order, stem, lo=first, key=self.pins.__getitem__)
+            # "/" sorts right before "0", so u_core/... is one range
+            ranges = [(first, last), self._rank_range(stem + "/", stem + "0")]
+        parts = [self.row_order[self.rank_start[lo]:self.rank_start[hi]] for lo, hi in ranges if hi > lo]
+        return np.concatenate(parts) if parts else np.zeros(0, np.uint32)
+
+    def select(self, fault_class=None, prefix=None, model=None):
+        # Rows matching every given filter, e.g. select("ND", "u_core/*")
+        if prefix is not None:
+            rows = self.prefix_rows(prefix)
+            if fault_class is not None:
+                wanted = np.zeros(len(self.codes), bool)
+                wanted[self._code_ids(fault_class)] = True
+                rows = rows[wanted[self.code_ids[rows]]]
+        elif fault_class is not None:
+            rows = self.by_class(fault_class)
+        else:
+            rows = np.arange(len(self), dtype=np.uint32)
+        if model is not None:
+            if model not in self.models:
+                return np.zeros(0, np.uint32)
+            rows = rows[self.model_ids[rows] == self.models.index(model)]
+        return rows
+
+    def count_by_class(self, rows=None):
+        code_ids = self.code_ids if rows is None else self.code_ids[rows]
+        counts = {}
+        for cid, count in enumerate(np.bincount(code_ids, minlength=len(self.codes))):
+            if count:
+                counts[self.classes[cid]] = counts.get(self.classes[cid], 0) + int(count)
+        return counts
+
+    def units(self):
+        # (start, end) row ranges of each primary fault and its "--" equivalents
+        if not len(self):
+            return iter(())
+        starts = np.concatenate(([0], np.flatnonzero(self.equivalent[1:] == 0) + 1))
+        return zip(starts.tolist(), np.append(starts[1:], len(self)).tolist())
+
+    def write(self, faults_file, rows=None, codes=True):
+        # Write rows in the write_faults format read_faults accepts.
+        # codes=False writes every fault as NC so it is targeted from scratch.
+        # An equivalent fault is only written as "--" right after the row
+        # above it; cut off from its primary it gets the primary's code.
+        rows = range(len(self)) if rows is None else np.asarray(rows).tolist()
+        previous = None
+        with open(faults_file, "w", buffering=1 << 22) as f:
+            for row in rows:
+                pin = self.pins[self.pin_ids[row]]
+                if self.leading_slash:
+                    pin = "/" + pin
+                if self.equivalent[row] and previous == row - 1:
+                    code = "--"
+                else:
+                    code = self.codes[self.code_ids[row]] if codes else "NC"
+                f.write(f"{self.models[self.model_ids[row]]} {code} {pin}\n")
+                previous = row
+
+    def save(self, db_file, source=None):
+        sections = [("model_ids", self.model_ids), ("code_ids", self.code_ids), ("pin_ids", self.pin_ids),
+                    ("equivalent", self.equivalent), ("pin_order", self.pin_order),
+                    ("rank_start", self.rank_start), ("row_order", self.row_order),
+                    ("class_order", self.class_order), ("class_start", self.class_start),
+                    ("pin_data", self.pins.data), ("pin_offsets", self.pins.offsets)]
+        header = {"models": self.models, "codes": self.codes, "leading_slash": self.leading_slash,
+                  "source": source, "sections": []}
+        tmp = f"{db_file}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(DB_MAGIC + struct.pack("<Q", 0))
+            for name, data in sections:
+                f.write(bytes(-f.tell() % ALIGN))
+                data = np.ascontiguousarray(data)
+                header["sections"].append([name, data.dtype.str, f.tell(), len(data)])
+                f.write(data.tobytes())
+            offset = f.tell()
+            f.write(json.dumps(header).encode())
+            f.seek(len(DB_MAGIC))
+            f.write(struct.pack("<Q", offset))
+        os.replace(tmp, db_file)
+
+    @classmethod
+    def load(cls, db_file):
+        with open(db_file, "rb") as f:
+            if f.read(len(DB_MAGIC)) != DB_MAGIC:
+                raise ValueError(f"{db_file} is not a fault database")
+            offset, = struct.unpack("<Q", f.read(8))
+            f.seek(offset)
+            header = json.loads(f.read())
+        data = np.memmap(db_file, np.uint8, "r")
+        arrays = {}
+        for name, dtype, start, count in header["sections"]:
+            dtype = np.dtype(dtype)
+            arrays[name] = data[start:start + count * dtype.itemsize].view(dtype)
+        db = cls(header["models"], header["codes"], PinPaths(arrays["pin_data"], arrays["pin_offsets"]),
+                 arrays["model_ids"], arrays["code_ids"], arrays["pin_ids"], arrays["equivalent"],
+                 header["leading_slash"], arrays["pin_order"], arrays["rank_start"], arrays["row_order"],
+                 arrays["class_order"], arrays["class_start"])
+        db.source = header["source"]
+        return db
+
+# Function to open the database of a fault list, building and saving it on
+# the first open or when the fault list changed since.
+def open_faults(faults_file, db_file=None, rebuild=False):
+    db_file = db_file or faults_file + DB_SUFFIX
+    st = os.stat(faults_file)
+    source = [st.st_size, st.st_mtime_ns]
+    if not rebuild and os.path.isfile(db_file):
+        try:
+            db = FaultDB.load(db_file)
+        except ValueError:
+            # written by an older version
+            db = None
+        if db is not None and db.source == source:
+            return db
+    db = FaultDB.from_faults_file(faults_file)
+    db.save(db_file, source)
+    db.source = source
+    return db
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query a TetraMAX fault list.')
+    parser.add_argument('faults_file', help='Path to the .fault file')
+    parser.add_argument('--class', dest='fault_class', default=None, help='Fault class or code, e.g. ND, UD, DS')
+    parser.add_argument('--prefix', default=None, help='Instance path prefix, e.g. u_core/*')
+    parser.add_argument('--model', default=None, help='Fault type, e.g. sa0, str')
+    parser.add_argument('--count', action='store_true', help='Only print counts per fault class')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the database even if it is up to date')
+    args = parser.parse_args()
+
+    db = open_faults(args.faults_file, rebuild=args.rebuild)
+    rows = db.select(args.fault_class, args.prefix, args.model)
+    if args.count:
+        for fault_class, count in sorted(db.count_by_class(rows).items()):
+            print(f"{fault_class} {count}")
+    else:
+        for row in rows:
+            fault = db.fault(row)
+            code = "--" if fault.equivalent else db.codes[db.code_ids[row]]
+            print(f"{fault.model} {code} {fault.pin}")
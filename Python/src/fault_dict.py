@@ -0,0 +1,362 @@
+import os
+import re
+import csv
+import json
+import zlib
+import struct
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from config_parser import parse_config
+from stil_reader import open_patterns
+from bit_fault_sim import (CircuitModel, MODEL_TYPES, DEFAULT_BLOCK_BITS, scan_cells, PatternBlocks, fault_rows,
+                           fault_sites, fault_slices, word_bits, batch_size, run_slices, slice_state)
+
+# Pass/fail fault dictionary and batch failure diagnosis.
+# Every fault of the fault list (every pin fault without one) is simulated
+# over the whole pattern set without dropping, recording where it shows:
+# bit pattern * observe_points + point, the points being the scan cells of
+# the STIL chains and the primary outputs. The dictionary file keeps two
+# views of these signatures as zlib compressed bitsets / position lists:
+#   per fault    the sorted fail bits (exact matching of a candidate)
+#   per pattern  a bitset over the faults failing that pattern (np.packbits)
+# next to raw NumPy arrays and a JSON header (magic, header offset, 8 byte
+# aligned sections), memory mapped on open like the netlist graph.
+#
+# A tester fail log holds one failing observation per line:
+#   <pattern> <chain or scan out port> <cell position>   scan cell
+#   <pattern> <output port>                              primary output
+# (cell position 0 is next to the scan output; more columns are ignored).
+# Diagnosis first scores every fault at once at pattern level: the unpacked
+# bitsets of the failing patterns are summed into one count per fault,
+# giving the failing patterns each fault explains. The best candidates by
+# that Jaccard score are then matched bit by bit against the log:
+#   TFSF tester fails, simulation fails  TFSP tester fails, simulation passes
+#   TPSF tester passes, simulation fails; score TFSF / (TFSF + TFSP + TPSF)
+# Fail logs are diagnosed in parallel, each worker mapping the same file.
+
+DICT_MAGIC = b"FLTDICT1"
+DICT_SUFFIX = ".fdict"
+
+ARRAY_SECTIONS = ["sig_start", "sig_blob", "pat_start", "pat_blob", "fault_patterns", "name_start", "name_blob"]
+
+_FAIL_RE = re.compile(r"^\s*(\d+)\s+(\S+)(?:\s+(\d+))?")
+
+# Function to simulate a slice of the faults without dropping and collect
+# their fail bits. The faults come sorted by root; each batch of roots is
+# propagated once with its per point observations, then its faults are
+# read off them. Returns {fault: (compressed signature, failing patterns)}.
+def _signature_slice(indices):
+    model, blocks, sites, observe, num_points = slice_state()
+    groups = {}
+    for i in indices:
+        groups.setdefault(model.site_root(sites[i]), []).append(i)
+    roots = [root for root in groups if root is not None]
+    bits = {i: [] for i in indices}
+    patterns = {i: [] for i in indices}
+
+    def collect(i, block, points):
+        for key, word in points.items():
+            point = observe.get(key)
+            if point is not None:
+                failing = word_bits(word).astype(np.uint64) + block.start
+                bits[i].append(failing * num_points + point)
+                patterns[i].append(failing)
+
+    for block in blocks:
+        reach = model.reach(block)
+        for i in groups.get(None, []):
+            collect(i, block, model.detect_points(block, sites[i], reach, None))
+        batch_roots = batch_size(block)
+        for k in range(0, len(roots), batch_roots):
+            batch = roots[k:k + batch_roots]
+            observed = [{} for _ in batch]
+            model.observe(block, batch, observed)
+            for root, points in zip(batch, observed):
+                for i in groups[root]:
+                    collect(i, block, model.detect_points(block, sites[i], reach, points))
+    signatures = {}
+    for i in indices:
+        fail_bits = np.sort(np.concatenate(bits[i])) if bits[i] else np.zeros(0, np.uint64)
+        failing = np.unique(np.concatenate(patterns[i])) if patterns[i] else np.zeros(0, np.uint64)
+        signatures[i] = (zlib.compress(fail_bits.astype("<u8").tobytes()), failing.astype(np.uint32))
+    return signatures
+
+# Function to turn per item byte strings into (start offsets, blob)
+def _pack_blobs(parts):
+    start = np.zeros(len(parts) + 1, np.uint64)
+    np.cumsum([len(part) for part in parts], out=start[1:])
+    return start, np.frombuffer(b"".join(parts), np.uint8)
+
+# Function to build the dictionary of a pattern set and save it
+def build_dictionary(netlist_file, patterns_file, dict_file, fault_model="stuck", faults_file=None, jobs=1,
+                     block_bits=DEFAULT_BLOCK_BITS, top=None, source=None):
+    model = CircuitModel(netlist_file, top)
+    store = open_patterns(patterns_file)
+    blocks = PatternBlocks(model, store, fault_model == "transition", block_bits)
+    rows = fault_rows(model, faults_file, fault_model)
+    sites, _ = fault_sites(model, rows)
+    names = [f"{fault_type} {pin}" for fault_type, pin, _, equivalent in rows if not equivalent]
+
+    # observation points: scan cells by chain position, then primary outputs
+    observe = {}
+    cells = {}
+    for fi, chain, position, _ in scan_cells(model, store):
+        positions = cells.setdefault(chain, [])
+        positions.extend([-1] * (position + 1 - len(positions)))
+        positions[position] = observe.setdefault(fi, len(observe))
+    outputs = {name: observe.setdefault(~net, len(observe)) for name, net in model.outputs.items()}
+    scan_outs = {chain.scan_out: chain.name for chain in store.chains if chain.scan_out}
+    num_points = len(observe)
+    num_patterns = len(store)
+    num_faults = len(sites)
+    print(f"Building the fault dictionary: {num_faults} faults x {num_patterns} patterns x {num_points} observe points")
+
+    signatures = {}
+    for part in run_slices(_signature_slice, (model, blocks, sites, observe, num_points),
+                           fault_slices(model, sites, jobs)):
+        signatures.update(part)
+
+    empty = (zlib.compress(b""), np.zeros(0, np.uint32))
+    signatures = [signatures.get(i, empty) for i in range(num_faults)]
+    sig_start, sig_blob = _pack_blobs([compressed for compressed, _ in signatures])
+    fault_patterns = np.array([len(failing) for _, failing in signatures], np.uint32)
+    # the faults failing every pattern, pattern by pattern
+    failing = np.concatenate([failing for _, failing in signatures])
+    owners = np.repeat(np.arange(num_faults, dtype=np.uint32), fault_patterns)
+    owners = owners[np.argsort(failing, kind="stable")]
+    bounds = np.zeros(num_patterns + 1, np.int64)
+    np.cumsum(np.bincount(failing, minlength=num_patterns), out=bounds[1:])
+    row = np.zeros(num_faults, bool)
+    bitsets = []
+    for p in range(num_patterns):
+        faults = owners[bounds[p]:bounds[p + 1]]
+        row[faults] = True
+        bitsets.append(zlib.compress(np.packbits(row, bitorder="little").tobytes()))
+        row[faults] = False
+    pat_start, pat_blob = _pack_blobs(bitsets)
+    name_start, name_blob = _pack_blobs([name.encode() for name in names])
+
+    header = {"source": source, "fault_model": fault_model, "faults": num_faults, "patterns": num_patterns,
+              "observe_points": num_points, "cells": cells, "outputs": outputs, "scan_outs": scan_outs,
+              "sections": []}
+    sections = {"sig_start": sig_start, "sig_blob": sig_blob, "pat_start": pat_start, "pat_blob": pat_blob,
+                "fault_patterns": fault_patterns, "name_start": name_start, "name_blob": name_blob}
+    tmp = f"{dict_file}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(DICT_MAGIC + struct.pack("<Q", 0))
+        for name in ARRAY_SECTIONS:
+            data = sections[name]
+            f.write(b"\0" * (-f.tell() % 8))
+            header["sections"].append([name, data.dtype.str, f.tell(), len(data)])
+            f.write(data.tobytes())
+        offset = f.tell()
+        f.write(json.dumps(header).encode())
+        f.seek(len(DICT_MAGIC))
+        f.write(struct.pack("<Q", offset))
+    os.replace(tmp, dict_file)
+    print(f"{dict_file}: {len(sig_blob) + len(pat_blob)} bytes of compressed signatures")
+    return dict_file
+
+class FaultDictionary:
+    # Read only view of a dictionary file
+    def __init__(self, dict_file):
+        self._map = np.memmap(dict_file, np.uint8, "r")
+        if self._map[:len(DICT_MAGIC)].tobytes() != DICT_MAGIC:
+            del self._map
+            raise ValueError(f"{dict_file} is not a fault dictionary")
+        offset, = struct.unpack_from("<Q", self._map, len(DICT_MAGIC))
+        self.header = json.loads(self._map[offset:].tobytes())
+        for name, dtype, start, count in self.header["sections"]:
+            dtype = np.dtype(dtype)
+            setattr(self, name, self._map[start:start + count * dtype.itemsize].view(dtype))
+        self.num_faults = self.header["faults"]
+        self.num_patterns = self.header["patterns"]
+        self.num_points = self.header["observe_points"]
+        self._applied_counts = {}
+
+    def close(self):
+        for name in ARRAY_SECTIONS:
+            setattr(self, name, None)
+        self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fault_name(self, f):
+        return self.name_blob[self.name_start[f]:self.name_start[f + 1]].tobytes().decode()
+
+    def signature(self, f):
+        # Sorted fail bits of fault f
+        return np.frombuffer(zlib.decompress(self.sig_blob[self.sig_start[f]:self.sig_start[f + 1]]), "<u8")
+
+    def pattern_faults(self, p):
+        # Flags (one uint8 per fault) of the faults failing pattern p
+        packed = np.frombuffer(zlib.decompress(self.pat_blob[self.pat_start[p]:self.pat_start[p + 1]]), np.uint8)
+        return np.unpackbits(packed, count=self.num_faults, bitorder="little")
+
+    def observe_point(self, target, position=None):
+        # Observe point of a fail log entry, None if it is not in the dictionary
+        if position is None:
+            return self.header["outputs"].get(target)
+        chain = self.header["scan_outs"].get(target, target)
+        cells = self.header["cells"].get(chain)
+        if cells is None or position >= len(cells) or cells[position] < 0:
+            return None
+        return cells[position]
+
+    # Function to read a fail log into (sorted fail bits, unknown entries)
+    def read_fail_log(self, log_file):
+        bits = set()
+        unknown = 0
+        with open(log_file) as f:
+            for line in f:
+                match = _FAIL_RE.match(line)
+                if not match:
+                    continue
+                pattern = int(match.group(1))
+                position = int(match.group(3)) if match.group(3) is not None else None
+                point = self.observe_point(match.group(2), position)
+                if point is None or pattern >= self.num_patterns:
+                    unknown += 1
+                    continue
+                bits.add(pattern * self.num_points + point)
+        return np.array(sorted(bits), np.uint64), unknown
+
+    def _pattern_counts(self, patterns):
+        # Number of the given patterns each fault fails
+        counts = np.zeros(self.num_faults, np.uint32)
+        for p in patterns:
+            counts += self.pattern_faults(p)
+        return counts
+
+    # Function to rank the candidate faults of a set of fail bits.
+    # applied: patterns the tester ran (stop on fail logs), all by default.
+    # Returns [(fault, score, tfsf, tfsp, tpsf)], best first.
+    def diagnose(self, fails, applied=None, top=10, prefilter=200):
+        applied = min(applied or self.num_patterns, self.num_patterns)
+        fails = np.unique(np.asarray(fails, np.uint64))
+        failing = np.unique(fails // self.num_points)
+        failing = failing[failing < applied]
+        if not len(failing):
+            return []
+        # pattern level: failing patterns explained by every fault at once
+        explained = self._pattern_counts(failing)
+        if applied < self.num_patterns:
+            totals = self._applied_counts.get(applied)
+            if totals is None:
+                totals = self._applied_counts[applied] = self._pattern_counts(range(applied))
+        else:
+            totals = self.fault_patterns
+        faults = np.flatnonzero(explained)
+        hits = explained[faults].astype(np.float64)
+        scores = hits / (totals[faults] + len(failing) - hits)
+        # best score first, the higher fault first on ties
+        candidates = faults[np.lexsort((-faults, -scores))[:prefilter]]
+
+        # bit level on the best candidates
+        limit = applied * self.num_points
+        ranked = []
+        for f in candidates.tolist():
+            simulated = self.signature(f)
+            simulated = simulated[simulated < limit]
+            tfsf = int(np.isin(simulated, fails, assume_unique=True).sum())
+            tpsf = len(simulated) - tfsf
+            tfsp = len(fails) - tfsf
+            ranked.append((f, tfsf / (tfsf + tfsp + tpsf), tfsf, tfsp, tpsf))
+        ranked.sort(key=lambda r: (-r[1], r[4], r[0]))
+        return ranked[:top]
+
+_DICTIONARY = None
+
+def _open_worker(dict_file):
+    global _DICTIONARY
+    _DICTIONARY = FaultDictionary(dict_file)
+
+def _diagnose_log(job):
+    log_file, applied, top, prefilter = job
+    fails, unknown = _DICTIONARY.read_fail_log(log_file)
+    ranked = _DICTIONARY.diagnose(fails, applied, top, prefilter)
+    return log_file, len(fails), unknown, [(_DICTIONARY.fault_name(f), *rest) for f, *rest in ranked]
+
+# Function to diagnose many fail logs in parallel and write the ranked
+# candidates of every log as CSV
+def diagnose_logs(dict_file, log_files, output_file, jobs=1, applied=None, top=10, prefilter=200):
+    jobs_list = [(log_file, applied, top, prefilter) for log_file in log_files]
+    if jobs <= 1 or len(log_files) < 2:
+        _open_worker(dict_file)
+        results = map(_diagnose_log, jobs_list)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context("fork"),
+                                   initializer=_open_worker, initargs=(dict_file,))
+        results = pool.map(_diagnose_log, jobs_list, chunksize=max(1, len(log_files) // (4 * jobs)))
+    diagnosed = 0
+    try:
+        with open(output_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["log", "rank", "fault", "score", "tfsf", "tfsp", "tpsf"])
+            for log_file, fail_count, unknown, ranked in results:
+                diagnosed += 1
+                if unknown:
+                    print(f"Warning: {log_file}: {unknown} entries match no pattern / observe point")
+                if not ranked:
+                    writer.writerow([log_file, "", "", "", 0, fail_count, ""])
+                for rank, (name, score, tfsf, tfsp, tpsf) in enumerate(ranked, 1):
+                    writer.writerow([log_file, rank, name, f"{score:.4f}", tfsf, tfsp, tpsf])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    print(f"{diagnosed} fail logs diagnosed, candidates written to {output_file}")
+    return output_file
+
+# Function to open the dictionary of a pattern set, building it on the
+# first open or when the netlist, patterns or fault list changed since
+def open_dictionary(netlist_file, patterns_file, fault_model="stuck", faults_file=None, dict_file=None, jobs=1,
+                    top=None, rebuild=False):
+    dict_file = dict_file or patterns_file + DICT_SUFFIX
+    source = [fault_model, top]
+    for path in (netlist_file, patterns_file, faults_file):
+        st = os.stat(path) if path else None
+        source += [st.st_size, st.st_mtime_ns] if st else [None, None]
+    if not rebuild and os.path.isfile(dict_file):
+        dictionary = FaultDictionary(dict_file)
+        if dictionary.header["source"] == source:
+            return dictionary
+        dictionary.close()
+    build_dictionary(netlist_file, patterns_file, dict_file, fault_model, faults_file, jobs, top=top, source=source)
+    return FaultDictionary(dict_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build a pass/fail fault dictionary and diagnose tester fail logs against it.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--netlist', default=None, help='Scan inserted netlist (default: netlist_file)')
+    parser.add_argument('--patterns', default=None, help='STIL patterns (default: patterns_file)')
+    parser.add_argument('--faults', default=None, help='Fault list (default: faults_file if it exists, else every pin)')
+    parser.add_argument('--fault_model', choices=sorted(MODEL_TYPES), default=None,
+                        help='Fault model (default: fault_model if stuck or transition, else stuck)')
+    parser.add_argument('--dictionary', default=None, help=f'Dictionary file (default: <patterns>{DICT_SUFFIX})')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Worker processes (default: all cores)')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the dictionary even if it is up to date')
+    parser.add_argument('--output', default='diagnosis.csv', help='Ranked candidates (default: diagnosis.csv)')
+    parser.add_argument('--applied', type=int, default=None, help='Patterns the tester applied (default: all)')
+    parser.add_argument('--top', type=int, default=10, help='Candidates reported per log (default: 10)')
+    parser.add_argument('--prefilter', type=int, default=200, help='Candidates matched bit by bit per log (default: 200)')
+    parser.add_argument('fail_logs', nargs='*', help='Tester fail logs to diagnose')
+    args = parser.parse_args()
+
+    config = parse_config(args.config)
+    fault_model = args.fault_model or (config.fault_model if config.fault_model in MODEL_TYPES else "stuck")
+    faults_file = args.faults or (config.faults_file if os.path.isfile(config.faults_file) else None)
+    patterns_file = args.patterns or config.patterns_file
+    dictionary = open_dictionary(args.netlist or config.netlist_file, patterns_file, fault_model, faults_file,
+                                 args.dictionary, args.jobs, config.top_module, args.rebuild)
+    print(f"{dictionary.num_faults} faults, {dictionary.num_patterns} patterns, {dictionary.num_points} observe points")
+    dictionary.close()
+    if args.fail_logs:
+        diagnose_logs(args.dictionary or patterns_file + DICT_SUFFIX, args.fail_logs, args.output, args.jobs,
+                      args.applied, args.top, args.prefilter)
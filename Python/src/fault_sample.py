@@ -0,0 +1,264 @@
+import json
+import math
+import random
+import argparse
+from array import array
+from statistics import NormalDist
+from config_parser import Config, parse_config
+from netlist_graph import open_graph
+from fault_collapse import FAULT_TYPES, FaultCollapser
+from fault_db import FAULT_CLASSES, read_faults
+
+# Statistical fault sampling.
+# Instead of the whole fault universe, ATPG / fault simulation targets a
+# stratified random sample read with read_faults. The faults (every pin
+# fault, or the structurally collapsed classes with structural_collapsing)
+# are split into strata by module (the first `depth` levels of the instance
+# path) and cell type; every stratum gets its share of the sample, at least
+# one fault. Strata whose share is below one fault are merged, smallest
+# first, into one stratum of their own (with the next smallest while that
+# one's share is still below a fault), so the sample keeps its size whatever
+# the number of strata. The sample size is the smallest one whose confidence interval
+# on the test coverage is at most +-sample_precision percent at
+# sample_confidence, sized for coverages of 90% and up.
+#
+# The strata of the sample are kept next to it (<sample>.strata.json). After
+# the run, `estimate` reads the fault list tmax wrote and estimates the test
+# and fault coverage of the whole universe (stratified ratio estimator, DT
+# counts 1, PT 0.5, UD leaves the test coverage denominator) with Wilson
+# score intervals on the effective sample size. `metrics_store.py record`
+# stores that estimate with the run.
+
+PLANNING_COVERAGE = 0.9
+STRATA_SUFFIX = ".strata.json"
+
+# Function to compute the sample size for a coverage precision.
+# precision: half width of the interval in percent.
+def sample_size(population, precision=0.5, confidence=0.95, expected=PLANNING_COVERAGE):
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    n0 = z * z * expected * (1 - expected) / (precision / 100.0) ** 2
+    # finite population correction
+    return min(population, max(1, math.ceil(n0 / (1 + (n0 - 1) / population))))
+
+# Function to pick the strata to merge for a sample size: those whose share
+# is below one fault, smallest first, and the next smallest ones until the
+# merged share reaches a fault. Returns their indices.
+def small_strata(sizes, n):
+    total = sum(sizes)
+    merged = []
+    pooled = 0
+    for h in sorted(range(len(sizes)), key=lambda h: sizes[h]):
+        if sizes[h] * n >= total and (not merged or pooled * n >= total):
+            break
+        merged.append(h)
+        pooled += sizes[h]
+    return merged
+
+# Function to split a sample size over strata in proportion to their sizes,
+# at least one fault per stratum (largest remainders get the rest). With
+# the small strata merged first every share is a fault or more, so the
+# sample stays at n.
+def allocate(sizes, n):
+    total = sum(sizes)
+    shares = [n * size / total for size in sizes]
+    counts = [min(size, max(1, int(share))) for size, share in zip(sizes, shares)]
+    order = sorted(range(len(sizes)), key=lambda h: shares[h] - int(shares[h]), reverse=True)
+    while sum(counts) < min(n, total):
+        grown = False
+        for h in order:
+            if sum(counts) >= n:
+                break
+            if counts[h] < sizes[h]:
+                counts[h] += 1
+                grown = True
+        if not grown:
+            break
+    return counts
+
+# Function to write a stratified sample of the fault universe in the
+# read_faults format. Returns (population, sample size, strata).
+def draw_sample(graph, sample_file, fault_model="stuck", collapsed=False, precision=0.5, confidence=0.95,
+                seed=1, depth=1, size=None):
+    collapser = FaultCollapser(graph, fault_model, dominance=collapsed)
+    if collapsed:
+        collapser.collapse()
+    types = FAULT_TYPES[fault_model]
+
+    keys = {}
+    members = []
+    for f in range(len(collapser.parent)):
+        if collapser.find(f) != f or collapser.dropped[f]:
+            continue
+        c = graph.pin_cell(f >> 1)
+        if graph.is_port(c):
+            key = ("<ports>", graph.cell_type_name(c))
+        else:
+            path = graph.cell_name(c).split("/")[:-1]
+            key = ("/".join(path[:depth]) or graph.top, graph.cell_type_name(c))
+        h = keys.get(key)
+        if h is None:
+            h = keys[key] = len(members)
+            members.append(array("i"))
+        members[h].append(f)
+
+    population = sum(len(rows) for rows in members)
+    n = size or sample_size(population, precision, confidence)
+    strata = [{"module": module, "cell": cell} for module, cell in keys]
+    merged = sorted(small_strata([len(rows) for rows in members], n))
+    if len(merged) > 1:
+        pooled = array("i")
+        for h in merged:
+            pooled.extend(members[h])
+        kept = [h for h in range(len(members)) if h not in set(merged)]
+        strata = [strata[h] for h in kept] + [
+            {"module": "<merged>", "cell": "<merged>", "merged": [strata[h] for h in merged]}]
+        members = [members[h] for h in kept] + [pooled]
+    counts = allocate([len(rows) for rows in members], n)
+    rng = random.Random(seed)
+    faults = {}
+    with open(sample_file, "w") as out:
+        for h, stratum in enumerate(strata):
+            stratum.update(population=len(members[h]), sample=counts[h])
+            for f in sorted(rng.sample(members[h], counts[h])):
+                name = collapser.fault_name(f)
+                out.write(f"{types[f & 1]} NC {name}\n")
+                faults[f"{types[f & 1]} {name}"] = h
+    with open(sample_file + STRATA_SUFFIX, "w") as f:
+        json.dump({"fault_model": fault_model, "collapsed": collapsed, "population": population,
+                   "precision": precision, "confidence": confidence, "seed": seed, "strata": strata,
+                   "faults": faults}, f)
+    return population, sum(counts), strata
+
+# Function to name the sample fault list of a config
+def sample_fault_list(config: Config, fault_model=None):
+    return f"{config.top_module}_{fault_model or config.fault_model}_sample.fault"
+
+# Function to draw the sample the ATPG generators read for a config
+def write_fault_sample(config: Config, fault_model, sample_file):
+    graph = open_graph(config.netlist_file, top=config.top_module)
+    try:
+        population, n, strata = draw_sample(graph, sample_file, fault_model, config.structural_collapsing,
+                                            config.sample_precision, config.sample_confidence, config.sample_seed)
+    finally:
+        graph.close()
+    print(f"{fault_model} fault sample: {n} of {population} faults ({100.0 * n / max(population, 1):.2f}%) "
+          f"in {len(strata)} strata written to {sample_file}")
+    return sample_file
+
+# Function to compute the Wilson score interval of a proportion
+def wilson_interval(p, n, z):
+    if n <= 0:
+        return 0.0, 1.0
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - half), min(1.0, center + half)
+
+# Function to estimate the coverage of the universe from a sampled run.
+# counts: per stratum {"DT", "PT", "UD", "other"} fault counts.
+def estimate_coverage(strata, counts, confidence=0.95):
+    population = sum(stratum["population"] for stratum in strata)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    detected = eligible = 0.0
+    measured = []
+    for stratum, count in zip(strata, counts):
+        n = sum(count.values())
+        if n == 0:
+            continue
+        weight = stratum["population"] / population
+        d = (count["DT"] + 0.5 * count["PT"]) / n
+        e = (n - count["UD"]) / n
+        detected += weight * d
+        eligible += weight * e
+        measured.append((stratum, count, n, weight, d, e))
+    if not measured:
+        raise ValueError("No sampled fault found in the fault list")
+    tc = detected / eligible if eligible else 0.0
+
+    # linearized variances of the fault coverage (d) and of the ratio d / e
+    var_fc = var_tc = 0.0
+    samples = 0
+    for stratum, count, n, weight, d, e in measured:
+        samples += n
+        if n < 2:
+            continue
+        fpc = 1 - n / stratum["population"]
+        values = [(1.0, 1.0, count["DT"]), (0.5, 1.0, count["PT"]), (0.0, 0.0, count["UD"]), (0.0, 1.0, count["other"])]
+        s_fc = sum(k * (v - d) ** 2 for v, _, k in values) / (n - 1)
+        z_mean = d - tc * e
+        s_tc = sum(k * (v - tc * w - z_mean) ** 2 for v, w, k in values) / (n - 1)
+        var_fc += weight * weight * fpc * s_fc / n
+        var_tc += weight * weight * fpc * s_tc / n / (eligible * eligible)
+
+    def interval(p, variance):
+        # Wilson interval on the effective sample size of the design
+        n_eff = p * (1 - p) / variance if variance > 0 else samples
+        low, high = wilson_interval(p, min(n_eff, population), z)
+        return {"estimate": 100 * p, "low": 100 * low, "high": 100 * high, "effective_n": n_eff}
+
+    return {"population": population, "sampled": samples, "confidence": confidence,
+            "test_coverage": interval(tc, var_tc), "fault_coverage": interval(detected, var_fc)}
+
+# Function to count the fault classes of a tmax fault list per stratum
+def count_classes(faults_file, sample_info):
+    lookup = sample_info["faults"]
+    counts = [{"DT": 0, "PT": 0, "UD": 0, "other": 0} for _ in sample_info["strata"]]
+    for model, code, pin, equivalent in read_faults(faults_file):
+        h = lookup.get(f"{model} {pin}")
+        if h is None or equivalent:
+            continue
+        fault_class = FAULT_CLASSES.get(code, "ND")
+        counts[h][fault_class if fault_class in ("DT", "PT", "UD") else "other"] += 1
+    return counts
+
+# Main function
+def estimate_from_run(sample_file, faults_file, confidence=None):
+    with open(sample_file + STRATA_SUFFIX) as f:
+        sample_info = json.load(f)
+    confidence = confidence or sample_info["confidence"]
+    counts = count_classes(faults_file, sample_info)
+    result = estimate_coverage(sample_info["strata"], counts, confidence)
+    for name in ("test_coverage", "fault_coverage"):
+        value = result[name]
+        print(f"{name.replace('_', ' ')}: {value['estimate']:.3f}%  [{value['low']:.3f}%, {value['high']:.3f}%] "
+              f"at {100 * confidence:g}% confidence")
+    print(f"{result['sampled']} of {result['population']} faults sampled "
+          f"(effective sample size {result['test_coverage']['effective_n']:.0f})")
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Draw a stratified fault sample and estimate coverage with confidence intervals.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    draw_parser = subparsers.add_parser('draw', help='Write a stratified sample of the fault universe')
+    draw_parser.add_argument('--fault_model', choices=sorted(FAULT_TYPES), default=None, help='Fault model (default: from config)')
+    draw_parser.add_argument('--output', default=None, help='Sample fault list (default: <top>_<model>_sample.fault)')
+    draw_parser.add_argument('--size', type=int, default=None, help='Sample size instead of sizing it for the precision')
+    draw_parser.add_argument('--depth', type=int, default=1, help='Instance path levels that make a module stratum (default: 1)')
+    size_parser = subparsers.add_parser('size', help='Print the sample size for a fault universe')
+    size_parser.add_argument('population', type=int, help='Number of faults')
+    estimate_parser = subparsers.add_parser('estimate', help='Estimate the coverage from the fault list of a sampled run')
+    estimate_parser.add_argument('--sample', default=None, help='Sample fault list (default: <top>_<model>_sample.fault)')
+    estimate_parser.add_argument('--faults', default=None, help='Fault list tmax wrote (default: faults_file)')
+    args = parser.parse_args()
+
+    config = parse_config(args.config)
+    if args.command == 'size':
+        n = sample_size(args.population, config.sample_precision, config.sample_confidence)
+        print(f"{n} faults for +-{config.sample_precision:g}% at {100 * config.sample_confidence:g}% confidence")
+    elif args.command == 'draw':
+        model = args.fault_model or config.fault_model
+        if model not in FAULT_TYPES:
+            parser.error(f"fault sampling supports {', '.join(sorted(FAULT_TYPES))}, not {model}")
+        output_file = args.output or sample_fault_list(config, model)
+        graph = open_graph(config.netlist_file, top=config.top_module)
+        try:
+            population, n, strata = draw_sample(graph, output_file, model, config.structural_collapsing,
+                                                config.sample_precision, config.sample_confidence,
+                                                config.sample_seed, args.depth, args.size)
+        finally:
+            graph.close()
+        print(f"{n} of {population} faults in {len(strata)} strata written to {output_file}")
+    else:
+        sample_file = args.sample or sample_fault_list(config)
+        estimate_from_run(sample_file, args.faults or config.faults_file)
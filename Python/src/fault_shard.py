@@ -0,0 +1,178 @@
+import os
+import copy
+import heapq
+import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from config_parser import Config, parse_config
+from atpg import ATPG_GENERATORS, BaseATPGScriptGenerator
+from faultsim import FAULT_SIM_GENERATORS, BaseFaultSimScriptGenerator
+from fault_db import open_faults
+from campaign import TMAX, job_config, run_tool
+from stage_cache import StageCache, DEFAULT_CACHE_DIR, run_cached
+
+# Distributed ATPG over fault list shards.
+# The collapsed fault list is split into N balanced shards, every shard gets
+# its own atpg.tcl that reads only its slice (read_faults), the shards run
+# concurrently, and a final tmax run merges the shard patterns and fault
+# simulates them against the whole list. The merge step also credits faults
+# a shard left undetected but another shard's patterns detect.
+
+# Function to write a TCL script that only enumerates the collapsed fault
+# universe of a generator's fault model into faults_file
+def write_fault_universe_tcl(generator: BaseATPGScriptGenerator, faults_file: str, output_file: str):
+    with open(output_file, "w") as file:
+        generator.set(file)
+        generator.set_fault(file)
+        generator.set_delay_option(file)
+        generator.add_fault(file)
+        file.write(f"write_faults {faults_file} -collapsed -all -replace\n\n")
+        file.write("exit")
+
+# Function to split the fault database into balanced shards.
+# A primary fault always stays together with its "--" equivalents.
+# key="instance" keeps each hierarchy prefix (first `depth` path levels) in
+# one shard and balances the groups largest first; key="count" cuts the list
+# into contiguous slices of equal size.
+def shard_faults(db, num_shards, key="instance", depth=1):
+    units = list(db.units())
+    total = len(db)
+    shards = [array("I") for _ in range(num_shards)]
+    if key == "count":
+        for start, end in units:
+            shards[min(num_shards - 1, start * num_shards // total)].extend(range(start, end))
+        return shards
+
+    groups = {}
+    for start, end in units:
+        pin = db.pins[db.pin_ids[start]]
+        prefix = "/".join(pin.split("/")[:depth]) if pin.count("/") >= depth else ""
+        groups.setdefault(prefix, array("I")).extend(range(start, end))
+    # longest processing time first: biggest group onto the lightest shard
+    loads = [(0, i) for i in range(num_shards)]
+    for rows in sorted(groups.values(), key=len, reverse=True):
+        load, i = heapq.heappop(loads)
+        shards[i].extend(rows)
+        heapq.heappush(loads, (load + len(rows), i))
+    for rows in shards:
+        # keep file order so "--" rows follow their primary
+        rows[:] = array("I", sorted(rows))
+    return shards
+
+class MergeFaultSimMixin:
+    # Fault simulates the concatenated shard patterns against the full list.
+    # Mixed in front of the fault model's FaultSim generator.
+    def __init__(self, config: Config, pattern_files):
+        super().__init__(config)
+        self.pattern_files = pattern_files
+
+    def set_pattern(self, file):
+        for index, pattern_file in enumerate(self.pattern_files):
+            file.write(f"set_patterns -external {pattern_file}{' -append' if index else ''}\n")
+        self.set_pattern_option(file)
+
+    def write_output(self, file):
+        file.write(f"report_summaries\n")
+        file.write(f"report_summaries > {self.config.summary_file}\n\n")
+        file.write(f"write_faults {self.config.faults_file} -all -replace\n\n")
+        file.write(f"write_patterns {self.config.patterns_file} -external -format STIL -replace\n\n")
+        file.write("exit")
+
+# Function to build the merge generator class of a fault model
+def merge_generator(model):
+    base = FAULT_SIM_GENERATORS.get(model, BaseFaultSimScriptGenerator)
+    return type(f"Merge{base.__name__}", (MergeFaultSimMixin, base), {})
+
+# Function to run ATPG on one shard in its own directory
+def run_shard(config: Config, fault_list: str, job_dir: str, cache: StageCache, force=False):
+    os.makedirs(job_dir, exist_ok=True)
+    os.chdir(job_dir)
+    generator = ATPG_GENERATORS.get(config.fault_model, BaseATPGScriptGenerator)(copy.copy(config))
+    generator.fault_list = fault_list
+    generator.generate_tcl("atpg.tcl")
+    return run_cached(cache, "atpg", "atpg.tcl", config,
+                      lambda: run_tool(f"{TMAX} atpg.tcl", "atpg.log", job_dir),
+                      force=force, cwd=job_dir, extra_inputs=[fault_list])
+
+# Main function
+def run_sharded_atpg(config_file, num_shards=4, slots=4, key="instance", depth=1, work_dir="shards",
+                     base_dir=".", faults_file=None, cache_dir=DEFAULT_CACHE_DIR, force=False):
+    config = parse_config(config_file)
+    model = config.fault_model
+    base_dir = os.path.abspath(base_dir)
+    work_dir = os.path.abspath(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    cache = StageCache(os.path.abspath(cache_dir))
+    merged = job_config(config, model, work_dir, base_dir, tag=f"{model}_merged")
+
+    # collapsed fault universe, enumerated by tmax unless given
+    if faults_file is None:
+        faults_file = os.path.join(work_dir, f"{config.top_module}_{model}_universe.fault")
+        tcl_file = os.path.join(work_dir, "fault_universe.tcl")
+        # bridging/path delay generators write their side files into the cwd
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        generator = ATPG_GENERATORS.get(model, BaseATPGScriptGenerator)(copy.copy(merged))
+        write_fault_universe_tcl(generator, faults_file, tcl_file)
+        os.chdir(cwd)
+        print("Enumerating the collapsed fault list with tmax...")
+        if run_tool(f"{TMAX} {tcl_file}", os.path.join(work_dir, "fault_universe.log"), work_dir) != 0:
+            print("Error: fault enumeration failed, see fault_universe.log.")
+            return None
+
+    db = open_faults(faults_file)
+    shards = [rows for rows in shard_faults(db, num_shards, key, depth) if len(rows)]
+    print(f"Split {len(db)} faults into {len(shards)} shards: {', '.join(str(len(rows)) for rows in shards)}")
+
+    jobs = []
+    for index, rows in enumerate(shards):
+        job_dir = os.path.join(work_dir, f"shard{index}")
+        os.makedirs(job_dir, exist_ok=True)
+        fault_list = os.path.join(job_dir, f"{config.top_module}_{model}_shard{index}_in.fault")
+        db.write(fault_list, rows, codes=False)
+        jobs.append((job_config(config, model, job_dir, base_dir, tag=f"{model}_shard{index}"), fault_list, job_dir))
+
+    failed = False
+    with ProcessPoolExecutor(max_workers=max(1, min(slots, len(jobs)))) as pool:
+        futures = {pool.submit(run_shard, job, fault_list, job_dir, cache, force): job_dir
+                   for job, fault_list, job_dir in jobs}
+        for future in as_completed(futures):
+            returncode = future.result()
+            failed |= returncode != 0
+            print(f"{os.path.basename(futures[future])}: {'ok' if returncode == 0 else 'FAILED'}")
+    if failed:
+        print("Error: at least one shard failed, not merging.")
+        return None
+
+    # merged fault list is the concatenation of the shard results
+    with open(merged.faults_file, "w") as out:
+        for job, _, _ in jobs:
+            with open(job.faults_file) as f:
+                for line in f:
+                    out.write(line)
+    tcl_file = os.path.join(work_dir, "merge.tcl")
+    merge_generator(model)(copy.copy(merged), [job.patterns_file for job, _, _ in jobs]).generate_tcl(tcl_file)
+    print("Merging shard patterns and fault simulating the full list...")
+    if run_tool(f"{TMAX} {tcl_file}", os.path.join(work_dir, "merge.log"), work_dir) != 0:
+        print("Error: merge failed, see merge.log.")
+        return None
+    print(f"Merged faults: {merged.faults_file}, patterns: {merged.patterns_file}")
+    return merged
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run ATPG over balanced fault list shards in parallel and merge the results.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--shards', type=int, default=4, help='Number of fault list shards (default: 4)')
+    parser.add_argument('--slots', type=int, default=4, help='Maximum number of concurrent tmax jobs / licenses (default: 4)')
+    parser.add_argument('--key', choices=['instance', 'count'], default='instance', help='Balance key (default: instance)')
+    parser.add_argument('--depth', type=int, default=1, help='Hierarchy levels forming an instance group (default: 1)')
+    parser.add_argument('--faults', default=None, help='Collapsed fault list to shard (default: enumerate with tmax)')
+    parser.add_argument('--work_dir', default='shards', help='Directory holding one sub-directory per shard (default: shards)')
+    parser.add_argument('--base_dir', default='.', help='Directory the relative paths in config.txt refer to (default: .)')
+    parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help=f'Stage cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--force', action='store_true', help='Run every shard even if its outputs are cached')
+    args = parser.parse_args()
+    merged = run_sharded_atpg(args.config, args.shards, args.slots, args.key, args.depth, args.work_dir,
+                              args.base_dir, args.faults, args.cache_dir, args.force)
+    if merged is None:
+        raise SystemExit(1)
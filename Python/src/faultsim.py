@@ -65,7 +65,12 @@ class BaseFaultSimScriptGenerator:
 
     def add_fault(self, file):
         # Add fault list to ATPG
+        if self.config.fault_sampling:
+            # only the sampled faults ATPG wrote, read above
+            return
         file.write("add_faults -all\n\n")
+        if self.config.remove_fault:
+            file.write(f"remove_faults -retain_sample {100 - self.config.remove_fault}\n\n")
         
     def set_atpg_option(self, file):
         # inheritance
@@ -152,21 +157,22 @@ class BridgingFaultSimScriptGenerator(BaseFaultSimScriptGenerator):
 
 ## Path-delay and Hold Time don't have
 
+# Generator class for each fault model that can be fault simulated
+FAULT_SIM_GENERATORS = {
+    "stuck": StuckFaultSimScriptGenerator,
+    "transition": TransitionFaultSimScriptGenerator,
+    "bridging": BridgingFaultSimScriptGenerator,
+}
+
 if __name__ == "__main__":
     config_file = "../../Python/src/config.txt"
     config = parse_config(config_file)
 
     output_file = "../../Script/tcl/faultsim.tcl"
     
-    if config.fault_model == "stuck":
-        generator = StuckFaultSimScriptGenerator(config)
-    elif config.fault_model == "transition":
-        generator = TransitionFaultSimScriptGenerator(config)
-    elif config.fault_model == "bridging":
-        generator = BridgingFaultSimScriptGenerator(config)
-    else:
+    if config.fault_model not in FAULT_SIM_GENERATORS:
         raise NameError("Do not support other fault models")
-        generator = BaseFaultSimScriptGenerator(config)
+    generator = FAULT_SIM_GENERATORS[config.fault_model](config)
         
     generator.generate_tcl(output_file)
 
@@ -1,25 +1,52 @@
+import math
 import random
-import re
 import argparse
+from verilog_reader import leaf_instances
 
-# Function to extract gates/nodes from a netlist file
+# Function to extract gates/nodes from a netlist file.
+# Every leaf cell instance is returned with its hierarchical path, so
+# multi-line port lists, escaped names and `-hier` netlists are all covered.
 def extract_nodes(netlist_file):
-    nodes = set()
-    with open(netlist_file, 'r') as f:
-        for line in f:
-            # Match gates and their identifiers, assuming format like: INVXL U58 ( .A(X_6), .Y(n60) );
-            match = re.search(r'\b(\w+)\s+(U\d+)\s*\(', line)
-            if match:
-                # print(match)
-                gate_name = match.group(2)  # Extract the gate identifier (e.g., U58)
-                nodes.add(gate_name)
-    return list(nodes)
-
-# Function to randomly select pairs of nodes
-def generate_random_pairs(nodes, num_pairs):
-    if len(nodes) < 2:
+    nodes = {path for path, _ in leaf_instances(netlist_file)}
+    # sorted so that a seeded run picks the same pairs every time
+    return sorted(nodes)
+
+# Function to map a pair index back to two distinct node indices.
+# Ordered pairs: index = a * (n - 1) + j, where b = j skips over a.
+# Unordered pairs: index enumerates the strict upper triangle row by row,
+# row a holding the n - 1 - a pairs (a, a+1) ... (a, n-1).
+def _pair_from_index(index, n, dedup):
+    if not dedup:
+        a, j = divmod(index, n - 1)
+        return a, (j if j < a else j + 1)
+    # invert index = a * (2n - a - 1) / 2 + (b - a - 1)
+    a = int(((2 * n - 1) - math.sqrt((2 * n - 1) ** 2 - 8 * index)) // 2)
+    # correct floating point drift on very large n
+    while a > 0 and a * (2 * n - a - 1) // 2 > index:
+        a -= 1
+    while (a + 1) * (2 * n - a - 2) // 2 <= index:
+        a += 1
+    b = index - a * (2 * n - a - 1) // 2 + a + 1
+    return a, b
+
+# Function to randomly select pairs of nodes.
+# Distinct pair indices are drawn straight from index space (random.sample
+# over a range never builds the population), so memory and runtime follow
+# num_pairs instead of len(nodes) ** 2.
+# dedup=True treats (a, b) and (b, a) as the same bridge.
+def generate_random_pairs(nodes, num_pairs, seed=None, dedup=False):
+    n = len(nodes)
+    if n < 2:
         raise ValueError("Not enough nodes to form pairs.")
-    return random.sample([(a, b) for a in nodes for b in nodes if a != b], num_pairs)
+    total = n * (n - 1) // 2 if dedup else n * (n - 1)
+    if num_pairs > total:
+        raise ValueError(f"Cannot draw {num_pairs} distinct pairs from {n} nodes (at most {total}).")
+    rng = random.Random(seed)
+    pairs = []
+    for index in rng.sample(range(total), num_pairs):
+        a, b = _pair_from_index(index, n, dedup)
+        pairs.append((nodes[a], nodes[b]))
+    return pairs
 
 # Function to save pairs to a file
 def save_pairs_to_file(pairs, output_file):
@@ -28,7 +55,7 @@ def save_pairs_to_file(pairs, output_file):
             f.write(f"{pair[0]} {pair[1]}\n")
 
 # Main function
-def generate_bridging_site(netlist_file, num_pairs=1000):
+def generate_bridging_site(netlist_file, num_pairs=1000, seed=None, dedup=False):
     output_file = "nodes.txt"
 
     print("Extracting nodes from netlist...")
@@ -39,7 +66,7 @@ def generate_bridging_site(netlist_file, num_pairs=1000):
         return
 
     print(f"Found {len(nodes)} nodes. Generating {num_pairs} random pairs...")
-    pairs = generate_random_pairs(nodes, num_pairs)
+    pairs = generate_random_pairs(nodes, num_pairs, seed=seed, dedup=dedup)
 
     print(f"Saving pairs to {output_file}...")
     save_pairs_to_file(pairs, output_file)
@@ -50,5 +77,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Generate random pairs of nodes from a netlist file.')
     parser.add_argument('netlist_file', help='Path to the netlist file')
     parser.add_argument('--num_pairs', type=int, default=1000, help='Number of random pairs to generate (default: 1000)')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for the random generator (default: unseeded)')
+    parser.add_argument('--dedup', action='store_true', help='Treat (a, b) and (b, a) as the same bridge')
     args = parser.parse_args()
-    generate_bridging_site(args.netlist_file, args.num_pairs)
+    generate_bridging_site(args.netlist_file, args.num_pairs, seed=args.seed, dedup=args.dedup)
@@ -0,0 +1,174 @@
+import heapq
+import argparse
+from gen_bridging_site import save_pairs_to_file
+
+# Bridging sites from SPEF coupling capacitance.
+# Two nets only bridge if they run next to each other, and the coupling caps
+# extracted into the *_dft.spef file say exactly which nets do. The SPEF is
+# streamed line by line and only the top-K pairs are kept in a bounded heap,
+# so the file can be far larger than memory. Only the pin to net map of the
+# *CONN sections is held, which a first pass over the file builds.
+
+# Function to turn a SPEF value (plain or min:typ:max triplet) into a float
+def _parse_value(value):
+    parts = value.split(":")
+    return float(parts[1] if len(parts) == 3 else parts[0])
+
+# Function to strip SPEF escapes, e.g. data\[3\] -> data[3]
+def _unescape(name):
+    return name.replace("\\", "") if "\\" in name else name
+
+# Function to map every instance pin node (e.g. *3:A) to the net it sits on.
+# Pin nodes only carry the instance name, so the *I entries of each *CONN
+# section are the one place that says which net they belong to.
+def read_pin_nets(spef_file):
+    net = None
+    in_conn = False
+    pin_nets = {}
+    with open(spef_file, "r", buffering=1 << 22) as f:
+        for line in f:
+            if not line.startswith("*"):
+                continue
+            keyword = line.split(None, 1)[0]
+            if keyword == "*I" and in_conn:
+                pin_nets[line.split()[1]] = net
+            elif keyword == "*CONN":
+                in_conn = True
+            elif keyword == "*D_NET":
+                net = line.split()[1]
+                in_conn = False
+            elif keyword != "*P":
+                in_conn = False
+    return pin_nets
+
+# Function to stream the coupling capacitance of every D_NET.
+# Yields (net_a, net_b, value) with the caps between the two nets summed up
+# over all their subnodes. Both nodes of a cap are mapped to their net, so it
+# does not matter which side the local net is written on: pin nodes through
+# pin_nets, internal nodes (net:3) by their net part, ports are net names.
+# Nets are returned as written in the SPEF, i.e. name map references like *12
+# are not resolved here.
+def read_coupling_caps(spef_file, pin_nets=None):
+    if pin_nets is None:
+        pin_nets = read_pin_nets(spef_file)
+    delimiter = ":"
+    in_cap = False
+    coupling = {}
+
+    def node_net(node):
+        if node in pin_nets:
+            return pin_nets[node]
+        if delimiter in node:
+            net, index = node.rsplit(delimiter, 1)
+            if index.isdigit():
+                return net
+            # a pin that no *CONN section lists
+            return None
+        return node
+
+    with open(spef_file, "r", buffering=1 << 22) as f:
+        for line in f:
+            if not line.startswith("*"):
+                if in_cap:
+                    fields = line.split()
+                    # id node1 node2 value; ground caps only have three fields
+                    if len(fields) == 4:
+                        a = node_net(fields[1])
+                        b = node_net(fields[2])
+                        if a is not None and b is not None and a != b:
+                            pair = (a, b) if a < b else (b, a)
+                            coupling[pair] = coupling.get(pair, 0.0) + _parse_value(fields[3])
+                continue
+            keyword = line.split(None, 1)[0]
+            if keyword == "*CAP":
+                in_cap = True
+            elif keyword == "*END":
+                for (a, b), value in coupling.items():
+                    yield a, b, value
+                coupling.clear()
+                in_cap = False
+            elif keyword == "*DELIMITER":
+                delimiter = line.split()[1]
+            else:
+                # *D_NET, *RES, *CONN, *INDUC, header keywords, ...
+                in_cap = False
+
+# Function to keep the K strongest couplings.
+# Each unordered pair is usually reported twice (once per net), so a pair
+# already in the heap is only updated when the new value is larger; outdated
+# heap entries are dropped lazily.
+def top_coupled_pairs(caps, num_pairs):
+    if num_pairs <= 0:
+        return []
+    heap = []
+    best = {}
+    for a, b, value in caps:
+        pair = (a, b) if a < b else (b, a)
+        if pair in best:
+            if value <= best[pair]:
+                continue
+        elif len(best) >= num_pairs:
+            # drop stale entries before comparing with the weakest pair
+            while heap[0][0] != best.get(heap[0][1]):
+                heapq.heappop(heap)
+            if value <= heap[0][0]:
+                continue
+            del best[heapq.heappop(heap)[1]]
+        best[pair] = value
+        heapq.heappush(heap, (value, pair))
+        if len(heap) > 2 * num_pairs:
+            heap = [(v, p) for p, v in best.items()]
+            heapq.heapify(heap)
+    return sorted(((a, b, v) for (a, b), v in best.items()), key=lambda item: -item[2])
+
+# Function to resolve *N name map references for the given nets only.
+# Only the *NAME_MAP section at the head of the file is read again.
+def resolve_names(spef_file, nets):
+    wanted = {net for net in nets if net.startswith("*")}
+    names = {}
+    in_map = False
+    with open(spef_file, "r", buffering=1 << 22) as f:
+        for line in f:
+            if not wanted:
+                break
+            if not in_map:
+                if line.startswith("*NAME_MAP"):
+                    in_map = True
+                elif line.startswith("*D_NET"):
+                    break
+                continue
+            fields = line.split()
+            if not fields:
+                continue
+            # the map ends at the next section keyword (*PORTS, *D_NET, ...)
+            if len(fields) < 2 or not fields[0][1:].isdigit():
+                break
+            if fields[0] in wanted:
+                names[fields[0]] = fields[1]
+                wanted.discard(fields[0])
+    return {net: _unescape(names.get(net, net)) for net in nets}
+
+# Main function
+def generate_spef_bridging_site(spef_file, num_pairs=1000, output_file="nodes.txt"):
+    print("Streaming coupling capacitance from SPEF...")
+    pairs = top_coupled_pairs(read_coupling_caps(spef_file), num_pairs)
+
+    if not pairs:
+        print("Error: No coupling capacitance found in the SPEF file.")
+        return
+
+    names = resolve_names(spef_file, {net for a, b, _ in pairs for net in (a, b)})
+    pairs = [(names[a], names[b]) for a, b, _ in pairs]
+
+    print(f"Saving {len(pairs)} strongest coupled pairs to {output_file}...")
+    save_pairs_to_file(pairs, output_file)
+
+    print(f"Coupled pairs saved to {output_file}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate bridging sites from SPEF coupling capacitance.')
+    parser.add_argument('spef_file', help='Path to the SPEF file')
+    parser.add_argument('--num_pairs', type=int, default=1000, help='Number of strongest coupled pairs to keep (default: 1000)')
+    parser.add_argument('--output', default='nodes.txt', help='Output node file (default: nodes.txt)')
+    args = parser.parse_args()
+    generate_spef_bridging_site(args.spef_file, args.num_pairs, args.output)
@@ -0,0 +1,107 @@
+import os
+import copy
+import shutil
+import argparse
+from config_parser import parse_config
+from atpg import ATPG_GENERATORS, BaseATPGScriptGenerator
+from faultsim import FAULT_SIM_GENERATORS
+from fault_db import open_faults
+from fault_shard import merge_generator
+from campaign import TMAX, job_config, run_tool
+from stage_cache import StageCache, DEFAULT_CACHE_DIR, run_cached
+
+# Incremental (top-up) ATPG.
+# After a change to capture_cycle, n_detect, compression, ... the previous
+# patterns usually still detect most faults. The previous patterns are fault
+# simulated under the new settings first, ATPG then only targets the faults
+# that are still undetected, and the top-up patterns are appended to the
+# previous set by a final fault simulation over both pattern files.
+
+REMAINING_CLASSES = ("UD", "ND", "AU")
+
+# Main function
+def run_incremental_atpg(config_file, previous_faults=None, previous_patterns=None, classes=REMAINING_CLASSES,
+                         work_dir="incremental", base_dir=".", cache_dir=DEFAULT_CACHE_DIR, force=False):
+    config = parse_config(config_file)
+    model = config.fault_model
+    if model not in FAULT_SIM_GENERATORS:
+        print(f"Error: incremental ATPG needs fault simulation, which {model} does not support.")
+        return None
+    base_dir = os.path.abspath(base_dir)
+    work_dir = os.path.abspath(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    cache = StageCache(os.path.abspath(cache_dir))
+    final = job_config(config, model, work_dir, base_dir)
+    for field in ("faults_file", "patterns_file", "summary_file"):
+        setattr(final, field, os.path.normpath(os.path.join(base_dir, getattr(config, field))))
+
+    # snapshot the previous results; the final step overwrites them
+    previous = job_config(config, model, work_dir, base_dir, tag=f"{model}_previous")
+    shutil.copyfile(previous_faults or final.faults_file, previous.faults_file)
+    shutil.copyfile(previous_patterns or final.patterns_file, previous.patterns_file)
+
+    # 1. fault simulate the previous patterns under the new settings
+    resim = job_config(config, model, work_dir, base_dir, tag=f"{model}_resim")
+    resim.patterns_file = previous.patterns_file
+    shutil.copyfile(previous.faults_file, resim.faults_file)
+    tcl_file = os.path.join(work_dir, "resim.tcl")
+    FAULT_SIM_GENERATORS[model](copy.copy(resim)).generate_tcl(tcl_file)
+    print("Fault simulating the previous patterns...")
+    if run_tool(f"{TMAX} {tcl_file}", os.path.join(work_dir, "resim.log"), work_dir) != 0:
+        print("Error: fault simulation of the previous patterns failed, see resim.log.")
+        return None
+
+    # 2. keep only the faults the previous patterns leave undetected
+    db = open_faults(resim.faults_file)
+    rows = sorted(row for fault_class in classes for row in db.select(fault_class))
+    print(f"{len(rows)} of {len(db)} faults remain in {'/'.join(classes)}")
+    if not rows:
+        shutil.copyfile(resim.faults_file, final.faults_file)
+        shutil.copyfile(previous.patterns_file, final.patterns_file)
+        print("Nothing left to target, previous patterns kept.")
+        return final
+    remaining = os.path.join(work_dir, f"{config.top_module}_{model}_remaining.fault")
+    db.write(remaining, rows, codes=False)
+
+    # 3. top-up ATPG on the remaining faults only
+    topup = job_config(config, model, work_dir, base_dir, tag=f"{model}_topup")
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    generator = ATPG_GENERATORS.get(model, BaseATPGScriptGenerator)(copy.copy(topup))
+    generator.fault_list = remaining
+    generator.generate_tcl("atpg.tcl")
+    print("Running top-up ATPG...")
+    returncode = run_cached(cache, "atpg", "atpg.tcl", topup,
+                            lambda: run_tool(f"{TMAX} atpg.tcl", "atpg.log", work_dir),
+                            force=force, cwd=work_dir, extra_inputs=[remaining])
+    os.chdir(cwd)
+    if returncode != 0:
+        print("Error: top-up ATPG failed, see atpg.log.")
+        return None
+
+    # 4. previous + top-up patterns, fault simulated against the full list
+    shutil.copyfile(resim.faults_file, final.faults_file)
+    tcl_file = os.path.join(work_dir, "append.tcl")
+    merge_generator(model)(copy.copy(final), [previous.patterns_file, topup.patterns_file]).generate_tcl(tcl_file)
+    print("Appending top-up patterns to the previous set...")
+    if run_tool(f"{TMAX} {tcl_file}", os.path.join(work_dir, "append.log"), work_dir) != 0:
+        print("Error: appending the top-up patterns failed, see append.log.")
+        return None
+    print(f"Faults: {final.faults_file}, patterns: {final.patterns_file}")
+    return final
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Top-up ATPG that only targets faults the previous patterns leave undetected.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--previous_faults', default=None, help='Fault list of the previous run (default: faults_file)')
+    parser.add_argument('--previous_patterns', default=None, help='Patterns of the previous run (default: patterns_file)')
+    parser.add_argument('--classes', nargs='+', default=list(REMAINING_CLASSES), help='Fault classes to target again (default: UD ND AU)')
+    parser.add_argument('--work_dir', default='incremental', help='Directory for the intermediate runs (default: incremental)')
+    parser.add_argument('--base_dir', default='.', help='Directory the relative paths in config.txt refer to (default: .)')
+    parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help=f'Stage cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--force', action='store_true', help='Run the top-up ATPG even if its outputs are cached')
+    args = parser.parse_args()
+    final = run_incremental_atpg(args.config, args.previous_faults, args.previous_patterns, args.classes,
+                                 args.work_dir, args.base_dir, args.cache_dir, args.force)
+    if final is None:
+        raise SystemExit(1)
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+from config_parser import Config, parse_config
+from stage_cache import STAGE_FIELDS, stage_files
+from summary_parser import parse_summary
+from fault_sample import STRATA_SUFFIX, estimate_from_run, sample_fault_list
+
+# Coverage metrics time series.
+# Every parsed report_summaries result is appended to a small SQLite
+# database, keyed by a hash of the Config fields that shape the run (paths
+# excluded, so the same setup in another directory keys the same). Coverage
+# per pattern and CPU time can then be compared across runs without reading
+# the text reports again. A run on a fault sample (fault_sampling) also
+# stores the estimated coverage of the whole fault universe and its
+# confidence interval (fault_sample.py estimate).
+
+DEFAULT_METRICS_DB = "metrics.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    config_hash TEXT NOT NULL,
+    recorded REAL NOT NULL,
+    stage TEXT NOT NULL,
+    top_module TEXT,
+    fault_model TEXT,
+    report_file TEXT,
+    total_faults INTEGER,
+    test_coverage REAL,
+    fault_coverage REAL,
+    atpg_effectiveness REAL,
+    patterns INTEGER,
+    cpu_time REAL,
+    config TEXT,
+    report_digest TEXT,
+    estimated_test_coverage REAL,
+    estimated_test_coverage_low REAL,
+    estimated_test_coverage_high REAL,
+    estimated_fault_coverage REAL
+);
+CREATE INDEX IF NOT EXISTS runs_key ON runs (config_hash, stage, recorded);
+CREATE INDEX IF NOT EXISTS runs_report ON runs (report_digest);
+CREATE TABLE IF NOT EXISTS class_counts (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    code TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (run_id, code)
+) WITHOUT ROWID;
+"""
+
+# Estimate columns, added to databases written before they existed
+ESTIMATE_COLUMNS = ["estimated_test_coverage", "estimated_test_coverage_low", "estimated_test_coverage_high",
+                    "estimated_fault_coverage"]
+
+# Function to collect the Config fields a run's results depend on
+def config_fields(config: Config):
+    fields = sorted(set(STAGE_FIELDS["atpg"]) | set(STAGE_FIELDS["faultsim"]))
+    values = {field: getattr(config, field, None) for field in fields}
+    values["netlist"] = os.path.basename(config.netlist_file)
+    return values
+
+# Function to hash the run relevant Config fields
+def config_hash(config: Config):
+    text = json.dumps(config_fields(config), sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+class MetricsStore:
+    def __init__(self, db_file: str = DEFAULT_METRICS_DB):
+        self.db_file = db_file
+        # campaign/shard jobs may record concurrently
+        self.connection = sqlite3.connect(db_file, timeout=30)
+        existing = {row[1] for row in self.connection.execute("PRAGMA table_info(runs)")}
+        if existing:
+            for column in ESTIMATE_COLUMNS:
+                if column not in existing:
+                    self.connection.execute(f"ALTER TABLE runs ADD COLUMN {column} REAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def record(self, config: Config, stage: str, report, report_file=None, report_digest=None, estimate=None):
+        # Append one parsed SummaryReport (and the coverage estimate of a
+        # sampled run, fault_sample.estimate_coverage); returns the run id.
+        # A report with a digest already recorded for the same config and
+        # stage (outputs restored from the stage cache) is not added again.
+        key = config_hash(config)
+        with self.connection:
+            if report_digest is not None:
+                row = self.connection.execute(
+                    "SELECT id FROM runs WHERE report_digest = ? AND config_hash = ? AND stage = ?",
+                    (report_digest, key, stage)).fetchone()
+                if row:
+                    return row[0]
+            estimated = [None] * 4
+            if estimate is not None:
+                tc = estimate["test_coverage"]
+                estimated = [tc["estimate"], tc["low"], tc["high"], estimate["fault_coverage"]["estimate"]]
+            cursor = self.connection.execute(
+                "INSERT INTO runs (config_hash, recorded, stage, top_module, fault_model, report_file, total_faults, "
+                "test_coverage, fault_coverage, atpg_effectiveness, patterns, cpu_time, config, report_digest, "
+                "estimated_test_coverage, estimated_test_coverage_low, estimated_test_coverage_high, "
+                "estimated_fault_coverage) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, time.time(), stage, config.top_module, config.fault_model,
+                 report_file and os.path.abspath(report_file), report.total_faults, report.test_coverage,
+                 report.fault_coverage, report.atpg_effectiveness, report.patterns, report.cpu_time,
+                 json.dumps(config_fields(config), sort_keys=True, default=str), report_digest, *estimated))
+            run_id = cursor.lastrowid
+            self.connection.executemany("INSERT INTO class_counts (run_id, code, count) VALUES (?, ?, ?)",
+                                        [(run_id, code, count) for code, count in report.class_counts.items()])
+        return run_id
+
+    def history(self, key=None, stage=None, fault_model=None, limit=None):
+        # Runs matching the filters, oldest first, as dicts
+        query = "SELECT * FROM runs"
+        conditions, values = [], []
+        for column, value in (("config_hash", key), ("stage", stage), ("fault_model", fault_model)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY recorded"
+        cursor = self.connection.execute(query, values)
+        columns = [column[0] for column in cursor.description]
+        runs = [dict(zip(columns, row)) for row in cursor]
+        return runs[-limit:] if limit else runs
+
+    def class_counts(self, run_id):
+        return dict(self.connection.execute("SELECT code, count FROM class_counts WHERE run_id = ?", (run_id,)))
+
+# Function to parse the summary a stage wrote and append it to the store.
+# Returns the run id, or None if the report is missing or holds no summary.
+# Recording the same report twice (a stage cache hit) keeps a single row.
+# A sampled run is estimated from the fault list the stage wrote.
+def record_summary(config: Config, stage: str, db_file: str = DEFAULT_METRICS_DB, cwd: str = "."):
+    outputs = stage_files(config, stage, cwd)[1]
+    report_file = outputs[-1]
+    if not os.path.isfile(report_file):
+        print(f"Warning: {report_file} not found, nothing recorded.")
+        return None
+    report = parse_summary(report_file)
+    if report is None:
+        print(f"Warning: no fault summary in {report_file}, nothing recorded.")
+        return None
+    with open(report_file, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    estimate = None
+    sample_file = os.path.join(cwd, sample_fault_list(config))
+    if config.fault_sampling and os.path.isfile(sample_file + STRATA_SUFFIX) and os.path.isfile(outputs[0]):
+        estimate = estimate_from_run(sample_file, outputs[0])
+    store = MetricsStore(db_file)
+    try:
+        return store.record(config, stage, report, report_file, digest, estimate)
+    finally:
+        store.close()
+
+# Function to print runs with coverage per pattern and the CPU time change
+# against the previous run of the same config and stage
+def print_history(runs, cpu_tolerance=0.2):
+    print(f"{'recorded':19} {'config':16} {'stage':8} {'model':11} {'faults':>9} {'TC%':>7} {'FC%':>7} "
+          f"{'patterns':>8} {'TC%/pat':>8} {'CPU s':>9} {'estimated TC%':>22}")
+    previous = {}
+    for run in runs:
+        per_pattern = (f"{run['test_coverage'] / run['patterns']:.4f}"
+                       if run["patterns"] and run["test_coverage"] is not None else "-")
+        cpu = "-" if run["cpu_time"] is None else f"{run['cpu_time']:.2f}"
+        key = (run["config_hash"], run["stage"])
+        last = previous.get(key)
+        if last and last["cpu_time"] and run["cpu_time"] and run["cpu_time"] > last["cpu_time"] * (1 + cpu_tolerance):
+            cpu += " !"
+        previous[key] = run
+        estimated = "-"
+        if run["estimated_test_coverage"] is not None:
+            estimated = (f"{run['estimated_test_coverage']:.2f} [{run['estimated_test_coverage_low']:.2f}, "
+                         f"{run['estimated_test_coverage_high']:.2f}]")
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['recorded']))} {run['config_hash']:16} "
+              f"{run['stage']:8} {run['fault_model'] or '-':11} {run['total_faults'] or 0:>9} "
+              f"{run['test_coverage'] if run['test_coverage'] is not None else '-':>7} "
+              f"{run['fault_coverage'] if run['fault_coverage'] is not None else '-':>7} "
+              f"{run['patterns'] if run['patterns'] is not None else '-':>8} {per_pattern:>8} {cpu:>9} {estimated:>22}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Record and query report_summaries metrics across runs.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--db', default=DEFAULT_METRICS_DB, help=f'Metrics database (default: {DEFAULT_METRICS_DB})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='Parse the summary of a finished stage and store it')
+    record_parser.add_argument('--stage', required=True, choices=['atpg', 'faultsim'], help='Stage that wrote the summary')
+    history_parser = subparsers.add_parser('history', help='Print the recorded runs')
+    history_parser.add_argument('--all', action='store_true', help='Every config, not only the one of --config')
+    history_parser.add_argument('--stage', default=None, choices=['atpg', 'faultsim'], help='Only this stage')
+    history_parser.add_argument('--limit', type=int, default=None, help='Only the last N runs')
+    history_parser.add_argument('--cpu_tolerance', type=float, default=0.2,
+                                help='Mark CPU time growth over this fraction of the previous run (default: 0.2)')
+    args = parser.parse_args()
+
+    config = parse_config(args.config)
+    if args.command == 'record':
+        if record_summary(config, args.stage, args.db) is None:
+            raise SystemExit(1)
+    else:
+        store = MetricsStore(args.db)
+        print_history(store.history(None if args.all else config_hash(config), args.stage, limit=args.limit),
+                      args.cpu_tolerance)
+        store.close()
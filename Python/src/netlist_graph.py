@@ -0,0 +1,417 @@
+import os
+import json
+import mmap
+import struct
+import argparse
+from array import array
+from bisect import bisect_left
+from collections import deque
+from verilog_reader import flatten
+from cell_library import lookup
+
+# Connectivity model of a flattened netlist (the *_dft.v DFTScriptGenerator
+# writes). Cells, nets, pins and cell types are int32 ids; their names are
+# interned into one string table each. Top level ports are cells too (type
+# <input>/<output>/<inout>, one pin named after the port), so cones end at
+# them like at any other cell.
+#
+#   pins       per cell in cell order: cell_pin_start[c]:cell_pin_start[c+1]
+#              pin_net / pin_name / pin_dir (0 in, 1 out, 2 inout)
+#   nets       net_pin_start[n]:net_pin_start[n+1] into net_pins
+#   cells      fanin/fanout cell lists in CSR form, level (topological
+#              level over the combinational cells, sequential cells and
+#              input ports at 0, -1 inside combinational loops)
+#
+# The arrays are saved next to the netlist without pickle (magic, raw array
+# sections, JSON header) and memory mapped on reopen, so loading does no
+# per-cell work; name lookups bisect a sorted id list.
+
+GRAPH_MAGIC = b"NETGRAF1"
+GRAPH_SUFFIX = ".ngraph"
+
+PIN_IN, PIN_OUT, PIN_INOUT = 0, 1, 2
+FLAG_SEQUENTIAL, FLAG_PORT = 1, 2
+
+# Pin names treated as outputs for cells missing from the cell library
+_OUTPUT_PINS = {"Y", "Z", "ZN", "Q", "QN", "S", "CO", "SO", "X", "O"}
+
+ARRAY_SECTIONS = ["cell_type", "cell_flags", "cell_pin_start", "pin_net", "pin_name", "pin_dir",
+                  "net_pin_start", "net_pins", "fanin_start", "fanin", "fanout_start", "fanout", "level",
+                  "cell_sorted", "net_sorted"]
+STRING_SECTIONS = ["cell_names", "net_names", "type_names", "pin_names"]
+
+class _Strings:
+    # Interned strings: one blob plus offsets, indexable by id
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, names):
+        offsets = array("q", [0])
+        parts = []
+        total = 0
+        for name in names:
+            data = name.encode()
+            parts.append(data)
+            total += len(data)
+            offsets.append(total)
+        return cls(b"".join(parts), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode()
+
+class _Interner:
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def __call__(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+def _csr(count, pairs):
+    # (key, value) pairs -> start array and values grouped by key
+    start = array("i", bytes(4 * (count + 1)))
+    for key, _ in pairs:
+        start[key + 1] += 1
+    for i in range(count):
+        start[i + 1] += start[i]
+    fill = array("i", start)
+    values = array("i", bytes(4 * len(pairs)))
+    for key, value in pairs:
+        values[fill[key]] = value
+        fill[key] += 1
+    return start, values
+
+class NetlistGraph:
+    def __init__(self, arrays, strings, top):
+        for name in ARRAY_SECTIONS:
+            setattr(self, name, arrays[name])
+        for name in STRING_SECTIONS:
+            setattr(self, name, strings[name])
+        self.top = top
+        self.source = None
+        self._map = None
+
+    @property
+    def num_cells(self):
+        return len(self.cell_type)
+
+    @property
+    def num_nets(self):
+        return len(self.net_pin_start) - 1
+
+    @property
+    def num_pins(self):
+        return len(self.pin_net)
+
+    @classmethod
+    def from_netlist(cls, netlist_file, top=None):
+        top, ports, instances = flatten(netlist_file, top)
+        nets, types, pin_names = _Interner(), _Interner(), _Interner()
+        cell_names = []
+        cell_type, cell_flags = array("i"), array("b")
+        cell_pin_start = array("i", [0])
+        pin_net, pin_name, pin_dir = array("i"), array("i"), array("b")
+
+        def add_pin(name, net, direction):
+            pin_net.append(nets(net) if net is not None else -1)
+            pin_name.append(pin_names(name))
+            pin_dir.append(direction)
+
+        for direction, name, net in ports:
+            cell_names.append(name)
+            cell_type.append(types(f"<{direction}>"))
+            cell_flags.append(FLAG_PORT)
+            # an input port drives its net, an output port loads it
+            add_pin(name, net, {"input": PIN_OUT, "output": PIN_IN}.get(direction, PIN_INOUT))
+            cell_pin_start.append(len(pin_net))
+        for path, cell, pins in instances:
+            function = lookup(cell, max(len(pins) - 1, 1))
+            cell_names.append(path)
+            cell_type.append(types(cell))
+            cell_flags.append(FLAG_SEQUENTIAL if function is not None and function.next_state is not None else 0)
+            for pin, net in pins.items():
+                if isinstance(pin, int):
+                    # primitive: output first
+                    add_pin(str(pin), net, PIN_OUT if pin == 0 else PIN_IN)
+                elif function is not None:
+                    add_pin(pin, net, PIN_OUT if pin in function.outputs else PIN_IN)
+                else:
+                    add_pin(pin, net, PIN_OUT if pin in _OUTPUT_PINS else PIN_IN)
+            cell_pin_start.append(len(pin_net))
+
+        num_cells, num_nets = len(cell_names), len(nets.names)
+        pin_cell = array("i", bytes(4 * len(pin_net)))
+        for c in range(num_cells):
+            for p in range(cell_pin_start[c], cell_pin_start[c + 1]):
+                pin_cell[p] = c
+        net_pin_start, net_pins = _csr(num_nets, [(pin_net[p], p) for p in range(len(pin_net)) if pin_net[p] >= 0])
+
+        # cell edges through every net: drivers -> loads
+        edges = set()
+        for n in range(num_nets):
+            pins = net_pins[net_pin_start[n]:net_pin_start[n + 1]]
+            drivers = [pin_cell[p] for p in pins if pin_dir[p] != PIN_IN]
+            loads = [pin_cell[p] for p in pins if pin_dir[p] != PIN_OUT]
+            for d in drivers:
+                for load in loads:
+                    if d != load:
+                        edges.add((d, load))
+        edges = sorted(edges)
+        fanout_start, fanout = _csr(num_cells, edges)
+        fanin_start, fanin = _csr(num_cells, [(b, a) for a, b in edges])
+        level = cls._levelize(num_cells, cell_flags, cell_type, types.ids, fanin_start, fanin, fanout_start, fanout)
+
+        arrays = {
+            "cell_type": cell_type, "cell_flags": cell_flags, "cell_pin_start": cell_pin_start,
+            "pin_net": pin_net, "pin_name": pin_name, "pin_dir": pin_dir,
+            "net_pin_start": net_pin_start, "net_pins": net_pins,
+            "fanin_start": fanin_start, "fanin": fanin, "fanout_start": fanout_start, "fanout": fanout,
+            "level": level,
+            "cell_sorted": array("i", sorted(range(num_cells), key=cell_names.__getitem__)),
+            "net_sorted": array("i", sorted(range(num_nets), key=nets.names.__getitem__)),
+        }
+        strings = {"cell_names": _Strings.from_list(cell_names), "net_names": _Strings.from_list(nets.names),
+                   "type_names": _Strings.from_list(types.names), "pin_names": _Strings.from_list(pin_names.names)}
+        return cls(arrays, strings, top)
+
+    @staticmethod
+    def _levelize(num_cells, cell_flags, cell_type, type_ids, fanin_start, fanin, fanout_start, fanout):
+        # Kahn's algorithm; sequential cells and input ports are sources and
+        # their inputs are not waited for
+        source_types = {type_ids.get("<input>"), type_ids.get("<inout>")}
+        level = array("i", bytes(4 * num_cells))
+        pending = array("i", bytes(4 * num_cells))
+
+        def is_source(c):
+            return cell_flags[c] & FLAG_SEQUENTIAL or cell_type[c] in source_types
+
+        ready = deque()
+        for c in range(num_cells):
+            if is_source(c):
+                ready.append(c)
+            else:
+                pending[c] = fanin_start[c + 1] - fanin_start[c]
+                if pending[c] == 0:
+                    ready.append(c)
+        done = 0
+        while ready:
+            c = ready.popleft()
+            done += 1
+            for k in range(fanout_start[c], fanout_start[c + 1]):
+                d = fanout[k]
+                if is_source(d):
+                    continue
+                if level[c] + 1 > level[d]:
+                    level[d] = level[c] + 1
+                pending[d] -= 1
+                if pending[d] == 0:
+                    ready.append(d)
+        if done < num_cells:
+            for c in range(num_cells):
+                if pending[c] > 0:
+                    level[c] = -1
+        return level
+
+    def save(self, graph_file, source=None):
+        header = {"top": self.top, "source": source, "sections": []}
+        tmp = f"{graph_file}.tmp{os.getpid()}"
+        with open(tmp, "wb") as f:
+            f.write(GRAPH_MAGIC + struct.pack("<Q", 0))
+            sections = [(name, getattr(self, name)) for name in ARRAY_SECTIONS]
+            for name in STRING_SECTIONS:
+                strings = getattr(self, name)
+                sections += [(f"{name}.blob", array("B", strings.blob)), (f"{name}.offsets", strings.offsets)]
+            for name, data in sections:
+                # 8 byte alignment so the sections can be cast in place
+                f.write(b"\0" * (-f.tell() % 8))
+                typecode = data.format if isinstance(data, memoryview) else data.typecode
+                header["sections"].append([name, typecode, f.tell(), len(data)])
+                f.write(bytes(data) if isinstance(data, memoryview) else data.tobytes())
+            offset = f.tell()
+            f.write(json.dumps(header).encode())
+            f.seek(len(GRAPH_MAGIC))
+            f.write(struct.pack("<Q", offset))
+        os.replace(tmp, graph_file)
+
+    @classmethod
+    def load(cls, graph_file):
+        # The sections stay in the mapping; nothing is copied
+        with open(graph_file, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:len(GRAPH_MAGIC)] != GRAPH_MAGIC:
+            data.close()
+            raise ValueError(f"{graph_file} is not a netlist graph")
+        offset, = struct.unpack_from("<Q", data, len(GRAPH_MAGIC))
+        header = json.loads(data[offset:])
+        view = memoryview(data)
+        sections = {}
+        for name, typecode, start, count in header["sections"]:
+            size = array(typecode).itemsize
+            sections[name] = view[start:start + count * size].cast(typecode)
+        strings = {name: _Strings(sections[f"{name}.blob"], sections[f"{name}.offsets"]) for name in STRING_SECTIONS}
+        graph = cls(sections, strings, header["top"])
+        graph.source = header["source"]
+        graph._map = data
+        return graph
+
+    # Names
+
+    def cell_name(self, c):
+        return self.cell_names[c]
+
+    def net_name(self, n):
+        return self.net_names[n]
+
+    def cell_type_name(self, c):
+        return self.type_names[self.cell_type[c]]
+
+    def _find(self, sorted_ids, names, name):
+        i = bisect_left(sorted_ids, name, key=names.__getitem__)
+        return sorted_ids[i] if i < len(sorted_ids) and names[sorted_ids[i]] == name else -1
+
+    def find_cell(self, name):
+        return self._find(self.cell_sorted, self.cell_names, name)
+
+    def find_net(self, name):
+        return self._find(self.net_sorted, self.net_names, name)
+
+    # Connectivity
+
+    def is_sequential(self, c):
+        return bool(self.cell_flags[c] & FLAG_SEQUENTIAL)
+
+    def is_port(self, c):
+        return bool(self.cell_flags[c] & FLAG_PORT)
+
+    def pins(self, c):
+        # (pin name, net id, direction) of a cell
+        return [(self.pin_names[self.pin_name[p]], self.pin_net[p], self.pin_dir[p])
+                for p in range(self.cell_pin_start[c], self.cell_pin_start[c + 1])]
+
+    def pin_cell(self, p):
+        # cell a pin id belongs to
+        return bisect_left(self.cell_pin_start, p + 1) - 1
+
+    def net_drivers(self, n):
+        return [self.pin_cell(p) for p in self.net_pins[self.net_pin_start[n]:self.net_pin_start[n + 1]]
+                if self.pin_dir[p] != PIN_IN]
+
+    def net_loads(self, n):
+        return [self.pin_cell(p) for p in self.net_pins[self.net_pin_start[n]:self.net_pin_start[n + 1]]
+                if self.pin_dir[p] != PIN_OUT]
+
+    def fanin_cells(self, c):
+        return self.fanin[self.fanin_start[c]:self.fanin_start[c + 1]]
+
+    def fanout_cells(self, c):
+        return self.fanout[self.fanout_start[c]:self.fanout_start[c + 1]]
+
+    def _cone(self, roots, start, edges, through_sequential, max_depth):
+        seen = bytearray(self.num_cells)
+        frontier = []
+        for c in roots:
+            if not seen[c]:
+                seen[c] = 1
+                frontier.append(c)
+        cone = list(frontier)
+        depth = 0
+        while frontier and (max_depth is None or depth < max_depth):
+            depth += 1
+            next_frontier = []
+            for c in frontier:
+                if depth > 1 and not through_sequential and self.cell_flags[c] & FLAG_SEQUENTIAL:
+                    # a flop ends the cone unless it is a root
+                    continue
+                for k in range(start[c], start[c + 1]):
+                    d = edges[k]
+                    if not seen[d]:
+                        seen[d] = 1
+                        next_frontier.append(d)
+            cone += next_frontier
+            frontier = next_frontier
+        return sorted(cone)
+
+    # Function to collect the cells in the fan-in cone of the roots (cell
+    # ids). The cone stops at flops and ports unless through_sequential.
+    def fanin_cone(self, roots, through_sequential=False, max_depth=None):
+        return self._cone(roots, self.fanin_start, self.fanin, through_sequential, max_depth)
+
+    def fanout_cone(self, roots, through_sequential=False, max_depth=None):
+        return self._cone(roots, self.fanout_start, self.fanout, through_sequential, max_depth)
+
+    def levels(self):
+        # Cell ids grouped by level, level 0 first; loop cells are left out
+        depth = max(self.level, default=-1) + 1
+        start, cells = _csr(depth, [(self.level[c], c) for c in range(self.num_cells) if self.level[c] >= 0])
+        return [cells[start[i]:start[i + 1]] for i in range(depth)]
+
+    def close(self):
+        if self._map is not None:
+            for name in ARRAY_SECTIONS:
+                getattr(self, name).release()
+            for name in STRING_SECTIONS:
+                strings = getattr(self, name)
+                strings.blob.release()
+                strings.offsets.release()
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Function to open the graph of a netlist, building and saving it on the
+# first open or when the netlist changed since
+def open_graph(netlist_file, graph_file=None, top=None, rebuild=False):
+    graph_file = graph_file or netlist_file + GRAPH_SUFFIX
+    st = os.stat(netlist_file)
+    source = [st.st_size, st.st_mtime_ns, top]
+    if not rebuild and os.path.isfile(graph_file):
+        graph = NetlistGraph.load(graph_file)
+        if graph.source == source:
+            return graph
+        graph.close()
+    graph = NetlistGraph.from_netlist(netlist_file, top)
+    graph.save(graph_file, source)
+    return NetlistGraph.load(graph_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build or query the connectivity graph of a netlist.')
+    parser.add_argument('netlist_file', help='Scan inserted netlist, e.g. s15850_dft.v')
+    parser.add_argument('--top', default=None, help='Top module (default: the uninstantiated module)')
+    parser.add_argument('--fanin', nargs='+', default=None, help='Print the fan-in cone of these cells')
+    parser.add_argument('--fanout', nargs='+', default=None, help='Print the fan-out cone of these cells')
+    parser.add_argument('--depth', type=int, default=None, help='Cone depth limit in cells (default: none)')
+    parser.add_argument('--through_sequential', action='store_true', help='Let cones continue through flops')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the graph even if it is up to date')
+    args = parser.parse_args()
+
+    graph = open_graph(args.netlist_file, top=args.top, rebuild=args.rebuild)
+    for option, cone in ((args.fanin, graph.fanin_cone), (args.fanout, graph.fanout_cone)):
+        if option is None:
+            continue
+        roots = []
+        for name in option:
+            c = graph.find_cell(name)
+            if c < 0:
+                raise SystemExit(f"Error: no cell {name} in {graph.top}")
+            roots.append(c)
+        for c in cone(roots, args.through_sequential, args.depth):
+            print(f"{graph.level[c]:>5} {graph.cell_type_name(c):<12} {graph.cell_name(c)}")
+    if args.fanin is None and args.fanout is None:
+        loops = sum(1 for level in graph.level if level < 0)
+        print(f"{graph.top}: {graph.num_cells} cells, {graph.num_nets} nets, {graph.num_pins} pins, "
+              f"{max(graph.level, default=-1) + 1} levels, "
+              f"{sum(1 for c in range(graph.num_cells) if graph.is_sequential(c))} sequential, "
+              f"{loops} in combinational loops")
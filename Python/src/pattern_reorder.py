@@ -0,0 +1,204 @@
+import os
+import re
+import mmap
+import math
+import heapq
+import argparse
+import numpy as np
+from config_parser import parse_config
+from stil_reader import open_patterns
+from bit_fault_sim import (CircuitModel, MODEL_TYPES, DEFAULT_BLOCK_BITS, PatternBlocks, fault_rows, fault_sites,
+                           detection_lists)
+
+# Pattern reordering and truncation.
+# The patterns are fault simulated into the list of faults every pattern
+# detects (bit_fault_sim.detection_lists), kept as sparse CSR arrays. A fault
+# is only listed for its first n_detect detecting patterns and then dropped
+# from the simulation, so the lists stay at most faults x n_detect long
+# whatever the pattern count. Patterns are then picked greedily by marginal
+# detection until fault_coverage is reached, and the STIL is rewritten with
+# only those patterns, best first. A fault detected later than its first
+# n_detect patterns is not credited there, so the coverage estimate is
+# conservative; n_detect 0 keeps every detection and the estimate is exact.
+
+DEFAULT_N_DETECT = 8
+
+_LABEL_RE = re.compile(rb'"(pattern \d+|end \d+ unload)"\s*:')
+_LOAD_UNLOAD_RE = re.compile(rb'\s*(?:Ann\s*\{\*.*?\*\}\s*)*Call\s+"load_unload"\s*\{', re.S)
+_ASSIGN_RE = re.compile(rb'"([^"]+)"\s*=\s*([^;]*);')
+
+# Function to order patterns greedily by marginal detection.
+# start / faults are the per pattern fault lists (CSR), weights the number
+# of faults each fault row stands for. The gain of a pattern is the weight
+# of its faults not covered yet. Gains only shrink as faults get covered, so
+# they are kept in a heap as upper bounds and only the top one is recounted
+# (lazy greedy); the picks are those of recounting every pattern after each
+# pick, ties going to the lower pattern. Stops once target faults are
+# covered or no pattern adds anything. Returns the chosen patterns and their
+# gains.
+def greedy_order(start, faults, weights, target):
+    weights = np.asarray(weights, np.int64)
+    num_patterns = len(start) - 1
+    owner = np.repeat(np.arange(num_patterns), np.diff(start))
+    bounds = np.bincount(owner, weights=weights[faults], minlength=num_patterns).astype(np.int64)
+    heap = [(-int(gain), p) for p, gain in enumerate(bounds) if gain > 0]
+    heapq.heapify(heap)
+    covered = np.zeros(len(weights), bool)
+    order, chosen = [], []
+    total = 0
+    while total < target and heap:
+        _, p = heapq.heappop(heap)
+        listed = faults[start[p]:start[p + 1]]
+        new = listed[~covered[listed]]
+        gain = int(weights[new].sum())
+        if gain <= 0:
+            continue
+        if heap and (-gain, p) > heap[0]:
+            heapq.heappush(heap, (-gain, p))
+            continue
+        covered[new] = True
+        order.append(p)
+        chosen.append(gain)
+        total += gain
+    return order, chosen
+
+class _StilPatterns:
+    # Byte offsets of the pattern statements of a STIL file
+    def __init__(self, stil_file, scan_outs):
+        self._file = open(stil_file, "rb")
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.scan_outs = {name.encode() for name in scan_outs}
+        self.spans = []          # (label start, body start) per pattern
+        self.end_unload = None   # (label start, body start)
+        for match in _LABEL_RE.finditer(self.data):
+            if match.group(1).startswith(b"pattern "):
+                self.spans.append((match.start(), match.end()))
+            else:
+                self.end_unload = (match.start(), match.end())
+        if self.end_unload:
+            self.tail = self._load_unload(self.end_unload[1], len(self.data))[2]
+        else:
+            # no final unload: the patterns run up to the Pattern block's '}'
+            self.tail = self.data.rfind(b"}")
+
+    def close(self):
+        self.data.close()
+        self._file.close()
+
+    def _body_end(self, n):
+        if n + 1 < len(self.spans):
+            return self.spans[n + 1][0]
+        return self.end_unload[0] if self.end_unload else self.tail
+
+    def _load_unload(self, start, end):
+        # (unload assignments, other assignments, end of the call) of the
+        # load_unload call a statement starts with; None if it has none
+        match = _LOAD_UNLOAD_RE.match(self.data, start, end)
+        if not match:
+            return None, None, start
+        close = self.data.find(b"}", match.end(), end)
+        unloads, others = [], []
+        for assign in _ASSIGN_RE.finditer(self.data, match.end(), close):
+            signal = assign.group(1)
+            is_unload = signal in self.scan_outs or signal.startswith(b"_so")
+            (unloads if is_unload else others).append(assign.group(0))
+        return unloads, others, close + 1
+
+    def unload(self, n):
+        # Expected scan out values of pattern n, held by the next load_unload
+        if n + 1 < len(self.spans):
+            return self._load_unload(self.spans[n + 1][1], self._body_end(n + 1))[0] or []
+        if self.end_unload:
+            return self._load_unload(self.end_unload[1], self.tail)[0] or []
+        return []
+
+    def write(self, order, output_file):
+        with open(output_file, "wb") as out:
+            out.write(self.data[:self.spans[0][0]] if self.spans else self.data[:self.tail])
+            previous = None
+            for index, n in enumerate(order):
+                body, end = self.spans[n][1], self._body_end(n)
+                _, loads, call_end = self._load_unload(body, end)
+                out.write(f'"pattern {index}":'.encode())
+                if loads is None:
+                    out.write(self.data[body:end])
+                else:
+                    unloads = self.unload(previous) if previous is not None else []
+                    out.write(b' Call "load_unload" { ' + b" ".join(unloads + loads) + b" }")
+                    out.write(self.data[call_end:end])
+                previous = n
+            if previous is not None and self.end_unload:
+                out.write(f'"end {len(order) - 1} unload": Call "load_unload" {{ '.encode())
+                out.write(b" ".join(self.unload(previous)) + b" }\n")
+            out.write(self.data[self.tail:])
+
+# Function to rewrite a STIL file with only the given patterns, in order
+def write_patterns(stil_file, order, output_file, scan_outs):
+    patterns = _StilPatterns(stil_file, scan_outs)
+    try:
+        if len(patterns.spans) == 0:
+            raise ValueError(f"no \"pattern N\" statements in {stil_file}")
+        patterns.write(order, output_file)
+    finally:
+        patterns.close()
+
+# Main function
+def reorder_patterns(netlist_file, patterns_file, fault_model="stuck", faults_file=None, coverage=100.0,
+                     output_file=None, report_file=None, n_detect=DEFAULT_N_DETECT, jobs=1,
+                     block_bits=DEFAULT_BLOCK_BITS, top=None):
+    model = CircuitModel(netlist_file, top)
+    store = open_patterns(patterns_file)
+    blocks = PatternBlocks(model, store, fault_model == "transition", block_bits)
+    rows = fault_rows(model, faults_file, fault_model)
+    sites, weights = fault_sites(model, rows)
+    print(f"Listing the detections of {len(sites)} faults x {len(store)} patterns (n_detect {n_detect or 'all'})...")
+    start, faults = detection_lists(model, blocks, sites, n_detect, jobs)
+
+    testable = len(rows) - sum(1 for row in rows if row[2] == "UD")
+    detected = np.bincount(faults, minlength=len(sites)) > 0
+    detectable = int(np.asarray(weights, np.int64)[detected].sum())
+    target = min(math.ceil(coverage / 100.0 * testable), detectable)
+    if detectable < coverage / 100.0 * testable:
+        print(f"Warning: all {len(store)} patterns reach {100.0 * detectable / testable:.2f}% test coverage, "
+              f"below the {coverage}% target; keeping every pattern that adds coverage.")
+    order, gains = greedy_order(start, faults, weights, target)
+    reached = 100.0 * sum(gains) / testable if testable else 0.0
+    print(f"{len(order)} of {len(store)} patterns reach {reached:.2f}% test coverage (target {coverage}%)")
+
+    if report_file:
+        with open(report_file, "w") as f:
+            f.write("# new original gain cumulative_test_coverage\n")
+            total = 0
+            for index, (n, count) in enumerate(zip(order, gains)):
+                total += count
+                f.write(f"{index} {n} {count} {100.0 * total / testable:.4f}\n")
+    if output_file:
+        scan_outs = [chain.scan_out for chain in store.chains if chain.scan_out]
+        store.close()
+        write_patterns(patterns_file, order, output_file, scan_outs)
+        print(f"Truncated patterns written to {output_file}")
+    return order, gains
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Reorder patterns by marginal coverage and truncate them at the coverage target.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--netlist', default=None, help='Scan inserted netlist (default: netlist_file)')
+    parser.add_argument('--patterns', default=None, help='STIL patterns (default: patterns_file)')
+    parser.add_argument('--fault_model', choices=sorted(MODEL_TYPES), default=None,
+                        help='Fault model (default: fault_model if stuck or transition, else stuck)')
+    parser.add_argument('--faults', default=None, help='Fault list (default: every pin of the netlist)')
+    parser.add_argument('--coverage', type=float, default=None, help='Test coverage target in %% (default: fault_coverage)')
+    parser.add_argument('--output', default=None, help='Truncated STIL (default: <patterns>_truncated.stil)')
+    parser.add_argument('--report', default=None, help='Write the per pattern gain and cumulative coverage here')
+    parser.add_argument('--n_detect', type=int, default=DEFAULT_N_DETECT, help=f'Detections kept per fault, 0 for all (default: {DEFAULT_N_DETECT})')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Worker processes (default: all cores)')
+    parser.add_argument('--block', type=int, default=DEFAULT_BLOCK_BITS, help=f'Patterns per block (default: {DEFAULT_BLOCK_BITS})')
+    args = parser.parse_args()
+
+    config = parse_config(args.config)
+    patterns_file = args.patterns or config.patterns_file
+    fault_model = args.fault_model or (config.fault_model if config.fault_model in MODEL_TYPES else "stuck")
+    output_file = args.output or os.path.splitext(patterns_file)[0] + "_truncated.stil"
+    reorder_patterns(args.netlist or config.netlist_file, patterns_file, fault_model, args.faults,
+                     args.coverage if args.coverage is not None else config.fault_coverage, output_file,
+                     args.report, args.n_detect, args.jobs, args.block, config.top_module)
@@ -0,0 +1,188 @@
+import os
+import re
+import heapq
+import hashlib
+import argparse
+from config_parser import Config, parse_config
+from tool_runner import ToolExecutor
+
+# Critical path extraction for path_delay / hold_time ATPG.
+# PrimeTime runs as several concurrent pt_shell jobs, each writing the paths
+# of one partition with pt2tmax's write_delay_paths:
+#   endpoint: the register data pins are dealt round robin into path_delay_jobs
+#             path groups, one group per job
+#   group:    one job for the internal (clock to clock) paths and one for the
+#             I/O paths, pt2tmax's own path groups
+# Every job may write path_delay_max_paths paths. The reports are then merged
+# in one streaming pass: paths with the same pin/transition list are written
+# once, and only the path_delay_max_paths smallest slacks are kept, most
+# critical first, in the <top>_delay.rpt that add_delay_paths reads.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PT2TMAX = os.path.normpath(os.path.join(SCRIPT_DIR, "../../Script/tcl/pt2tmax.tcl"))
+PTSHELL = "pt_shell -f"
+
+PARTITIONS = ("endpoint", "group")
+
+_NAME_RE = re.compile(r'^\s*\$name\s+"([^"]*)"')
+_SLACK_RE = re.compile(r'^\s*\$slack\s+(\S+)\s*;')
+_PIN_RE = re.compile(r'^\s*"([^"]+)"\s*([\^v])\s*;')
+
+# Function to write the PrimeTime setup shared by every job
+def write_pt_setup(config: Config, file):
+    file.write("remove_design -all\n")
+    file.write(f'set search_path ". {config.db_library}"\n')
+    file.write('set link_path "* typical.db  fast.db  slow.db"\n\n')
+
+    file.write(f"read_verilog {config.netlist_file}\n")
+    file.write(f"link_design {config.top_module}\n")
+    file.write(f"read_parasitics {config.spef_file}\n")
+    file.write("set_operating_conditions typical -library typical\n\n")
+
+    file.write(f"set CLK_PERIOD {config.path_delay_slack}\n")
+    file.write("set CLK CK\n")
+    file.write("create_clock -period $CLK_PERIOD [get_ports $CLK]\n")
+    file.write("set_clock_transition -rise 0.05 [get_clocks $CLK]\n")
+    file.write("set_clock_transition -fall 0.03 [get_clocks $CLK]\n")
+    file.write("set_clock_latency -rise 0.01 [get_clocks $CLK]\n")
+    file.write("set_clock_latency -fall 0.03 [get_clocks $CLK]\n")
+    file.write("set_ideal_network [get_ports CK]\n\n")
+
+    file.write(f"source {PT2TMAX}\n")
+
+# Function to write the pt_shell script of one partition.
+# Returns the delay path report the script writes.
+def write_pt_job(config: Config, partition, index, count, delay_type, work_dir):
+    # pt_shell runs in work_dir
+    report = f"{config.top_module}_delay_{index}.rpt"
+    options = f"-max_paths {config.path_delay_max_paths} -nworst 1 -delay_type {delay_type}"
+    with open(os.path.join(work_dir, f"pt_path_{index}.tcl"), "w") as f:
+        write_pt_setup(config, f)
+        if partition == "endpoint":
+            f.write(f"\n# endpoint shard {index} of {count}\n")
+            f.write("set shard_pins {}\n")
+            f.write("set pin_index 0\n")
+            f.write("foreach_in_collection pin [all_registers -data_pins] {\n")
+            f.write(f"  if {{[expr $pin_index % {count}] == {index}}} {{\n")
+            f.write("    append_to_collection shard_pins $pin\n")
+            f.write("  }\n")
+            f.write("  incr pin_index\n")
+            f.write("}\n")
+            f.write("remove_path_group -all\n")
+            f.write(f"group_path -name shard{index} -to $shard_pins\n")
+            f.write(f"write_delay_paths -group shard{index} {options} {report}\n\n")
+        else:
+            io = " -IO" if index == 1 else ""
+            f.write(f"write_delay_paths{io} {options} {report}\n\n")
+        f.write("exit")
+    return os.path.join(work_dir, report)
+
+# Function to read the paths of a write_delay_paths report one at a time.
+# Yields (slack, pin/transition key, lines of the $path block); paths
+# without a $slack sort last.
+def read_delay_paths(report_file):
+    with open(report_file) as f:
+        block = None
+        depth = 0
+        for line in f:
+            if block is None:
+                if line.lstrip().startswith("$path"):
+                    block, depth, slack, pins = [line], line.count("{") - line.count("}"), float("inf"), []
+                continue
+            block.append(line)
+            match = _SLACK_RE.match(line)
+            if match:
+                try:
+                    slack = float(match.group(1))
+                except ValueError:
+                    pass
+            match = _PIN_RE.match(line)
+            if match:
+                pins.append(f"{match.group(1)} {match.group(2)}")
+            depth += line.count("{") - line.count("}")
+            if depth <= 0:
+                yield slack, "\n".join(pins), block
+                block = None
+
+# Function to merge delay path reports into one.
+# Duplicate paths (same pins and transitions) are written once; max_paths
+# keeps only the most critical paths. Returns (written, duplicates).
+def merge_delay_paths(report_files, output_file, max_paths=None):
+    seen = set()
+    kept = []   # heap of (-slack, order, block): the least critical on top
+    order = 0
+    duplicates = 0
+    names = set()
+    for report_file in report_files:
+        for slack, key, block in read_delay_paths(report_file):
+            digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+            if digest in seen:
+                duplicates += 1
+                continue
+            seen.add(digest)
+            order += 1
+            if max_paths is None or len(kept) < max_paths:
+                heapq.heappush(kept, (-slack, order, block))
+            elif -slack > kept[0][0]:
+                heapq.heapreplace(kept, (-slack, order, block))
+
+    with open(output_file, "w") as out:
+        out.write(f"\n// pt2tmax\n// merged from {len(report_files)} reports\n\n")
+        for _, order, block in sorted(kept, key=lambda item: (-item[0], item[1])):
+            for line in block:
+                match = _NAME_RE.match(line)
+                if match:
+                    # names only have to be unique within the merged file
+                    name = match.group(1)
+                    if name in names:
+                        line = line.replace(f'"{name}"', f'"{name}_{order}"', 1)
+                        name = f"{name}_{order}"
+                    names.add(name)
+                out.write(line)
+            out.write("\n")
+    return len(kept), duplicates
+
+# Main function
+def extract_delay_paths(config: Config, delay_type="max", partition="endpoint", jobs=1, work_dir="."):
+    if partition not in PARTITIONS:
+        raise ValueError(f"Unknown path_delay_partition: {partition}")
+    count = 2 if partition == "group" else max(1, jobs)
+    scripts = []
+    for index in range(count):
+        report = write_pt_job(config, partition, index, count, delay_type, work_dir)
+        scripts.append((f"pt_path_{index}.tcl", report))
+
+    print(f"Extracting {delay_type} delay paths with {count} pt_shell jobs ({partition} partition)...")
+    executor = ToolExecutor(max(1, jobs))
+    results = executor.run_all([(f"{PTSHELL} {script}", os.path.join(work_dir, script.replace(".tcl", ".log")), work_dir)
+                                for script, _ in scripts])
+    failed = False
+    for (script, _), result in zip(scripts, results):
+        failed |= result.returncode != 0
+        print(f"{script}: {'ok' if result.returncode == 0 else 'FAILED'}")
+    reports = [report for _, report in scripts if os.path.isfile(report)]
+    if failed or len(reports) < count:
+        print("Warning: not every pt_shell job wrote its delay paths, see pt_path_*.log.")
+
+    output_file = os.path.join(work_dir, f"{config.top_module}_delay.rpt")
+    written, duplicates = merge_delay_paths(reports, output_file, config.path_delay_max_paths)
+    print(f"{written} delay paths written to {output_file} ({duplicates} duplicates dropped)")
+    return output_file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Extract critical paths with concurrent pt_shell jobs and merge them for add_delay_paths.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--delay_type', choices=['max', 'min'], default=None,
+                        help='max for path_delay, min for hold_time (default: from fault_model)')
+    parser.add_argument('--merge', nargs='+', default=None, help='Only merge these write_delay_paths reports')
+    parser.add_argument('--output', default=None, help='Merged report (default: <top>_delay.rpt)')
+    args = parser.parse_args()
+
+    config = parse_config(args.config)
+    if args.merge:
+        output_file = args.output or f"{config.top_module}_delay.rpt"
+        written, duplicates = merge_delay_paths(args.merge, output_file, config.path_delay_max_paths)
+        print(f"{written} delay paths written to {output_file} ({duplicates} duplicates dropped)")
+    else:
+        delay_type = args.delay_type or ("min" if config.fault_model == "hold_time" else "max")
+        extract_delay_paths(config, delay_type, config.path_delay_partition, config.path_delay_jobs)
@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import math
+import argparse
+from config_parser import Config, parse_config
+from stil_reader import Chain, tokenize, open_patterns, parse_scan_structures, unquote
+from summary_parser import parse_summary
+
+# Scan chain balance and test application time.
+# Chain lengths come from the ScanStructures of the test protocol dc_shell
+# writes (Netlist/<top>_dft.spf) and from its report_scan_path output
+# (rpt/<top>_dft.scan_path); either one is enough, both are cross-checked.
+# With scan load and unload overlapped, every pattern costs the longest
+# chain plus the capture cycles:
+#   cycles = patterns * (max length + capture cycles) + max length
+# The pattern count comes from the STIL pattern file (or the ATPG summary).
+# Tester memory is the vector depth per scan pin and the scan data volume
+# (stimulus and expected response of every chain, short chains padded).
+#
+# Under a pin budget (a scan-in and a scan-out pin per chain) every chain
+# count is evaluated with the scan cells spread evenly; a count whose
+# longest chain fills fewer chains (10 cells on 6 chains of at most 2) is
+# counted as the chains it really needs. The recommendation is the fewest
+# chains whose test time is within the tolerance of the best one.
+# auto_compression is tmax's pattern compaction (run_atpg -auto_compression),
+# not a scan codec: it only shrinks the pattern count, which is read from the
+# compacted patterns, and every chain still takes its two scan pins, so the
+# model is the same with or without it. The pattern count is assumed not to
+# depend on the chain count.
+
+_PERIOD_RE = re.compile(r"^([\d.]+)\s*(ps|ns|us|ms|s)?$")
+_UNITS = {"ps": 1e-12, "ns": 1e-9, "us": 1e-6, "ms": 1e-3, "s": 1.0, None: 1e-9}
+# report_scan_path -chain rows: [I] <chain> <length> <scan in> <scan out> [clock]
+_SCAN_PATH_RE = re.compile(r"^\s*(?:I\s+)?(\S+)\s+(\d+)\s+(\S+)\s+(\S+)")
+
+# Function to read the scan chains and the test cycle period of an SPF.
+# Returns ([Chain], period in seconds or None).
+def read_spf_chains(spf_file):
+    chains = []
+    period = None
+    tokens = tokenize(spf_file)
+    for tok in tokens:
+        if tok == "ScanStructures":
+            next(tokens)  # '{'
+            chains.extend(parse_scan_structures(tokens))
+        elif tok == "Period" and period is None:
+            match = _PERIOD_RE.match(unquote(next(tokens)))
+            if match:
+                period = float(match.group(1)) * _UNITS[match.group(2)]
+    return chains, period
+
+# Function to read the chains of a report_scan_path -chain all report
+def read_scan_path_report(report_file):
+    chains = []
+    in_table = False
+    with open(report_file, errors="replace") as f:
+        for line in f:
+            if "Scan_path" in line and "Len" in line:
+                in_table = True
+                continue
+            if not in_table or line.lstrip().startswith("-"):
+                continue
+            match = _SCAN_PATH_RE.match(line)
+            if match:
+                chains.append(Chain(match.group(1), int(match.group(2)), match.group(3), match.group(4)))
+            elif not line.strip() or line.lstrip().startswith(("*", "=")):
+                in_table = False
+    return chains
+
+# Function to compute the balance figures of a set of chain lengths
+def chain_balance(lengths):
+    longest = max(lengths)
+    mean = sum(lengths) / len(lengths)
+    return {
+        "chains": len(lengths),
+        "scan_cells": sum(lengths),
+        "longest": longest,
+        "shortest": min(lengths),
+        "mean": mean,
+        # longest chain over the average, 0 for perfectly balanced chains
+        "imbalance": longest / mean - 1.0 if mean else 0.0,
+        "padding_bits": sum(longest - length for length in lengths),
+    }
+
+# Function to model the test application of a pattern set.
+# lengths: chain lengths; period: shift/capture cycle in seconds.
+def test_time(lengths, patterns, capture_cycles=1, period=100e-9):
+    longest = max(lengths)
+    shift = longest + capture_cycles
+    cycles = patterns * shift + longest
+    return {
+        "patterns": patterns,
+        "shift_cycles_per_pattern": longest,
+        "cycles": cycles,
+        "seconds": cycles * period,
+        # vectors per scan pin and stimulus + expected bits of all chains
+        "vector_depth": cycles,
+        "scan_data_bits": 2 * patterns * longest * len(lengths),
+    }
+
+# Function to spread scan cells evenly over at most count chains.
+# Returns the chain lengths, as many as the longest chain needs.
+def balanced_lengths(scan_cells, count):
+    count = math.ceil(scan_cells / math.ceil(scan_cells / count))
+    shorter, longer = divmod(scan_cells, count)
+    return [shorter + 1] * longer + [shorter] * (count - longer)
+
+# Function to evaluate every chain count the pin budget allows.
+# Returns (recommended chain count, [(chains, model)]).
+def recommend_chain_count(scan_cells, patterns, pin_budget, capture_cycles=1, period=100e-9,
+                          tester_depth=None, tolerance=0.05):
+    candidates = []
+    for count in range(1, min(pin_budget // 2, scan_cells) + 1):
+        lengths = balanced_lengths(scan_cells, count)
+        if len(lengths) < count:
+            # same longest chain as a smaller count, already evaluated
+            continue
+        model = test_time(lengths, patterns, capture_cycles, period)
+        model["pins"] = 2 * count
+        model["fits_tester"] = tester_depth is None or model["vector_depth"] <= tester_depth
+        candidates.append((count, model))
+    feasible = [(count, model) for count, model in candidates if model["fits_tester"]]
+    if not feasible:
+        return None, candidates
+    best = min(model["seconds"] for _, model in feasible)
+    recommended = min(count for count, model in feasible if model["seconds"] <= best * (1 + tolerance))
+    return recommended, candidates
+
+def _time_text(seconds):
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    return f"{seconds * 1e3:.3f} ms"
+
+# Main function
+def analyse_scan(config: Config, spf_file=None, scan_path_file=None, patterns_file=None, patterns=None,
+                 capture_cycles=None, period=None, pin_budget=None, tester_depth=None, tolerance=0.05):
+    spf_file = spf_file or config.spf_file
+    netlist_dir = os.path.dirname(os.path.abspath(spf_file))
+    scan_path_file = scan_path_file or os.path.join(os.path.dirname(netlist_dir), "rpt",
+                                                    f"{config.top_module}_dft.scan_path")
+
+    chains, spf_period = read_spf_chains(spf_file) if os.path.isfile(spf_file) else ([], None)
+    report_chains = read_scan_path_report(scan_path_file) if os.path.isfile(scan_path_file) else []
+    if chains and report_chains:
+        spf_lengths = sorted(chain.length for chain in chains)
+        if spf_lengths != sorted(chain.length for chain in report_chains):
+            print(f"Warning: chain lengths of {spf_file} and {scan_path_file} differ, using the SPF.")
+    chains = chains or report_chains
+    if not chains:
+        raise ValueError(f"No scan chains found in {spf_file} or {scan_path_file}")
+    period = period or spf_period or 100e-9
+
+    if patterns is None:
+        patterns_file = patterns_file or config.patterns_file
+        if os.path.isfile(patterns_file):
+            with open_patterns(patterns_file) as store:
+                patterns = len(store)
+        else:
+            summary_file = config.summary_file.replace('_report', '_ATPG_report')
+            report = parse_summary(summary_file) if os.path.isfile(summary_file) else None
+            if report is None or report.patterns is None:
+                raise ValueError(f"No pattern count: {patterns_file} and {summary_file} not found")
+            patterns = report.patterns
+    if capture_cycles is None:
+        # launch and capture for the delay fault models
+        capture_cycles = 2 if config.fault_model in ("transition", "path_delay", "hold_time") else 1
+
+    lengths = [chain.length for chain in chains]
+    balance = chain_balance(lengths)
+    model = test_time(lengths, patterns, capture_cycles, period)
+    balanced = test_time(balanced_lengths(balance["scan_cells"], len(lengths)), patterns, capture_cycles, period)
+    recommended, candidates = recommend_chain_count(balance["scan_cells"], patterns, pin_budget or 2 * len(lengths),
+                                                    capture_cycles, period, tester_depth, tolerance)
+    return {"chains": [chain._asdict() for chain in chains], "balance": balance, "period": period,
+            "capture_cycles": capture_cycles, "test_time": model, "balanced_test_time": balanced,
+            "recommended_chains": recommended, "candidates": candidates}
+
+# Function to print the analysis
+def print_analysis(analysis):
+    balance = analysis["balance"]
+    model = analysis["test_time"]
+    print(f"{'chain':<16} {'length':>8} {'scan in':<16} {'scan out':<16}")
+    for chain in analysis["chains"]:
+        print(f"{chain['name']:<16} {chain['length']:>8} {chain['scan_in'] or '-':<16} {chain['scan_out'] or '-':<16}")
+    print(f"\n{balance['chains']} chains, {balance['scan_cells']} scan cells, length {balance['shortest']}..{balance['longest']} "
+          f"(mean {balance['mean']:.1f}), imbalance {100 * balance['imbalance']:.1f}%, {balance['padding_bits']} padding bits per load")
+    print(f"{model['patterns']} patterns x ({model['shift_cycles_per_pattern']} shift + {analysis['capture_cycles']} capture) cycles "
+          f"= {model['cycles']} cycles, {_time_text(model['seconds'])} at {analysis['period'] * 1e9:g} ns")
+    print(f"tester memory: {model['vector_depth']} vectors per scan pin, {model['scan_data_bits'] / 8 / 1024:.1f} KB scan data")
+    saved = model["seconds"] - analysis["balanced_test_time"]["seconds"]
+    if saved > 0:
+        print(f"balancing the chains would save {_time_text(saved)} ({100 * saved / model['seconds']:.1f}%)")
+
+    recommended = analysis["recommended_chains"]
+    candidates = dict(analysis["candidates"])
+    shown = sorted({c for c in candidates if c & (c - 1) == 0} | {balance["chains"], recommended or 1, max(candidates)})
+    print(f"\n{'chains':>6} {'pins':>5} {'longest':>8} {'cycles':>12} {'time':>12}")
+    for count in shown:
+        if count in candidates:
+            m = candidates[count]
+            marks = (" <- recommended" if count == recommended else "") + ("" if m["fits_tester"] else " (exceeds tester depth)")
+            print(f"{count:>6} {m['pins']:>5} {m['shift_cycles_per_pattern']:>8} {m['cycles']:>12} {_time_text(m['seconds']):>12}{marks}")
+    if recommended is None:
+        print("No chain count within the pin budget fits the tester depth.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Analyse scan chain balance, estimate test time and recommend a chain count.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--spf', default=None, help='Test protocol (default: spf_file)')
+    parser.add_argument('--scan_path', default=None, help='report_scan_path report (default: rpt/<top>_dft.scan_path next to the Netlist directory)')
+    parser.add_argument('--patterns_file', default=None, help='STIL patterns (default: patterns_file)')
+    parser.add_argument('--patterns', type=int, default=None, help='Pattern count instead of reading the patterns')
+    parser.add_argument('--capture_cycles', type=int, default=None, help='Capture cycles per pattern (default: 1, 2 for delay fault models)')
+    parser.add_argument('--period', type=float, default=None, help='Test cycle in ns (default: the SPF Period or 100)')
+    parser.add_argument('--pin_budget', type=int, default=None, help='Scan pins available, two per chain (default: the current chains)')
+    parser.add_argument('--tester_depth', type=int, default=None, help='Tester vector memory per pin (default: unlimited)')
+    parser.add_argument('--tolerance', type=float, default=0.05, help='Test time slack of the recommendation (default: 0.05)')
+    parser.add_argument('--json', default=None, help='Also write the analysis as JSON')
+    args = parser.parse_args()
+
+    config = parse_config(args.config)
+    analysis = analyse_scan(config, args.spf, args.scan_path, args.patterns_file, args.patterns, args.capture_cycles,
+                            args.period * 1e-9 if args.period else None, args.pin_budget, args.tester_depth,
+                            args.tolerance)
+    print_analysis(analysis)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(analysis, f, indent=1)
@@ -0,0 +1,196 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import subprocess
+from config_parser import Config, parse_config
+
+# Content addressed cache for the flow stages.
+# A stage's key hashes its generated TCL, the Config fields it depends on and
+# the contents of its input files. When a key was seen before, the stored
+# outputs are copied back instead of running dc_shell/tmax again. Entries are
+# evicted least recently used first once the cache grows past max_bytes.
+
+DEFAULT_CACHE_DIR = ".stage_cache"
+DEFAULT_MAX_BYTES = 20 << 30
+
+# Config fields that affect each stage besides what is already in its TCL
+STAGE_FIELDS = {
+    "dft": ["top_module", "synthesized_files", "db_library", "scan_style", "num_scan_chain"],
+    "atpg": ["top_module", "fault_model", "pattern_specification", "fault_collapsing", "fault_coverage",
+             "launch_cycle", "capture_cycle", "MUXClock_mode", "auto_compression", "n_detect",
+             "iddq_max_patterns", "iddq_toggle", "iddq_float", "iddq_strong", "iddq_interval_size",
+             "path_delay_slack", "path_delay_max_paths", "bridging_optimize_bridge_strengths",
+             "bridging_site_source", "bridging_num_pairs", "structural_collapsing", "plateau_slope",
+             "plateau_window", "remove_fault", "fault_sampling", "sample_precision", "sample_confidence",
+             "sample_seed"],
+    "faultsim": ["top_module", "fault_model", "fault_collapsing", "launch_cycle", "capture_cycle",
+                 "simulation_sequential", "simulation_sequential_nodrop", "remove_fault", "fault_sampling"],
+}
+
+# Function to list the input and output files of a stage.
+# DFT outputs are where DFTScriptGenerator writes them; the summary names
+# follow the ATPG/FaultSim generators' renaming.
+def stage_files(config: Config, stage: str, cwd: str = "."):
+    if stage == "dft":
+        inputs = [config.synthesized_files, config.synthesized_files.replace('.v', '.sdc'), config.db_library]
+        outputs = [os.path.join(cwd, "Netlist", f"{config.top_module}_dft{ext}")
+                   for ext in (".v", ".spf", ".spef", ".ddc", ".sdf")]
+        # scan path / cell reports scan_balance.py reads
+        outputs += [os.path.join(cwd, "rpt", f"{config.top_module}_dft{ext}") for ext in (".scan_path", ".cell")]
+    elif stage == "atpg":
+        inputs = [config.tech_library, config.netlist_file, config.spf_file]
+        if config.fault_model == "bridging":
+            inputs.append(os.path.join(cwd, "nodes.txt"))
+        elif config.fault_model in ("path_delay", "hold_time"):
+            inputs.append(os.path.join(cwd, f"{config.top_module}_delay.rpt"))
+        outputs = [config.faults_file, config.patterns_file,
+                   config.summary_file.replace('_report', '_ATPG_report')]
+    elif stage == "faultsim":
+        inputs = [config.tech_library, config.netlist_file, config.spf_file,
+                  config.patterns_file, config.faults_file]
+        if config.fault_model == "bridging":
+            inputs.append(os.path.join(cwd, "nodes.txt"))
+        outputs = [config.faults_file, config.summary_file.replace('_report', '_FS_report')]
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+    return inputs, outputs
+
+# Function to feed a file or a library directory into a hash.
+# Directories (db_library) hash their listing with sizes and mtimes only.
+def _hash_path(digest, path):
+    digest.update(f"\0{path}\0".encode())
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                st = os.stat(os.path.join(root, name))
+                digest.update(f"{name}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    elif os.path.isfile(path):
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(1 << 22)
+                if not block:
+                    break
+                digest.update(block)
+    else:
+        digest.update(b"<missing>")
+
+# Function to compute the cache key of a stage
+def stage_key(stage: str, tcl_text: str, config: Config, inputs):
+    digest = hashlib.sha256()
+    digest.update(stage.encode())
+    digest.update(tcl_text.encode())
+    for field in STAGE_FIELDS.get(stage, []):
+        digest.update(f"\0{field}={getattr(config, field, None)!r}".encode())
+    for path in inputs:
+        _hash_path(digest, path)
+    return digest.hexdigest()
+
+class StageCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def restore(self, key, outputs) -> bool:
+        # Copy a stored entry back to the output paths; False on a miss
+        manifest = os.path.join(self._entry(key), "manifest.json")
+        if not os.path.isfile(manifest):
+            return False
+        with open(manifest) as f:
+            stored = json.load(f)["outputs"]
+        if len(stored) != len(outputs):
+            return False
+        for index, path in enumerate(outputs):
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(os.path.join(self._entry(key), str(index)), path)
+        # mark as recently used for the LRU eviction
+        os.utime(manifest)
+        return True
+
+    def store(self, key, outputs) -> bool:
+        # Store the outputs of a finished stage; skipped if any is missing
+        if not all(os.path.isfile(path) for path in outputs):
+            return False
+        tmp = self._entry(f"{key}.tmp{os.getpid()}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        size = 0
+        for index, path in enumerate(outputs):
+            shutil.copyfile(path, os.path.join(tmp, str(index)))
+            size += os.path.getsize(path)
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump({"outputs": [os.path.abspath(p) for p in outputs], "size": size}, f)
+        shutil.rmtree(self._entry(key), ignore_errors=True)
+        try:
+            os.rename(tmp, self._entry(key))
+        except OSError:
+            # another job stored the same key first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+        return True
+
+    def evict(self):
+        # Drop least recently used entries until the cache fits max_bytes
+        entries = []
+        total = 0
+        for key in os.listdir(self.cache_dir):
+            manifest = os.path.join(self._entry(key), "manifest.json")
+            try:
+                with open(manifest) as f:
+                    size = json.load(f)["size"]
+                entries.append((os.path.getmtime(manifest), size, key))
+            except (OSError, ValueError, KeyError):
+                continue
+            total += size
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+
+# Function to run a stage through the cache.
+# run is called without arguments and returns the tool's exit code; its
+# outputs are only stored when it succeeds. force skips the lookup.
+# extra_inputs are hashed too, e.g. a fault list the TCL reads.
+def run_cached(cache: StageCache, stage: str, tcl_file: str, config: Config, run, force=False, cwd=".",
+               extra_inputs=()):
+    inputs, outputs = stage_files(config, stage, cwd)
+    inputs += list(extra_inputs)
+    with open(tcl_file) as f:
+        key = stage_key(stage, f.read(), config, inputs)
+    if not force and cache.restore(key, outputs):
+        print(f"{stage}: cache hit ({key[:12]}), outputs restored")
+        return 0
+    returncode = run()
+    if returncode == 0:
+        cache.store(key, outputs)
+    return returncode
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a flow stage through the content addressed stage cache.')
+    parser.add_argument('--config', default='../../Python/src/config.txt', help='Path to config.txt')
+    parser.add_argument('--stage', required=True, choices=sorted(STAGE_FIELDS), help='Stage to run')
+    parser.add_argument('--tcl', required=True, help='Generated TCL script of the stage')
+    parser.add_argument('--cache_dir', default=DEFAULT_CACHE_DIR, help=f'Cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--max_size', type=float, default=DEFAULT_MAX_BYTES / (1 << 30), help='Cache size limit in GB (default: 20)')
+    parser.add_argument('--force', action='store_true', help='Run the stage even if its outputs are cached')
+    parser.add_argument('--inputs', nargs='*', default=[],
+                        help='Extra input files the TCL reads, hashed into the key (e.g. fault lists)')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='Tool command, after --')
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("missing tool command after --")
+
+    cache = StageCache(args.cache_dir, int(args.max_size * (1 << 30)))
+    config = parse_config(args.config)
+    raise SystemExit(run_cached(cache, args.stage, args.tcl, config,
+                                lambda: subprocess.run(command).returncode, force=args.force,
+                                extra_inputs=args.inputs))
@@ -0,0 +1,215 @@
+import os
+import re
+import sys
+import json
+import time
+import fcntl
+import argparse
+import subprocess
+
+# Per stage profiling of a flow run.
+# `run --stage <name> -- <command>` runs one stage (a Python generator,
+# dc_shell, tmax, pt_shell or a wrapper around them), passes its output
+# through and time stamps every line on the way. It records the wall time,
+# CPU time and peak RSS of the whole child process tree (wait4 rusage), and
+# splits the tool output into phases: every echoed tool command
+# ("TEST-T> run_atpg", "dc_shell> compile") opens a phase, every
+# "Begin ..." line a sub phase, and "CPU_time=" figures are credited to the
+# innermost open phase. Without prompts in the output, --log names a tool log
+# to read the phases from afterwards (CPU times only).
+#
+# Stages are appended to a JSON profile; the Chrome trace next to it
+# (<profile>.trace.json, open in chrome://tracing or ui.perfetto.dev) is
+# rewritten after every stage.
+
+DEFAULT_PROFILE = "profile.json"
+
+_COMMAND_RE = re.compile(r"^\s*(?:BUILD-T|DRC-T|TEST-T|dc_shell(?:-xg-t|-t)?|pt_shell|icc2_shell)>\s*(\w+)")
+_BEGIN_RE = re.compile(r"^\s*Begin\s+([A-Za-z][\w -]*?)(?=\s*[:.(=,]|\s+for\b|\s+of\b|\s*$)")
+_END_RE = re.compile(r"^\s*End\s+([A-Za-z][\w -]*?)(?=\s*[:.(=,]|\s*$)")
+_CPU_RE = re.compile(r"CPU[_ ]time\s*=\s*([\d.]+)", re.IGNORECASE)
+
+class PhaseParser:
+    # Builds the phase tree from output lines; times are seconds since start
+    def __init__(self):
+        self.phases = []     # {"name", "start", "end", "cpu", "children"}
+        self._command = None
+        self._sub = None
+
+    def _close_sub(self, now):
+        if self._sub is not None:
+            self._sub["end"] = now
+            self._sub = None
+
+    def _close_command(self, now):
+        self._close_sub(now)
+        if self._command is not None:
+            self._command["end"] = now
+            self._command = None
+
+    def feed(self, line, now):
+        match = _COMMAND_RE.match(line)
+        if match:
+            self._close_command(now)
+            self._command = {"name": match.group(1), "start": now, "end": now, "cpu": None, "children": []}
+            self.phases.append(self._command)
+            return
+        match = _BEGIN_RE.match(line)
+        if match:
+            self._close_sub(now)
+            self._sub = {"name": match.group(1).strip(), "start": now, "end": now, "cpu": None, "children": []}
+            (self._command["children"] if self._command else self.phases).append(self._sub)
+        cpu = _CPU_RE.search(line)
+        if cpu:
+            phase = self._sub or self._command
+            if phase is not None:
+                phase["cpu"] = (phase["cpu"] or 0.0) + float(cpu.group(1))
+        if _END_RE.match(line):
+            self._close_sub(now)
+
+    def finish(self, now):
+        self._close_command(now)
+        return self.phases
+
+# Function to read the phases of a finished tool log.
+# Lines carry no time, so phases are laid end to end by their CPU time.
+def parse_log_phases(log_file):
+    parser = PhaseParser()
+    with open(log_file, errors="replace") as f:
+        for line in f:
+            parser.feed(line, 0.0)
+    phases = parser.finish(0.0)
+
+    def layout(items, start):
+        for phase in items:
+            phase["start"] = start
+            layout(phase["children"], start)
+            length = max(phase["cpu"] or 0.0, sum(child["end"] - child["start"] for child in phase["children"]))
+            phase["end"] = start + length
+            start = phase["end"]
+    layout(phases, 0.0)
+    return phases
+
+# Function to run one stage and measure it.
+# Returns (returncode, stage record).
+def profile_command(stage, command, log_file=None, echo=True):
+    started = time.time()
+    start = time.monotonic()
+    parser = PhaseParser()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
+    for line in iter(process.stdout.readline, b""):
+        if echo:
+            try:
+                sys.stdout.buffer.write(line)
+                sys.stdout.flush()
+            except BrokenPipeError:
+                # keep profiling when the reader went away
+                echo = False
+        parser.feed(line.decode(errors="replace"), time.monotonic() - start)
+    process.stdout.close()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.monotonic() - start
+    phases = parser.finish(wall)
+    source = "output"
+    if not phases and log_file and os.path.isfile(log_file):
+        phases = parse_log_phases(log_file)
+        source = log_file
+
+    record = {
+        "stage": stage,
+        "command": command,
+        "started": started,
+        "wall_time": wall,
+        "cpu_time": usage.ru_utime + usage.ru_stime,
+        "user_time": usage.ru_utime,
+        "system_time": usage.ru_stime,
+        # Linux reports ru_maxrss in KB
+        "peak_rss_mb": usage.ru_maxrss / 1024.0,
+        "returncode": process.returncode,
+        "phase_source": source,
+        "phases": phases,
+    }
+    return process.returncode, record
+
+# Function to append a stage record to the profile and refresh its trace
+def append_profile(record, profile_file=DEFAULT_PROFILE):
+    with open(profile_file, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        text = f.read()
+        profile = json.loads(text) if text.strip() else {"stages": []}
+        profile["stages"].append(record)
+        f.seek(0)
+        f.truncate()
+        json.dump(profile, f, indent=1)
+        write_trace(profile, trace_file(profile_file))
+    return profile
+
+def trace_file(profile_file):
+    return os.path.splitext(profile_file)[0] + ".trace.json"
+
+# Function to write the Chrome trace event file of a profile.
+# One track per stage name; phases nest inside their stage.
+def write_trace(profile, output_file):
+    events = []
+    tracks = {}
+    for record in profile["stages"]:
+        tid = tracks.setdefault(record["stage"], len(tracks) + 1)
+        base = record["started"] * 1e6
+        events.append({"name": record["stage"], "cat": "stage", "ph": "X", "pid": 1, "tid": tid,
+                       "ts": base, "dur": record["wall_time"] * 1e6,
+                       "args": {"cpu_time": record["cpu_time"], "peak_rss_mb": record["peak_rss_mb"],
+                                "returncode": record["returncode"], "command": " ".join(record["command"])}})
+
+        def add(phases, category):
+            for phase in phases:
+                args = {"cpu_time": phase["cpu"]} if phase["cpu"] is not None else {}
+                events.append({"name": phase["name"], "cat": category, "ph": "X", "pid": 1, "tid": tid,
+                               "ts": base + phase["start"] * 1e6, "dur": (phase["end"] - phase["start"]) * 1e6,
+                               "args": args})
+                add(phase["children"], "subphase")
+        add(record["phases"], "phase")
+    for name, tid in tracks.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}})
+    with open(output_file, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+# Function to print the stages of a profile with their slowest phases
+def print_profile(profile, top=3):
+    print(f"{'stage':<16} {'wall s':>9} {'cpu s':>9} {'rss MB':>8} {'rc':>4}  slowest phases")
+    for record in profile["stages"]:
+        flat = []
+
+        def collect(phases, prefix):
+            for phase in phases:
+                flat.append((phase["end"] - phase["start"], prefix + phase["name"]))
+                collect(phase["children"], prefix + phase["name"] + "/")
+        collect(record["phases"], "")
+        slowest = ", ".join(f"{name} {seconds:.1f}s" for seconds, name in sorted(flat, reverse=True)[:top])
+        print(f"{record['stage']:<16} {record['wall_time']:>9.1f} {record['cpu_time']:>9.1f} "
+              f"{record['peak_rss_mb']:>8.0f} {record['returncode']:>4}  {slowest}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Profile flow stages into a JSON profile and a Chrome trace.')
+    parser.add_argument('--profile', default=DEFAULT_PROFILE, help=f'Profile file (default: {DEFAULT_PROFILE})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='Run and profile one stage')
+    run_parser.add_argument('--stage', required=True, help='Stage name, e.g. atpg')
+    run_parser.add_argument('--log', default=None, help='Tool log to read the phases from if the output has none')
+    run_parser.add_argument('tool_command', nargs=argparse.REMAINDER, help='Stage command, after --')
+    report_parser = subparsers.add_parser('report', help='Print the profile and rewrite its trace')
+    report_parser.add_argument('--top', type=int, default=3, help='Slowest phases listed per stage (default: 3)')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        command = args.tool_command[1:] if args.tool_command[:1] == ["--"] else args.tool_command
+        if not command:
+            run_parser.error("missing stage command after --")
+        returncode, record = profile_command(args.stage, command, args.log)
+        append_profile(record, args.profile)
+        raise SystemExit(returncode)
+    with open(args.profile) as f:
+        profile = json.load(f)
+    write_trace(profile, trace_file(args.profile))
+    print_profile(profile, args.top)
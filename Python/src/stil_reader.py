@@ -0,0 +1,414 @@
+import os
+import re
+import json
+import struct
+import argparse
+from collections import namedtuple
+import numpy as np
+
+# Streaming reader for the STIL written by `write_patterns -format STIL`.
+# Scan load/unload vectors and the PI/PO values of every pattern are decoded
+# into fixed width bit-packed rows (one row per pattern, a value and a care
+# plane of uint8, np.packbits bit order "little") stored in a binary file
+# next to the STIL. Chain and signal metadata live in a JSON side table at
+# the end of that file. Opening the same STIL again maps the existing file
+# as a (patterns x 2 x plane bytes) NumPy memmap, so pattern N is a slice
+# of it instead of a re-parse.
+
+CHUNK_SIZE = 1 << 22
+STORE_MAGIC = b"PSTORE01"
+STORE_SUFFIX = ".pstore"
+
+# Scan chain metadata from the ScanStructures block
+Chain = namedtuple("Chain", ["name", "length", "scan_in", "scan_out"])
+# One column block of a pattern row.
+# kind is load, unload, pi or po; offset and width are in bits.
+Field = namedtuple("Field", ["name", "kind", "offset", "width", "signals"])
+
+_TOKEN_RE = re.compile(r"""
+    \s*
+    (?: //[^\n]*
+      | /\*.*?\*/
+      | \{\*.*?\*\}                # Ann {* ... *}
+      | (
+            /\*.* | \{\*.*          # unterminated comment / annotation
+          | "[^"]*" | '[^']*'
+          | ["'].*                  # unterminated string
+          | [{};=:]
+          | [^\s{};=:"']+
+        )
+    )
+""", re.S | re.X)
+
+# Vector characters: value bit set for 1/H, care bit set for 0/1/L/H.
+# Everything else (X, N, Z, P, ...) is a don't care.
+_VALUE_BITS = np.zeros(256, np.uint8)
+_VALUE_BITS[[ord(c) for c in "1H"]] = 1
+_CARE_BITS = np.zeros(256, np.uint8)
+_CARE_BITS[[ord(c) for c in "01LH"]] = 1
+
+# Function to split a STIL file into tokens, reading it chunk by chunk
+def tokenize(stil_file, chunk_size=CHUNK_SIZE):
+    with open(stil_file, "r", buffering=chunk_size) as f:
+        carry = ""
+        eof = False
+        while not eof:
+            data = f.read(chunk_size)
+            eof = not data
+            buffer = carry + data
+            end = len(buffer) if eof else buffer.rfind("\n") + 1
+            if end == 0:
+                carry = buffer
+                continue
+            carry = buffer[end:]
+            tokens = [tok for tok in _TOKEN_RE.findall(buffer, 0, end) if tok]
+            if tokens:
+                last = tokens[-1]
+                if last[:2] in ("/*", "{*") or (last[0] in "\"'" and (len(last) == 1 or last[-1] != last[0])):
+                    # comment or string continues in the next chunk
+                    tokens.pop()
+                    if not eof:
+                        carry = last + carry
+            yield from tokens
+
+# Function to unquote a STIL name
+def unquote(token):
+    return token[1:-1] if len(token) > 1 and token[0] == token[-1] and token[0] in "\"'" else token
+
+# Function to expand vector data; \rN repeats the data word that follows it
+def _vector(words):
+    parts = []
+    repeat = 1
+    for word in words:
+        if word.startswith("\\r"):
+            repeat = int(word[2:])
+            continue
+        parts.append(word * repeat)
+        repeat = 1
+    return "".join(parts)
+
+# Function to split a group expression '"a" + "b" + c' into signal names
+def _group_signals(expression):
+    return [unquote(name.strip()) for name in expression.split("+") if name.strip()]
+
+# Function to consume tokens up to the matching '}' of a block already opened
+def _skip_block(tokens):
+    depth = 1
+    for tok in tokens:
+        if tok == "{":
+            depth += 1
+        elif tok == "}":
+            depth -= 1
+            if depth == 0:
+                return
+
+# Function to parse the Signals block into {name: direction}
+def _parse_signals(tokens):
+    signals = {}
+    name = None
+    for tok in tokens:
+        if tok == "}":
+            return signals
+        if tok == "{":
+            _skip_block(tokens)
+        elif tok == ";":
+            name = None
+        elif name is None:
+            name = unquote(tok)
+        else:
+            signals[name] = tok
+
+# Function to parse the SignalGroups block into {group: [signals]}
+def _parse_groups(tokens):
+    groups = {}
+    name = None
+    for tok in tokens:
+        if tok == "}":
+            return groups
+        if tok == "{":
+            _skip_block(tokens)
+        elif tok == ";":
+            name = None
+        elif tok == "=":
+            continue
+        elif name is None:
+            name = unquote(tok)
+        else:
+            groups[name] = _group_signals(unquote(tok))
+
+# Function to parse the ScanStructures block into a list of Chain.
+# The ScanCells list of each chain (scan-in to scan-out, "!" marks an
+# inversion in front of a cell) is put into cells when given.
+def parse_scan_structures(tokens, cells=None):
+    chains = []
+    for tok in tokens:
+        if tok == "}":
+            return chains
+        if tok != "ScanChain":
+            continue
+        name = unquote(next(tokens))
+        next(tokens)  # '{'
+        info = {}
+        statement = []
+        for tok in tokens:
+            if tok == "}":
+                break
+            if tok == ";":
+                if statement:
+                    info[statement[0]] = [unquote(t) for t in statement[1:]]
+                statement = []
+            elif tok == "{":
+                _skip_block(tokens)
+            else:
+                statement.append(tok)
+        chains.append(Chain(name, int(info.get("ScanLength", ["0"])[0]),
+                            info.get("ScanIn", [None])[0], info.get("ScanOut", [None])[0]))
+        if cells is not None and "ScanCells" in info:
+            cells[name] = info["ScanCells"]
+
+# Function to build the row layout from the chains and signal groups
+def _layout(chains, groups):
+    fields = []
+    offset = 0
+    for chain in chains:
+        fields.append(Field(f"load:{chain.name}", "load", offset, chain.length, [chain.scan_in]))
+        offset += chain.length
+    for chain in chains:
+        fields.append(Field(f"unload:{chain.name}", "unload", offset, chain.length, [chain.scan_out]))
+        offset += chain.length
+    for kind in ("pi", "po"):
+        signals = groups.get(f"_{kind}", [])
+        fields.append(Field(kind, kind, offset, len(signals), signals))
+        offset += len(signals)
+    return fields, offset
+
+class _RowBuilder:
+    # Value/care bit planes of one pattern while it is being decoded.
+    # The STIL characters are kept at their bit offsets and turned into the
+    # two planes once, when the row is written.
+    def __init__(self, width):
+        self.chars = bytearray(b"N" * width)
+        self.width = width
+
+    def set(self, field, data):
+        # character j of the vector goes to bit offset + j
+        data = data[:field.width].encode()
+        self.chars[field.offset:field.offset + field.width] = data + b"N" * (field.width - len(data))
+
+    def pack(self, plane_bytes):
+        # bit j of a plane is character j
+        chars = np.frombuffer(self.chars, np.uint8)
+        planes = np.zeros((2, 8 * plane_bytes), np.uint8)
+        planes[0, :self.width] = _VALUE_BITS[chars]
+        planes[1, :self.width] = _CARE_BITS[chars]
+        return np.packbits(planes, axis=1, bitorder="little").tobytes()
+
+# Function to walk the body of a Pattern block.
+# Yields (label, None, None) for every "pattern N" label and
+# (label, field, data) for every vector assignment to a known signal or
+# signal group, where label is the last label seen.
+def _pattern_statements(tokens, by_signal):
+    label = ""
+    depth = 1
+    statement = []
+    for tok in tokens:
+        if tok == "{":
+            depth += 1
+            statement = []
+        elif tok == "}":
+            depth -= 1
+            statement = []
+            if depth == 0:
+                return
+        elif tok == ":" and statement:
+            # a label; anything before it (e.g. a bare Ann keyword) is dropped
+            label = unquote(statement[-1])
+            statement = []
+            if label.startswith("pattern "):
+                yield label, None, None
+        elif tok == ";":
+            if depth > 1 and len(statement) > 2 and statement[1] == "=":
+                field = by_signal.get(unquote(statement[0]))
+                if field is not None:
+                    yield label, field, _vector(statement[2:])
+            statement = []
+        else:
+            statement.append(tok)
+
+# Function to decode a STIL file into a pattern store file.
+# The unload of pattern N is shifted out during the load_unload of pattern
+# N+1 (or the final "end" unload), so a row is only written once the next
+# pattern has started.
+def build_store(stil_file, store_file, chunk_size=CHUNK_SIZE):
+    tokens = tokenize(stil_file, chunk_size)
+    signals = {}
+    groups = {}
+    chains = []
+    scan_cells = {}
+    fields = None
+    plane_bytes = 0
+    rows = []
+    count = 0
+
+    tmp = f"{store_file}.tmp{os.getpid()}"
+    with open(tmp, "wb") as out:
+        out.write(STORE_MAGIC + struct.pack("<Q", 0))
+
+        def flush(keep):
+            nonlocal count
+            while len(rows) > keep:
+                out.write(rows.pop(0).pack(plane_bytes))
+                count += 1
+
+        for tok in tokens:
+            if tok == "Signals":
+                next(tokens)
+                signals = _parse_signals(tokens)
+            elif tok == "SignalGroups":
+                tok = next(tokens)
+                if tok != "{":
+                    next(tokens)  # named SignalGroups domain
+                groups.update(_parse_groups(tokens))
+            elif tok == "ScanStructures":
+                tok = next(tokens)
+                if tok != "{":
+                    next(tokens)
+                chains.extend(parse_scan_structures(tokens, scan_cells))
+            elif tok in ("Timing", "PatternBurst", "PatternExec", "Procedures", "MacroDefs", "Header",
+                         "UserKeywords", "Variables", "SignalsGroups"):
+                for tok in tokens:
+                    if tok == "{":
+                        _skip_block(tokens)
+                        break
+            elif tok == "Pattern":
+                next(tokens)  # pattern name
+                next(tokens)  # '{'
+                fields, width = _layout(chains, groups)
+                plane_bytes = (width + 7) // 8
+                by_signal = {}
+                for field in fields:
+                    if field.kind in ("pi", "po"):
+                        by_signal[f"_{field.kind}"] = field
+                    else:
+                        by_signal[field.signals[0]] = field
+                for label, field, data in _pattern_statements(tokens, by_signal):
+                    if field is None:
+                        # a new "pattern N" label
+                        rows.append(_RowBuilder(width))
+                        flush(2)
+                    elif field.kind != "unload":
+                        if rows:
+                            rows[-1].set(field, data)
+                    elif not label.startswith("pattern "):
+                        # final "end N unload"
+                        if rows:
+                            rows[-1].set(field, data)
+                    elif len(rows) > 1:
+                        # expected values of the previous pattern
+                        rows[-2].set(field, data)
+        flush(0)
+
+        header = json.dumps({
+            "stil_file": os.path.abspath(stil_file),
+            "stil_size": os.path.getsize(stil_file),
+            "stil_mtime_ns": os.stat(stil_file).st_mtime_ns,
+            "patterns": count,
+            "plane_bytes": plane_bytes,
+            "signals": signals,
+            "chains": [list(chain) for chain in chains],
+            "scan_cells": scan_cells,
+            "fields": [list(field) for field in (fields or [])],
+        }).encode()
+        header_offset = out.tell()
+        out.write(header)
+        out.seek(len(STORE_MAGIC))
+        out.write(struct.pack("<Q", header_offset))
+    os.replace(tmp, store_file)
+
+class PatternStore:
+    # Read only view of a pattern store file
+    def __init__(self, store_file):
+        self.store_file = store_file
+        with open(store_file, "rb") as f:
+            if f.read(len(STORE_MAGIC)) != STORE_MAGIC:
+                raise ValueError(f"{store_file} is not a pattern store")
+            header_offset, = struct.unpack("<Q", f.read(8))
+            f.seek(header_offset)
+            self.header = json.loads(f.read())
+        self.plane_bytes = self.header["plane_bytes"]
+        self.row_bytes = 2 * self.plane_bytes
+        self.chains = [Chain(*chain) for chain in self.header["chains"]]
+        self.fields = {f[0]: Field(*f) for f in self.header["fields"]}
+        self.signals = self.header["signals"]
+        self.scan_cells = self.header.get("scan_cells", {})
+        shape = (len(self), 2, self.plane_bytes)
+        if len(self) and self.plane_bytes:
+            self.planes = np.memmap(store_file, np.uint8, "r", offset=len(STORE_MAGIC) + 8, shape=shape)
+        else:
+            self.planes = np.zeros(shape, np.uint8)
+
+    def __len__(self):
+        return self.header["patterns"]
+
+    def close(self):
+        # the map is released with the last view of it
+        self.planes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def row(self, n):
+        # Packed value and care planes of pattern n (2 x plane bytes)
+        if not 0 <= n < len(self):
+            raise IndexError(n)
+        return self.planes[n]
+
+    def rows(self, start, count):
+        # Packed planes of count patterns from start (count x 2 x plane bytes)
+        if not (0 <= start and start + count <= len(self)):
+            raise IndexError(start + count)
+        return self.planes[start:start + count]
+
+    def get(self, n, name):
+        # (value, care) bits of one field of pattern n, one uint8 per bit
+        field = self.fields[name]
+        bits = np.unpackbits(self.row(n), axis=1, bitorder="little")
+        return bits[0, field.offset:field.offset + field.width], bits[1, field.offset:field.offset + field.width]
+
+    def pattern(self, n):
+        # Pattern n decoded back into vector strings, one per field
+        decoded = {}
+        for name, field in self.fields.items():
+            value, care = self.get(n, name)
+            chars = b"XXLH" if field.kind in ("unload", "po") else b"NN01"
+            decoded[name] = np.frombuffer(chars, np.uint8)[care * 2 + value].tobytes().decode()
+        return decoded
+
+# Function to open the pattern store of a STIL file, building it on the
+# first open or when the STIL changed since the store was written.
+def open_patterns(stil_file, store_file=None, rebuild=False):
+    store_file = store_file or stil_file + STORE_SUFFIX
+    if not rebuild and os.path.isfile(store_file):
+        store = PatternStore(store_file)
+        st = os.stat(stil_file)
+        if (store.header["stil_size"] == st.st_size and store.header["stil_mtime_ns"] == st.st_mtime_ns
+                and "scan_cells" in store.header):
+            return store
+        store.close()
+    build_store(stil_file, store_file)
+    return PatternStore(store_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Decode a STIL pattern file into a bit-packed pattern store.')
+    parser.add_argument('stil_file', help='Path to the STIL file')
+    parser.add_argument('--pattern', type=int, default=None, help='Print pattern N')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the pattern store even if it is up to date')
+    args = parser.parse_args()
+    with open_patterns(args.stil_file, rebuild=args.rebuild) as store:
+        print(f"{len(store)} patterns, {len(store.chains)} scan chains, {store.row_bytes} bytes per pattern")
+        if args.pattern is not None:
+            for name, data in store.pattern(args.pattern).items():
+                print(f"{name} = {data}")
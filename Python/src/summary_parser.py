@@ -0,0 +1,77 @@
+import re
+import argparse
+from collections import namedtuple
+
+# Parser for the `report_summaries` text that atpg.py/faultsim.py redirect
+# into summary_file (*_ATPG_report.rpt, *_FS_report.rpt), e.g.
+#
+#   Uncollapsed Transition Fault Summary Report
+#   fault class                     code   #faults
+#   Detected                         DT      12345
+#     detected_by_simulation         DS    (10000)
+#   Not detected                     ND          6
+#   total faults                             12519
+#   test coverage                            99.52%
+#   #internal patterns                         120
+#
+# A file may hold several summaries (report_summaries is also printed to the
+# log); the last one wins.
+
+SummaryReport = namedtuple("SummaryReport", [
+    "fault_model", "collapsed", "class_counts", "total_faults", "test_coverage",
+    "fault_coverage", "atpg_effectiveness", "patterns", "cpu_time",
+])
+
+_HEADER_RE = re.compile(r"^\s*(Uncollapsed|Collapsed)\s+(.+?)\s+Fault Summary Report", re.I)
+# "Detected  DT  12345" or "detected_by_simulation  DS  (10000)"
+_CLASS_RE = re.compile(r"^\s*[A-Za-z][\w -]*?\s+([A-Z][A-Z0-9])\s+\(?(\d+)\)?\s*$")
+_TOTAL_RE = re.compile(r"^\s*total faults\s+(\d+)", re.I)
+_PERCENT_RE = re.compile(r"^\s*(test coverage|fault coverage|ATPG effectiveness)\s+([\d.]+)%", re.I)
+_PATTERNS_RE = re.compile(r"^\s*#(internal|external) patterns\b.*?(\d+)\s*$", re.I)
+_CPU_RE = re.compile(r"CPU[_ ]time\D*?([\d.]+)", re.I)
+
+# Function to parse report text into a SummaryReport (None if there is none)
+def parse_summary_text(lines):
+    report = None
+    for line in lines:
+        match = _HEADER_RE.match(line)
+        if match:
+            report = {"fault_model": match.group(2).lower(), "collapsed": match.group(1).lower() == "collapsed",
+                      "class_counts": {}, "total_faults": None, "test_coverage": None, "fault_coverage": None,
+                      "atpg_effectiveness": None, "patterns": None, "cpu_time": None}
+            continue
+        if report is None:
+            continue
+        match = _CLASS_RE.match(line)
+        if match:
+            report["class_counts"][match.group(1)] = int(match.group(2))
+            continue
+        match = _TOTAL_RE.match(line)
+        if match:
+            report["total_faults"] = int(match.group(1))
+            continue
+        match = _PERCENT_RE.match(line)
+        if match:
+            report[match.group(1).lower().replace(" ", "_")] = float(match.group(2))
+            continue
+        match = _PATTERNS_RE.match(line)
+        if match:
+            # the first pattern line is the total; the indented ones break it down
+            if report["patterns"] is None:
+                report["patterns"] = int(match.group(2))
+            continue
+        match = _CPU_RE.search(line)
+        if match:
+            report["cpu_time"] = float(match.group(1))
+    return SummaryReport(**report) if report else None
+
+# Function to parse a summary file
+def parse_summary(summary_file):
+    with open(summary_file, "r") as f:
+        return parse_summary_text(f)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Parse a TetraMAX report_summaries file.')
+    parser.add_argument('summary_file', help='Path to the *_report.rpt file')
+    args = parser.parse_args()
+    print(parse_summary(args.summary_file))
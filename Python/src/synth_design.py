@@ -0,0 +1,265 @@
+import os
+import re
+import math
+import random
+import argparse
+
+# Synthetic scan inserted designs for benchmarking.
+# Writes a flat gate-level netlist of a given cell count (a tenth of the
+# cells are SDFFX1 scan flops stitched into chains, the rest random library
+# gates fed by the primary inputs, the flops and a window of the gates
+# before them), plus the files the flow reads for it:
+#   <top>_dft.v      netlist            <top>_dft.spf   test protocol
+#   <top>_dft.spef   coupling caps      <top>.stil      random patterns
+#   <top>.fault      tmax fault list    <top>_ATPG_report.rpt  summary
+#   config.txt       the repo config with the paths of the files above
+# Everything is streamed out, so 10M cell designs only cost disk space.
+
+GATES = [
+    ("NAND2X1", ["A", "B"]), ("NOR2X1", ["A", "B"]), ("INVX1", ["A"]), ("XOR2X1", ["A", "B"]),
+    ("AOI21X1", ["A0", "A1", "B0"]), ("OAI22X1", ["A0", "A1", "B0", "B1"]), ("MX2X1", ["A", "B", "S0"]),
+    ("BUFX2", ["A"]),
+]
+FLOP_PINS = ["D", "SI", "SE", "CK"]
+# fault classes of the fault list and their share
+FAULT_CODES = [("DS", 0.80), ("DI", 0.04), ("PT", 0.02), ("UU", 0.03), ("UT", 0.02), ("AU", 0.03), ("NO", 0.06)]
+RECENT_WINDOW = 64
+
+_SIZE_RE = re.compile(r"^(\d+(?:\.\d+)?)([kKmM]?)$")
+
+# Function to parse a cell count like 10000, 10k or 1.5M
+def parse_size(text):
+    match = _SIZE_RE.match(text)
+    if not match:
+        raise ValueError(f"Bad size: {text}")
+    return int(float(match.group(1)) * {"": 1, "k": 1000, "m": 1000000}[match.group(2).lower()])
+
+class SyntheticDesign:
+    # Shape of a synthetic design; every net name is computed, not stored
+    def __init__(self, cells, chains=None, seed=1, top="synth"):
+        self.cells = cells
+        self.seed = seed
+        self.top = top
+        self.inputs = min(1024, max(8, cells // 2000))
+        self.outputs = self.inputs
+        self.flops = max(1, cells // 10)
+        self.chains = chains or max(1, math.ceil(self.flops / 1000))
+        self.chains = min(self.chains, self.flops)
+        # primary outputs are driven by buffers, counted as gates
+        self.gates = max(1, cells - self.flops - self.outputs)
+        self.chain_length = math.ceil(self.flops / self.chains)
+
+    def chain_flops(self, c):
+        return range(c * self.chain_length, min(self.flops, (c + 1) * self.chain_length))
+
+    def q_net(self, j):
+        # the last flop of a chain drives its scan out port directly
+        if j % self.chain_length == self.chain_length - 1 or j == self.flops - 1:
+            return f"test_so{j // self.chain_length}"
+        return f"q{j}"
+
+    def input_ports(self):
+        return ["CK", "test_se"] + [f"pi{k}" for k in range(self.inputs)] + [f"test_si{c}" for c in range(self.chains)]
+
+    def output_ports(self):
+        return [f"po{k}" for k in range(self.outputs)] + [f"test_so{c}" for c in range(self.chains)]
+
+    def gate_inputs(self, rng, i, count):
+        nets = []
+        for _ in range(count):
+            pick = rng.random()
+            if i and pick < 0.5:
+                nets.append(f"n{i - 1 - int(rng.random() * min(i, RECENT_WINDOW))}")
+            elif pick < 0.9:
+                nets.append(self.q_net(int(rng.random() * self.flops)))
+            else:
+                nets.append(f"pi{int(rng.random() * self.inputs)}")
+        return nets
+
+    def gates_iter(self):
+        # (instance, cell, [(pin, net)]) of the combinational gates
+        rng = random.Random(self.seed)
+        for i in range(self.gates):
+            cell, pins = GATES[int(rng.random() * len(GATES))]
+            yield f"U{i}", cell, list(zip(pins, self.gate_inputs(rng, i, len(pins)))) + [("Y", f"n{i}")]
+
+    def flop_d(self, j):
+        return f"n{(j * 7919 + self.gates // 2) % self.gates}"
+
+# Function to write the netlist
+def write_netlist(design, netlist_file):
+    inputs, outputs = design.input_ports(), design.output_ports()
+    with open(netlist_file, "w", buffering=1 << 22) as f:
+        f.write(f"module {design.top} ( {', '.join(inputs + outputs)} );\n")
+        f.write(f"input {', '.join(inputs)};\noutput {', '.join(outputs)};\n")
+        for name, cell, pins in design.gates_iter():
+            f.write(f"{cell} {name} ( {', '.join(f'.{pin}({net})' for pin, net in pins)} );\n")
+        for j in range(design.flops):
+            si = f"test_si{j // design.chain_length}" if j % design.chain_length == 0 else design.q_net(j - 1)
+            f.write(f"SDFFX1 r{j} ( .D({design.flop_d(j)}), .SI({si}), .SE(test_se), .CK(CK), .Q({design.q_net(j)}) );\n")
+        for k in range(design.outputs):
+            f.write(f"BUFX2 ob{k} ( .A(n{design.gates - 1 - k % design.gates}), .Y(po{k}) );\n")
+        f.write("endmodule\n")
+
+# Function to write the Signals, SignalGroups and ScanStructures blocks
+def _write_stil_header(design, f, timing=False):
+    f.write("STIL 1.0;\nSignals {")
+    for name in design.input_ports():
+        f.write(f' "{name}" In;')
+    for name in design.output_ports():
+        f.write(f' "{name}" Out;')
+    f.write(" }\nSignalGroups {")
+    f.write(f""" "_pi" = '{" + ".join(f'"{name}"' for name in design.input_ports())}';""")
+    f.write(f""" "_po" = '{" + ".join(f'"{name}"' for name in design.output_ports())}'; }}\n""")
+    if timing:
+        f.write("Timing { WaveformTable \"_default_WFT_\" { Period '100ns'; } }\n")
+    f.write("ScanStructures {\n")
+    for c in range(design.chains):
+        flops = design.chain_flops(c)
+        cells = " ".join(f'"{design.top}.r{j}.SI"' for j in flops)
+        f.write(f'  ScanChain "{c}" {{ ScanLength {len(flops)}; ScanIn "test_si{c}"; ScanOut "test_so{c}"; '
+                f'ScanCells {cells}; }}\n')
+    f.write("}\n")
+
+# Function to write the test protocol
+def write_spf(design, spf_file):
+    with open(spf_file, "w") as f:
+        _write_stil_header(design, f, timing=True)
+
+def _bits(rng, n, table):
+    return format(rng.getrandbits(n), f"0{n}b").translate(table) if n else ""
+
+# Function to write random scan patterns
+def write_stil(design, stil_file, patterns=64):
+    rng = random.Random(design.seed + 1)
+    expect = str.maketrans("01", "LH")
+    inputs, outputs = len(design.input_ports()), len(design.output_ports())
+    with open(stil_file, "w", buffering=1 << 22) as f:
+        _write_stil_header(design, f)
+        f.write('Pattern "_pattern_" {\n')
+        for p in range(patterns):
+            f.write(f'"pattern {p}": Call "load_unload" {{')
+            for c in range(design.chains):
+                length = len(design.chain_flops(c))
+                if p:
+                    f.write(f' "test_so{c}"={_bits(rng, length, expect)};')
+                f.write(f' "test_si{c}"={_bits(rng, length, {})};')
+            f.write(f' }}\nCall "capture_CK" {{ "_pi"={_bits(rng, inputs, {})}; "_po"={_bits(rng, outputs, expect)}; }}\n')
+        f.write("}\n")
+
+# Function to write coupling parasitics of the gate output nets (name map
+# references like tools write them)
+def write_spef(design, spef_file):
+    rng = random.Random(design.seed + 2)
+    with open(spef_file, "w", buffering=1 << 22) as f:
+        f.write(f'*SPEF "IEEE 1481-1998"\n*DESIGN "{design.top}"\n*PROGRAM "synth_design.py"\n'
+                f'*DIVIDER /\n*DELIMITER :\n*BUS_DELIMITER [ ]\n*T_UNIT 1 NS\n*C_UNIT 1 PF\n*R_UNIT 1 OHM\n'
+                f'*L_UNIT 1 HENRY\n\n*NAME_MAP\n')
+        for i in range(design.gates):
+            f.write(f"*{i + 1} n{i}\n")
+        for i in range(design.gates):
+            couplings = [1 + i - 1 - int(rng.random() * min(i, RECENT_WINDOW)) for _ in range(2 if i else 0)]
+            ground = 0.001 + rng.random() * 0.01
+            caps = [0.0001 + rng.random() * 0.002 for _ in couplings]
+            f.write(f"\n*D_NET *{i + 1} {ground + sum(caps):.5f}\n*CONN\n*I U{i}:Y O *L 0\n*CAP\n1 *{i + 1}:1 {ground:.5f}\n")
+            for k, (other, cap) in enumerate(zip(couplings, caps), 2):
+                f.write(f"{k} *{i + 1}:1 *{other}:1 {cap:.5f}\n")
+            f.write(f"*RES\n1 U{i}:Y *{i + 1}:1 {1 + rng.random() * 5:.3f}\n*END\n")
+
+# Function to write a stuck-at fault list of every pin, with classes and
+# equivalent faults the way tmax writes them. Returns the fault count.
+def write_faults(design, faults_file):
+    rng = random.Random(design.seed + 3)
+    codes, weights = zip(*FAULT_CODES)
+    count = 0
+    with open(faults_file, "w", buffering=1 << 22) as f:
+        def pins():
+            for port in design.input_ports() + design.output_ports():
+                yield port
+            for name, _, connections in design.gates_iter():
+                for pin, _ in connections:
+                    yield f"{name}/{pin}"
+            for j in range(design.flops):
+                for pin in FLOP_PINS + ["Q"]:
+                    yield f"r{j}/{pin}"
+        for pin in pins():
+            for model in ("sa0", "sa1"):
+                code = "--" if rng.random() < 0.3 else rng.choices(codes, weights)[0]
+                f.write(f"{model} {code} {pin}\n")
+                count += 1
+    return count
+
+# Function to write an ATPG summary for a fault list of total faults
+def write_summary(summary_file, total, patterns=64):
+    detected = int(total * 0.84)
+    with open(summary_file, "w") as f:
+        f.write(f""" Uncollapsed Stuck Fault Summary Report
+ -----------------------------------------------
+ fault class                     code   #faults
+ ------------------------------  ----  ---------
+ Detected                         DT  {detected:>9}
+   detected_by_simulation         DS  ({detected:>7})
+ Possibly detected                PT  {int(total * 0.02):>9}
+ Undetectable                     UD  {int(total * 0.05):>9}
+ ATPG untestable                  AU  {int(total * 0.03):>9}
+ Not detected                     ND  {total - detected - int(total * 0.1):>9}
+ -----------------------------------------------
+ total faults                         {total:>9}
+ test coverage                           {100.0 * detected / (total - int(total * 0.05)):.2f}%
+ fault coverage                          {100.0 * detected / total:.2f}%
+ ATPG effectiveness                      97.00%
+ -----------------------------------------------
+
+    Pattern Summary Report
+ -----------------------------------------------
+ #internal patterns                     {patterns:>9}
+ -----------------------------------------------
+ CPU_time = 1.00 sec
+""")
+
+# Function to write a config.txt for the design, based on the repo one
+def write_config(design, config_file, files, template=None):
+    template = template or os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.txt")
+    values = {"top_module": design.top, "netlist_file": files["netlist"], "synthesized_files": files["netlist"],
+              "spf_file": files["spf"], "spef_file": files["spef"], "faults_file": files["faults"],
+              "summary_file": files["summary"].replace("_ATPG_report", "_report"), "patterns_file": files["stil"]}
+    with open(template) as f:
+        text = f.read()
+    for key, value in values.items():
+        text = re.sub(rf"^{key}\s*=.*$", f"{key} = {value}", text, count=1, flags=re.M)
+    with open(config_file, "w") as f:
+        f.write(text)
+
+# Main function
+def write_design(output_dir, cells, chains=None, patterns=64, seed=1, top="synth"):
+    design = SyntheticDesign(cells, chains, seed, top)
+    os.makedirs(output_dir, exist_ok=True)
+    output_dir = os.path.abspath(output_dir)
+    files = {
+        "netlist": os.path.join(output_dir, f"{top}_dft.v"),
+        "spf": os.path.join(output_dir, f"{top}_dft.spf"),
+        "spef": os.path.join(output_dir, f"{top}_dft.spef"),
+        "stil": os.path.join(output_dir, f"{top}.stil"),
+        "faults": os.path.join(output_dir, f"{top}.fault"),
+        "summary": os.path.join(output_dir, f"{top}_ATPG_report.rpt"),
+        "config": os.path.join(output_dir, "config.txt"),
+    }
+    write_netlist(design, files["netlist"])
+    write_spf(design, files["spf"])
+    write_stil(design, files["stil"], patterns)
+    write_spef(design, files["spef"])
+    write_summary(files["summary"], write_faults(design, files["faults"]), patterns)
+    write_config(design, files["config"], files)
+    return design, files
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write a synthetic scan inserted design (netlist, SPF, SPEF, STIL, fault list, config).')
+    parser.add_argument('--cells', default='10k', help='Cell count, e.g. 10000, 100k or 10M (default: 10k)')
+    parser.add_argument('--chains', type=int, default=None, help='Scan chains (default: about 1000 flops per chain)')
+    parser.add_argument('--patterns', type=int, default=64, help='Patterns in the STIL file (default: 64)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+    parser.add_argument('--top', default='synth', help='Top module name (default: synth)')
+    parser.add_argument('--output', default='synth', help='Output directory (default: synth)')
+    args = parser.parse_args()
+    design, files = write_design(args.output, parse_size(args.cells), args.chains, args.patterns, args.seed, args.top)
+    print(f"{design.cells} cells ({design.gates} gates, {design.flops} flops in {design.chains} chains) written to {args.output}")
@@ -0,0 +1,336 @@
+import os
+import re
+import sys
+import json
+import queue
+import socket
+import hashlib
+import argparse
+import threading
+import subprocess
+import socketserver
+from collections import OrderedDict
+from campaign import TMAX
+
+# Persistent tmax sessions.
+# Every generated script starts with read_netlist / run_build_model /
+# (add_clocks ...) / run_drc, which takes minutes on big designs. A script is
+# split at its last run_drc: the part before it is the setup and identifies
+# the design and DRC context, the rest is the job. The broker keeps one live
+# `tmax -shell -tcl` per setup, runs the setup once and then feeds it job
+# after job over its stdin, waiting for a marker echoed after every command.
+# tmax keeps set_faults / set_atpg / set_delay / ... settings for the rest of
+# the session, so the job's option commands are part of the session key too:
+# a session only ever runs jobs with the same settings and none leak from one
+# job into the next. The setup's relative paths resolve against the directory
+# tmax runs in, so that directory is part of the key as well.
+#
+# `serve` runs the broker behind a unix socket so separate make/campaign
+# invocations share the sessions; `run <script.tcl>` submits a script to it
+# (or runs it in a private session when no broker is listening) and can
+# replace `tmax -shell -tcl <script.tcl>` on a command line. The job's output
+# is passed on line by line while it runs.
+
+DEFAULT_SOCKET = ".tmax_session.sock"
+DONE_MARK = "__TMAX_SESSION_DONE__"
+PROMPT_RE = re.compile(r"\b(BUILD|DRC|TEST)-T>\s*")
+ERROR_RE = re.compile(r"^\s*Error:")
+# Run after every job so the next one starts from the built model with no
+# faults or patterns loaded
+RESET_COMMANDS = ["remove_faults -all", "set_patterns -delete"]
+
+# Function to split a generated script into (setup, job) command lists.
+# Comments, blank lines and the final exit are dropped.
+def split_script(text):
+    commands = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#") and line != "exit":
+            commands.append(line)
+    drc = max((i for i, command in enumerate(commands) if command.split()[0] == "run_drc"), default=-1)
+    return commands[:drc + 1], commands[drc + 1:]
+
+# Function to list the job commands that change persistent tool settings.
+# set_patterns only loads or deletes patterns, which the reset undoes.
+def job_options(commands):
+    return [command for command in commands
+            if command.split()[0].startswith("set_") and command.split()[0] != "set_patterns"]
+
+# Function to key a session by its setup commands, job settings and the
+# directory tmax runs in
+def setup_key(setup, options=(), cwd="."):
+    text = "\n".join(list(setup) + ["# options"] + list(options) + ["# cwd", os.path.abspath(cwd)])
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+class TmaxSession:
+    def __init__(self, setup, tool: str = TMAX, cwd: str = ".", timeout=None, options=(), licenses=None):
+        self.setup = list(setup)
+        self.options = list(options)
+        self.cwd = os.path.abspath(cwd)
+        self.key = setup_key(self.setup, self.options, self.cwd)
+        self.tool = tool
+        self.timeout = timeout
+        self.mode = None          # last prompt seen: BUILD, DRC or TEST
+        self.seq = 0
+        self.jobs = 0
+        self.started = False
+        self.closed = False
+        self.lock = threading.Lock()
+        # the process, and one of the broker's licenses, is only taken by start()
+        self.licenses = licenses
+        self.process = None
+        self.lines = queue.Queue()
+
+    def _reader(self):
+        for line in self.process.stdout:
+            self.lines.put(line)
+        self.lines.put(None)
+
+    def alive(self):
+        # True until closed or the tool exits; a session not started yet counts as alive
+        return not self.closed and (self.process is None or self.process.poll() is None)
+
+    def command(self, command, log=None, timeout=None):
+        # Send one command and wait for its completion marker.
+        # Returns the "Error:" lines it printed.
+        self.seq += 1
+        mark = f"{DONE_MARK} {self.seq}"
+        self.process.stdin.write(f"{command}\nputs \"{mark}\"\n")
+        self.process.stdin.flush()
+        errors = []
+        while True:
+            try:
+                line = self.lines.get(timeout=timeout or self.timeout)
+            except queue.Empty:
+                raise TimeoutError(f"no completion from the tool after: {command}")
+            if line is None:
+                raise RuntimeError(f"tool exited with code {self.process.wait()} during: {command}")
+            for prompt in PROMPT_RE.finditer(line):
+                self.mode = prompt.group(1)
+            text = PROMPT_RE.sub("", line)
+            if text.strip() == mark:
+                return errors
+            if log is not None and text.strip():
+                log.write(text)
+            if ERROR_RE.match(text):
+                errors.append(text.strip())
+
+    def batch(self, commands, log=None):
+        errors = []
+        for command in commands:
+            if log is not None:
+                log.write(f"{self.mode or ''}-T> {command}\n")
+            errors += self.command(command, log)
+        return errors
+
+    def start(self, log=None):
+        # Start tmax in the session directory, read the netlist, build the
+        # model and run DRC once
+        self.started = True
+        if self.licenses is not None:
+            self.licenses.acquire()
+        self.process = subprocess.Popen(self.tool, shell=True, cwd=self.cwd, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+        threading.Thread(target=self._reader, daemon=True).start()
+        errors = self.batch(self.setup, log)
+        if errors:
+            self.close()
+            raise RuntimeError(f"session setup failed: {errors[0]}")
+
+    def run(self, commands, cwd=None, log=None):
+        # Run one job against the built model; returns its error lines
+        prefix = [f'cd "{os.path.abspath(cwd)}"'] if cwd else []
+        errors = self.batch(prefix + list(commands), log)
+        self.batch(RESET_COMMANDS, log)
+        self.jobs += 1
+        return errors
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.process is not None and self.process.poll() is None:
+            try:
+                self.process.stdin.write("exit\n")
+                self.process.stdin.flush()
+                self.process.wait(timeout=30)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        if self.started and self.licenses is not None:
+            self.licenses.release()
+
+class SessionBroker:
+    # Live sessions keyed by setup and job settings; the least recently used one is closed
+    # when a new design would exceed max_sessions (= licenses)
+    def __init__(self, tool: str = TMAX, max_sessions: int = 2, timeout=None):
+        self.tool = tool
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+        # a retired session holds its license until its last job is done
+        self.licenses = threading.BoundedSemaphore(max_sessions)
+
+    def session(self, setup, log=None, options=(), cwd="."):
+        key = setup_key(setup, options, cwd)
+        retired = []
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is not None and session.alive():
+                self.sessions.move_to_end(key)
+            else:
+                if session is not None:
+                    retired.append(self.sessions.pop(key))
+                while len(self.sessions) >= self.max_sessions:
+                    retired.append(self.sessions.popitem(last=False)[1])
+                session = TmaxSession(setup, self.tool, cwd, self.timeout, options, self.licenses)
+                self.sessions[key] = session
+        # Evicted sessions finish their running job before they are closed,
+        # outside the broker lock so other designs are not held up meanwhile;
+        # the new session only starts tmax once a license is free
+        for old in retired:
+            with old.lock:
+                old.close()
+        with session.lock:
+            if not session.started and not session.closed:
+                try:
+                    session.start(log)
+                except Exception:
+                    session.close()
+                    with self.lock:
+                        if self.sessions.get(key) is session:
+                            del self.sessions[key]
+                    raise
+        return session
+
+    def run(self, script_text, cwd=None, log=None):
+        # Run a generated script; returns (returncode, error lines)
+        setup, commands = split_script(script_text)
+        cwd = cwd or "."
+        try:
+            for _ in range(3):
+                session = self.session(setup, log, job_options(commands), cwd)
+                with session.lock:
+                    # another job may have evicted it between the lookup and the lock
+                    if session.alive():
+                        errors = session.run(commands, cwd, log)
+                        break
+            else:
+                raise RuntimeError("session closed before the job could run")
+        except (RuntimeError, TimeoutError, OSError) as e:
+            if log is not None:
+                log.write(f"Error: {e}\n")
+            return 1, [str(e)]
+        return (1 if errors else 0), errors
+
+    def close(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            with session.lock:
+                session.close()
+
+class _Handler(socketserver.StreamRequestHandler):
+    # One JSON request line in; {"output": ...} lines while the job runs,
+    # then one {"returncode": ..., "errors": ...} line
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        broker = self.server.broker
+        if request.get("stop"):
+            response = {"returncode": 0, "errors": []}
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        else:
+            output = _Output(lambda text: self.wfile.write((json.dumps({"output": text}) + "\n").encode()))
+            returncode, errors = broker.run(request["script"], request.get("cwd"), output)
+            response = {"returncode": returncode, "errors": errors}
+        try:
+            self.wfile.write((json.dumps(response) + "\n").encode())
+        except OSError:
+            pass
+
+class _Output:
+    # Passes job output on as it arrives
+    def __init__(self, write):
+        self._write = write
+        self.closed = False
+
+    def write(self, text):
+        if self.closed:
+            return
+        try:
+            self._write(text)
+        except OSError:
+            # the client went away; the job still runs to its end
+            self.closed = True
+
+# Function to echo job output to stdout without buffering it
+def _echo(text):
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+# Function to serve a broker on a unix socket until a stop request
+def serve(socket_path=DEFAULT_SOCKET, tool=TMAX, max_sessions=2, timeout=None):
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    broker = SessionBroker(tool, max_sessions, timeout)
+    with socketserver.ThreadingUnixStreamServer(socket_path, _Handler) as server:
+        server.broker = broker
+        print(f"tmax session broker listening on {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            broker.close()
+            os.remove(socket_path)
+
+# Function to send one request to a running broker; None if none listens.
+# Output lines streamed before the response are passed to output.
+def submit(request, socket_path=DEFAULT_SOCKET, output=None):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_path)
+            client.sendall((json.dumps(request) + "\n").encode())
+            with client.makefile("rb") as f:
+                for line in f:
+                    message = json.loads(line)
+                    if "returncode" in message:
+                        return message
+                    if output is not None:
+                        output(message["output"])
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+    return {"returncode": 1, "errors": ["broker closed the connection"]}
+
+# Function to run a script through the broker, or in a private session
+def run_script(tcl_file, socket_path=DEFAULT_SOCKET, tool=TMAX, timeout=None):
+    with open(tcl_file) as f:
+        script = f.read()
+    response = submit({"script": script, "cwd": os.getcwd()}, socket_path, _echo)
+    if response is None:
+        broker = SessionBroker(tool, 1, timeout)
+        returncode, _ = broker.run(script, os.getcwd(), _Output(_echo))
+        broker.close()
+        return returncode
+    return response["returncode"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Keep tmax sessions alive across ATPG and fault simulation scripts.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f'Broker socket (default: {DEFAULT_SOCKET})')
+    parser.add_argument('--tool', default=os.environ.get("TMAX_SESSION_TOOL", TMAX),
+                        help='Tool command, e.g. "python3 fake_tmax.py" (default: $TMAX_SESSION_TOOL or tmax -shell -tcl)')
+    parser.add_argument('--timeout', type=float, default=None, help='Seconds a single command may take (default: no limit)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help='Run the broker')
+    serve_parser.add_argument('--max_sessions', type=int, default=2, help='Live tmax processes / licenses (default: 2)')
+    run_parser = subparsers.add_parser('run', help='Run a generated TCL script through the broker')
+    run_parser.add_argument('tcl_file', help='Generated atpg.tcl / faultsim.tcl')
+    subparsers.add_parser('stop', help='Stop the broker and its sessions')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.socket, args.tool, args.max_sessions, args.timeout)
+    elif args.command == 'run':
+        raise SystemExit(run_script(args.tcl_file, args.socket, args.tool, args.timeout))
+    elif submit({"stop": True}, args.socket) is None:
+        print(f"No broker listening on {args.socket}")
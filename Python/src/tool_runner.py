@@ -0,0 +1,176 @@
+import os
+import re
+import sys
+import shlex
+import signal
+import asyncio
+import argparse
+from collections import namedtuple
+
+# External tool execution (dc_shell, tmax, pt_shell, helper scripts).
+# Every invocation runs as an asyncio subprocess in its own process group;
+# stdout and stderr are streamed line by line into the stage's log file and
+# an optional callback. A wall clock timeout and an idle timeout (no output
+# for that long, e.g. a hung license checkout) kill the whole group; a run
+# that failed with a license error is retried with a growing delay.
+# ToolExecutor runs independent invocations concurrently under a limit.
+#
+# Defaults come from the environment so every caller, including pool
+# workers and the Makefile, picks them up:
+#   TOOL_TIMEOUT, TOOL_IDLE_TIMEOUT (seconds), TOOL_RETRIES, TOOL_RETRY_DELAY
+
+TIMEOUT_RETURNCODE = 124
+KILL_GRACE = 10.0
+LICENSE_RE = re.compile(r"licen[cs]e.*(fail|unavailable|not available|denied|exceeded|no such feature|cannot|unable)|"
+                        r"(fail|unable|cannot|could not).*(licen[cs]e|check\s*out)", re.IGNORECASE)
+
+# returncode; attempts; timed_out: None, "wall clock" or "idle"
+ToolResult = namedtuple("ToolResult", ["returncode", "attempts", "timed_out", "license_error"])
+
+def _env_number(name, cast=float):
+    value = os.environ.get(name)
+    return cast(value) if value else None
+
+# Function to read the option defaults from the environment
+def default_options():
+    return {
+        "timeout": _env_number("TOOL_TIMEOUT"),
+        "idle_timeout": _env_number("TOOL_IDLE_TIMEOUT"),
+        "retries": _env_number("TOOL_RETRIES", int) or 0,
+        "retry_delay": _env_number("TOOL_RETRY_DELAY") or 60.0,
+    }
+
+def _signal_group(process, sig):
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
+
+async def _kill(process):
+    # SIGTERM the process group, SIGKILL it if it is still there after KILL_GRACE
+    _signal_group(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), KILL_GRACE)
+    except asyncio.TimeoutError:
+        _signal_group(process, signal.SIGKILL)
+        await process.wait()
+
+async def _stream(stream, name, log, on_line, state):
+    loop = asyncio.get_running_loop()
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        text = line.decode(errors="replace")
+        state["last"] = loop.time()
+        if LICENSE_RE.search(text):
+            state["license"] = True
+        log.write(text)
+        log.flush()
+        if on_line is not None:
+            on_line(name, text)
+
+async def _attempt(command, log, cwd, timeout, idle_timeout, on_line):
+    # One run of the command; returns (returncode, timed_out, license_error)
+    loop = asyncio.get_running_loop()
+    process = await asyncio.create_subprocess_shell(command, cwd=cwd, stdin=asyncio.subprocess.DEVNULL,
+                                                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                                                    start_new_session=True)
+    start = loop.time()
+    state = {"last": start, "license": False}
+    readers = asyncio.ensure_future(asyncio.gather(_stream(process.stdout, "stdout", log, on_line, state),
+                                                   _stream(process.stderr, "stderr", log, on_line, state)))
+    timed_out = None
+    try:
+        while not readers.done():
+            now = loop.time()
+            deadlines = []
+            if timeout:
+                deadlines.append((start + timeout, "wall clock"))
+            if idle_timeout:
+                deadlines.append((state["last"] + idle_timeout, "idle"))
+            deadline, reason = min(deadlines) if deadlines else (None, None)
+            if deadline is not None and deadline <= now:
+                timed_out = reason
+                break
+            await asyncio.wait({readers}, timeout=None if deadline is None else deadline - now)
+        if timed_out:
+            limit = timeout if timed_out == "wall clock" else idle_timeout
+            log.write(f"Error: {timed_out} timeout after {limit:g} s, killing: {command}\n")
+            await _kill(process)
+        returncode = await process.wait()
+        await asyncio.wait({readers}, timeout=KILL_GRACE)
+    except asyncio.CancelledError:
+        log.write(f"Error: cancelled, killing: {command}\n")
+        await asyncio.shield(_kill(process))
+        raise
+    finally:
+        readers.cancel()
+    return (TIMEOUT_RETURNCODE if timed_out else returncode), timed_out, state["license"]
+
+# Function to run one tool invocation, streaming its output into log_file.
+# Retries up to `retries` times, waiting retry_delay (doubled every time)
+# in between, when the output shows a license error.
+async def run_tool_async(command, log_file, cwd=".", timeout=None, idle_timeout=None, retries=0,
+                         retry_delay=60.0, on_line=None) -> ToolResult:
+    delay = retry_delay
+    with open(log_file, "w") as log:
+        for attempt in range(1, retries + 2):
+            returncode, timed_out, license_error = await _attempt(command, log, cwd, timeout, idle_timeout, on_line)
+            if returncode == 0 or not license_error or attempt > retries:
+                break
+            log.write(f"# license error, retry {attempt}/{retries} in {delay:g} s\n")
+            log.flush()
+            await asyncio.sleep(delay)
+            delay *= 2
+    return ToolResult(returncode, attempt, timed_out, license_error)
+
+# Function to run one tool invocation with its output captured in a log
+# file; options default to the TOOL_* environment variables
+def run_tool(command, log_file, cwd=".", **options):
+    options = {**default_options(), **options}
+    return asyncio.run(run_tool_async(command, log_file, cwd, **options)).returncode
+
+class ToolExecutor:
+    # Runs independent tool invocations concurrently, at most max_concurrent
+    # (tool licenses) at a time
+    def __init__(self, max_concurrent=None, **options):
+        self.max_concurrent = max_concurrent
+        self.options = {**default_options(), **options}
+        self._semaphore = None
+
+    async def run(self, command, log_file, cwd=".", **options):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent or sys.maxsize)
+        async with self._semaphore:
+            return await run_tool_async(command, log_file, cwd, **{**self.options, **options})
+
+    def run_all(self, jobs):
+        # jobs: (command, log_file, cwd) tuples; returns their ToolResults in
+        # order. Interrupting it kills every running tool.
+        async def main():
+            return await asyncio.gather(*(self.run(*job) for job in jobs))
+        self._semaphore = None
+        return asyncio.run(main())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a tool with a streamed log, timeouts and license retries.')
+    parser.add_argument('--log', required=True, help='Log file the output is streamed into')
+    parser.add_argument('--timeout', type=float, default=None, help='Wall clock limit in seconds (default: $TOOL_TIMEOUT or none)')
+    parser.add_argument('--idle_timeout', type=float, default=None, help='Kill after this many seconds without output (default: $TOOL_IDLE_TIMEOUT or none)')
+    parser.add_argument('--retries', type=int, default=None, help='Retries after a license error (default: $TOOL_RETRIES or 0)')
+    parser.add_argument('--retry_delay', type=float, default=None, help='Seconds before the first retry, doubled after each (default: $TOOL_RETRY_DELAY or 60)')
+    parser.add_argument('--quiet', action='store_true', help='Only write the log, do not echo the output')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='Tool command, after --')
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("missing tool command after --")
+
+    options = {name: value for name, value in vars(args).items()
+               if name in ("timeout", "idle_timeout", "retries", "retry_delay") and value is not None}
+    echo = None if args.quiet else (lambda stream, line: (sys.stdout.write(line), sys.stdout.flush()))
+    try:
+        raise SystemExit(run_tool(shlex.join(command), args.log, on_line=echo, **options))
+    except KeyboardInterrupt:
+        raise SystemExit(130)
@@ -0,0 +1,470 @@
+import re
+import argparse
+from collections import namedtuple
+
+# Streaming reader for the structural Verilog written by dc_shell
+# (`write -f verilog -hier`). The netlist is read in large chunks and
+# tokenized incrementally, so memory stays bounded by the chunk size and the
+# largest single statement, no matter how big the netlist is.
+
+CHUNK_SIZE = 1 << 22
+
+# Records yielded by read_netlist
+Module = namedtuple("Module", ["name"])
+Port = namedtuple("Port", ["module", "direction", "name"])
+Assign = namedtuple("Assign", ["module", "lhs", "rhs"])
+# pins is a tuple of (pin, net); pin is the port name for named connections
+# (.A(n1)) or its position for ordered ones. Unconnected pins have net None.
+Instance = namedtuple("Instance", ["module", "cell", "name", "pins"])
+
+# One match per token; comments match with an empty group and are dropped.
+# An unterminated block comment swallows the rest of the buffer so the
+# caller can carry it over to the next chunk.
+_TOKEN_RE = re.compile(r"""
+    \s*
+    (?: //[^\n]*
+      | /\*.*?\*/
+      | (
+            /\*.*                                   # unterminated comment
+          | \\\S+                                   # escaped identifier
+          | [0-9]*\s*'[sS]?[bBoOdDhH]\s*[0-9a-fA-FxXzZ_?]+  # sized constant
+          | [A-Za-z_][\w$]*                         # identifier / keyword
+          | [0-9][0-9_]*                            # plain number
+          | "(?:\\.|[^"\\\n])*"                     # string
+          | \S                                      # punctuation
+        )
+    )
+""", re.S | re.X)
+
+_DIRECTIONS = {"input", "output", "inout"}
+# Declarations and statements that carry no instance and end at the next ';'
+_SKIP_STATEMENTS = {
+    "wire", "reg", "tri", "tri0", "tri1", "wand", "wor", "supply0", "supply1",
+    "parameter", "localparam", "defparam", "integer", "real", "time", "genvar",
+    "specparam", "timeunit", "timeprecision", "always", "initial",
+}
+# Blocks skipped up to their closing keyword
+_SKIP_BLOCKS = {
+    "function": "endfunction",
+    "task": "endtask",
+    "specify": "endspecify",
+    "generate": "endgenerate",
+    "primitive": "endprimitive",
+    "table": "endtable",
+}
+
+# Function to split a netlist into tokens, reading it chunk by chunk.
+# A chunk is only tokenized up to its last newline, so no token (other than
+# a block comment, which is carried over explicitly) is ever cut in half.
+def tokenize(netlist_file, chunk_size=CHUNK_SIZE):
+    with open(netlist_file, "r", buffering=chunk_size) as f:
+        carry = ""
+        eof = False
+        while not eof:
+            data = f.read(chunk_size)
+            eof = not data
+            buffer = carry + data
+            end = len(buffer) if eof else buffer.rfind("\n") + 1
+            if end == 0:
+                # no newline yet, keep reading
+                carry = buffer
+                continue
+            carry = buffer[end:]
+            tokens = _TOKEN_RE.findall(buffer, 0, end)
+            if tokens and tokens[-1].startswith("/*"):
+                # block comment continues in the next chunk
+                if eof:
+                    tokens.pop()
+                else:
+                    carry = tokens.pop() + carry
+            yield from filter(None, tokens)
+
+
+# Function to strip the escape of an escaped identifier for net/instance names
+def _name(token):
+    return token[1:] if token.startswith("\\") else token
+
+
+# Function to collect the tokens of one expression up to a ',', ')' or ';'
+# at depth 0. Concatenations and bit/part selects are joined back into text,
+# e.g. ['n', '[', '3', ']'] -> 'n[3]'. Returns the text and the stop token.
+def _expression(tokens, tok):
+    parts = []
+    depth = 0
+    while True:
+        if tok in ("(", "[", "{"):
+            depth += 1
+        elif tok in (")", "]", "}"):
+            if depth == 0:
+                break
+            depth -= 1
+        elif tok in (",", ";") and depth == 0:
+            break
+        parts.append(_name(tok))
+        tok = next(tokens)
+    return "".join(parts) or None, tok
+
+
+# Function to skip a statement up to and including its terminating ';'
+def _skip_statement(tokens):
+    depth = 0
+    for tok in tokens:
+        if tok in ("(", "[", "{"):
+            depth += 1
+        elif tok in (")", "]", "}"):
+            depth -= 1
+        elif tok == ";" and depth == 0:
+            return
+
+
+# Function to skip a balanced (...) group whose '(' was just consumed
+def _skip_group(tokens):
+    depth = 1
+    for tok in tokens:
+        if tok == "(":
+            depth += 1
+        elif tok == ")":
+            depth -= 1
+            if depth == 0:
+                return
+
+
+# Function to parse a port declaration, expanding bit ranges: input [1:0] a;
+# gives a[1] and a[0].
+def _ports(tokens, module, direction):
+    msb = lsb = None
+    names = []
+    tok = next(tokens)
+    while tok != ";":
+        if tok in ("wire", "reg", "signed", "tri", "logic"):
+            pass
+        elif tok == "[":
+            msb = next(tokens)
+            next(tokens)  # ':'
+            lsb = next(tokens)
+            next(tokens)  # ']'
+        elif tok not in (",", ")"):
+            names.append(_name(tok))
+        tok = next(tokens)
+    for name in names:
+        if msb is None or not (msb.isdigit() and lsb.isdigit()):
+            yield Port(module, direction, name)
+            continue
+        step = -1 if int(msb) >= int(lsb) else 1
+        for bit in range(int(msb), int(lsb) + step, step):
+            yield Port(module, direction, f"{name}[{bit}]")
+
+
+# Function to parse one connection list after its '(' was consumed
+def _connections(tokens):
+    pins = []
+    position = 0
+    tok = next(tokens)
+    if tok == ")":
+        return tuple(pins)
+    while True:
+        if tok == ".":
+            pin = _name(next(tokens))
+            next(tokens)  # '('
+            tok = next(tokens)
+            if tok == ")":
+                net = None
+            else:
+                net, tok = _expression(tokens, tok)
+            tok = next(tokens)  # ',' or ')'
+        else:
+            pin = position
+            if tok in (",", ")"):
+                net = None
+            else:
+                net, tok = _expression(tokens, tok)
+        pins.append((pin, net))
+        position += 1
+        if tok == ")":
+            return tuple(pins)
+        tok = next(tokens)  # token after ','
+
+
+# Function to parse a module instantiation statement whose cell type was
+# already consumed. One statement may hold several comma separated instances.
+def _instances(tokens, module, cell):
+    tok = next(tokens)
+    if tok == "#":
+        next(tokens)  # '('
+        _skip_group(tokens)
+        tok = next(tokens)
+    while True:
+        # gate primitives may be unnamed: and (y, a, b);
+        name = None
+        if tok != "(":
+            name = _name(tok)
+            tok = next(tokens)
+            if tok == "[":
+                # instance array range is kept as part of the name
+                rng = [tok]
+                for tok in tokens:
+                    rng.append(tok)
+                    if tok == "]":
+                        break
+                name += "".join(rng)
+                tok = next(tokens)
+        if tok != "(":
+            # not an instance after all, resync at the next ';'
+            if tok != ";":
+                _skip_statement(tokens)
+            return
+        yield Instance(module, cell, name, _connections(tokens))
+        tok = next(tokens)
+        if tok == ";":
+            return
+        tok = next(tokens)  # token after ','
+
+
+# Function to stream module, port, assign and instance records from a
+# structural Verilog netlist.
+def read_netlist(netlist_file, chunk_size=CHUNK_SIZE):
+    tokens = tokenize(netlist_file, chunk_size)
+    module = None
+    try:
+        for tok in tokens:
+            if tok == "module" or tok == "macromodule":
+                module = _name(next(tokens))
+                yield Module(module)
+                _skip_statement(tokens)
+            elif tok == "endmodule":
+                module = None
+            elif tok in _DIRECTIONS:
+                yield from _ports(tokens, module, tok)
+            elif tok == "assign":
+                tok = ","
+                while tok == ",":
+                    text, tok = _expression(tokens, next(tokens))
+                    lhs, _, rhs = (text or "").partition("=")
+                    yield Assign(module, lhs, rhs)
+            elif tok in _SKIP_STATEMENTS:
+                _skip_statement(tokens)
+            elif tok in _SKIP_BLOCKS:
+                end = _SKIP_BLOCKS[tok]
+                for tok in tokens:
+                    if tok == end:
+                        break
+            elif tok == "`":
+                # compiler directive (`timescale, `celldefine, ...); its
+                # arguments are plain tokens that are ignored outside a module
+                next(tokens)
+            elif module is not None and tok not in (";", "(", ")"):
+                yield from _instances(tokens, module, _name(tok))
+    except StopIteration:
+        # truncated netlist: stop at what has been read so far
+        return
+
+
+# Function to resolve every leaf cell instance to its hierarchical path.
+# Modules defined in the netlist are expanded from the top module down;
+# anything else (library cells, primitives) is a leaf. Returns a list of
+# (path, cell) tuples. The top module is the last module that no other
+# module instantiates, which is where dc_shell writes it.
+def leaf_instances(netlist_file, top=None, separator="/"):
+    children = {}
+    order = []
+    for record in read_netlist(netlist_file):
+        if isinstance(record, Module):
+            children[record.name] = []
+            order.append(record.name)
+        elif isinstance(record, Instance) and record.name is not None:
+            children[record.module].append((record.cell, record.name))
+    if not order:
+        return []
+    if top is None:
+        instantiated = {cell for kids in children.values() for cell, _ in kids}
+        roots = [m for m in order if m not in instantiated]
+        top = roots[-1] if roots else order[-1]
+
+    leaves = []
+    stack = [("", top)]
+    while stack:
+        prefix, module = stack.pop()
+        for cell, name in reversed(children.get(module, ())):
+            path = prefix + name
+            if cell in children:
+                stack.append((path + separator, cell))
+            else:
+                leaves.append((path, cell))
+    return leaves
+
+
+_CONST_RE = re.compile(r"^(\d*)\s*'[sS]?([bBoOdDhH])\s*([0-9a-fA-FxXzZ_?]+)$")
+_RANGE_RE = re.compile(r"^(.+)\[(\d+):(\d+)\]$")
+
+
+# Function to split a comma separated list at depth 0
+def _split_top(text):
+    items = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(text):
+        if char in "{[(":
+            depth += 1
+        elif char in "}])":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(text[start:i])
+            start = i + 1
+    items.append(text[start:])
+    return items
+
+
+# Function to expand connection text into single bit net names, MSB first.
+# Constants become 1'b0 / 1'b1; buses maps the bus names of the module's
+# ports to their bits. Unknown bits (x, z) are tied to 0.
+def _bits(text, buses):
+    if text is None:
+        return [None]
+    if text.startswith("{") and text.endswith("}"):
+        bits = []
+        for item in _split_top(text[1:-1]):
+            bits += _bits(item, buses)
+        return bits
+    match = _CONST_RE.match(text)
+    if match:
+        width, base, digits = match.groups()
+        digits = digits.replace("_", "").lower().replace("x", "0").replace("z", "0").replace("?", "0")
+        value = int(digits, {"b": 2, "o": 8, "d": 10, "h": 16}[base.lower()])
+        width = int(width) if width else max(1, value.bit_length())
+        return [f"1'b{(value >> i) & 1}" for i in range(width - 1, -1, -1)]
+    match = _RANGE_RE.match(text)
+    if match:
+        name, msb, lsb = match.group(1), int(match.group(2)), int(match.group(3))
+        step = -1 if msb >= lsb else 1
+        return [f"{name}[{bit}]" for bit in range(msb, lsb + step, step)]
+    return buses.get(text, [text])
+
+
+# Function to group port bits by bus name, in declaration order
+def _buses(ports):
+    buses = {}
+    for _, name in ports:
+        buses.setdefault(name.split("[")[0] if name.endswith("]") else name, []).append(name)
+    return buses
+
+
+# Function to flatten the hierarchy into leaf cell instances with their pins
+# connected to flat nets. Nets inside sub-modules get the instance path as
+# prefix, nets joined by ports or assign statements get one name (top level
+# names win) and constants are named 1'b0 / 1'b1. Returns (top, ports,
+# instances) with ports as (direction, name, net) of the top module and
+# instances as (path, cell, {pin: net}).
+def flatten(netlist_file, top=None, separator="/"):
+    modules = {}
+    order = []
+    for record in read_netlist(netlist_file):
+        if isinstance(record, Module):
+            modules[record.name] = {"ports": [], "instances": [], "assigns": []}
+            order.append(record.name)
+        elif isinstance(record, Port):
+            modules[record.module]["ports"].append((record.direction, record.name))
+        elif isinstance(record, Instance):
+            modules[record.module]["instances"].append(record)
+        elif isinstance(record, Assign) and record.module in modules:
+            modules[record.module]["assigns"].append((record.lhs, record.rhs))
+    if not order:
+        return None, [], []
+    if top is None:
+        instantiated = {i.cell for module in modules.values() for i in module["instances"]}
+        roots = [m for m in order if m not in instantiated]
+        top = roots[-1] if roots else order[-1]
+
+    parent = {}
+    top_nets = set()
+
+    def find(net):
+        root = net
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while net != root:
+            parent[net], net = root, parent[net]
+        return root
+
+    def rank(net):
+        return 2 if net.startswith("1'b") else 1 if net in top_nets else 0
+
+    def union(a, b):
+        a, b = find(a), find(b)
+        if a != b:
+            if rank(b) > rank(a):
+                a, b = b, a
+            parent[b] = a
+
+    instances = []
+    stack = [("", top, {})]
+    while stack:
+        prefix, name, port_map = stack.pop()
+        module = modules[name]
+        buses = _buses(module["ports"])
+
+        def net(local):
+            if local is None or local.startswith("1'b"):
+                return local
+            if local in port_map:
+                return port_map[local]
+            if not prefix:
+                top_nets.add(local)
+            return prefix + local
+
+        for lhs, rhs in module["assigns"]:
+            for a, b in zip(reversed(_bits(lhs, buses)), reversed(_bits(rhs.strip() or None, buses))):
+                if a is not None and b is not None:
+                    union(net(a), net(b))
+        subs = []
+        for inst in module["instances"]:
+            if inst.cell in modules:
+                sub_buses = _buses(modules[inst.cell]["ports"])
+                names = list(sub_buses)
+                mapping = {}
+                for pin, text in inst.pins:
+                    if isinstance(pin, int):
+                        if pin >= len(names):
+                            continue
+                        pin = names[pin]
+                    port_bits = sub_buses.get(pin, [pin])
+                    bits = _bits(text, buses)
+                    if len(port_bits) > 1 and len(bits) == 1 and bits[0] is not None and not bits[0].startswith("1'b"):
+                        # whole bus connected by name; assume the same bit indexes
+                        bits = [bits[0] + port_bit[len(pin):] for port_bit in port_bits]
+                    for port_bit, bit in zip(reversed(port_bits), reversed(bits)):
+                        if bit is not None:
+                            mapping[port_bit] = net(bit)
+                subs.append((f"{prefix}{inst.name}{separator}", inst.cell, mapping))
+            else:
+                pins = {}
+                for pin, text in inst.pins:
+                    pins[pin] = net(_bits(text, buses)[-1])
+                path = prefix + (inst.name if inst.name is not None else f"{inst.cell}_{len(instances)}")
+                instances.append((path, inst.cell, pins))
+        # depth first, in netlist order
+        stack.extend(reversed(subs))
+
+    ports = [(direction, name, find(name)) for direction, name in modules[top]["ports"]]
+    instances = [(path, cell, {pin: (find(n) if n is not None else None) for pin, n in pins.items()})
+                 for path, cell, pins in instances]
+    return top, ports, instances
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stream the records of a structural Verilog netlist.')
+    parser.add_argument('netlist_file', help='Path to the netlist file')
+    parser.add_argument('--leaves', action='store_true', help='Print hierarchical leaf instances instead of raw records')
+    parser.add_argument('--flat', action='store_true', help='Print flattened leaf instances with their nets')
+    args = parser.parse_args()
+    if args.flat:
+        top, ports, instances = flatten(args.netlist_file)
+        for direction, name, net in ports:
+            print(f"{direction} {name} {net}")
+        for path, cell, pins in instances:
+            print(f"{path} {cell} " + " ".join(f"{pin}={net}" for pin, net in pins.items()))
+    elif args.leaves:
+        for path, cell in leaf_instances(args.netlist_file):
+            print(f"{path} {cell}")
+    else:
+        for record in read_netlist(args.netlist_file):
+            print(record)
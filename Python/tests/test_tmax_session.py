@@ -0,0 +1,135 @@
+import os
+import sys
+import threading
+import time
+import pytest
+from tmax_session import SessionBroker, serve, submit
+
+FAKE_TMAX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "fake_tmax.py")
+
+SETUP = "read_netlist lib.v\nread_netlist {design}\nrun_build_model top\nrun_drc top.spf\n"
+JOB = "set_faults -model stuck\nadd_faults -all\nrun_atpg\nreport_summaries > summary.rpt\nexit\n"
+
+def script(design="top.v", job=JOB):
+    return SETUP.format(design=design) + job
+
+def fake_tmax(*args):
+    return " ".join([sys.executable, FAKE_TMAX] + list(args))
+
+class Log:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text):
+        self.lines.append(text)
+
+    def text(self):
+        return "".join(self.lines)
+
+def test_reuses_session(tmp_path):
+    broker = SessionBroker(fake_tmax(), max_sessions=2)
+    try:
+        log = Log()
+        assert broker.run(script(), str(tmp_path), log) == (0, [])
+        session = next(iter(broker.sessions.values()))
+        process = session.process
+        second = Log()
+        assert broker.run(script(), str(tmp_path), second) == (0, [])
+        assert list(broker.sessions.values()) == [session]
+        assert session.process is process and session.jobs == 2
+        # the setup only ran for the first job
+        assert "Building model" in log.text()
+        assert "Building model" not in second.text()
+        assert (tmp_path / "summary.rpt").is_file()
+    finally:
+        broker.close()
+    assert process.poll() is not None
+
+def test_job_settings_and_cwd_key_sessions(tmp_path):
+    first, second = tmp_path / "a", tmp_path / "b"
+    first.mkdir()
+    second.mkdir()
+    broker = SessionBroker(fake_tmax(), max_sessions=3)
+    try:
+        assert broker.run(script(), str(first))[0] == 0
+        assert broker.run(script(), str(second))[0] == 0
+        assert broker.run(script(job=JOB.replace("stuck", "transition")), str(first))[0] == 0
+        sessions = list(broker.sessions.values())
+        assert len(sessions) == 3
+        # tmax runs in the directory the setup's relative paths refer to
+        assert [session.cwd for session in sessions] == [str(first), str(second), str(first)]
+        assert (first / "summary.rpt").is_file() and (second / "summary.rpt").is_file()
+    finally:
+        broker.close()
+
+def test_evicts_least_recently_used(tmp_path):
+    broker = SessionBroker(fake_tmax(), max_sessions=1)
+    try:
+        assert broker.run(script("a.v"), str(tmp_path))[0] == 0
+        old = next(iter(broker.sessions.values()))
+        assert broker.run(script("b.v"), str(tmp_path))[0] == 0
+        assert old.closed and old.process.poll() is not None
+        assert len(broker.sessions) == 1
+        assert next(iter(broker.sessions.values())).setup[1] == "read_netlist b.v"
+    finally:
+        broker.close()
+
+def test_eviction_waits_for_running_job(tmp_path):
+    broker = SessionBroker(fake_tmax("--delay", "0.05"), max_sessions=1)
+    results = {}
+    try:
+        slow = threading.Thread(target=lambda: results.update(a=broker.run(script("a.v"), str(tmp_path))))
+        slow.start()
+        while not broker.sessions or not next(iter(broker.sessions.values())).started:
+            time.sleep(0.01)
+        results["b"] = broker.run(script("b.v"), str(tmp_path))
+        slow.join()
+        assert results == {"a": (0, []), "b": (0, [])}
+        assert len(broker.sessions) == 1
+    finally:
+        broker.close()
+
+def test_error_returncode(tmp_path):
+    broker = SessionBroker(fake_tmax("--fail", "run_atpg"), max_sessions=1)
+    try:
+        returncode, errors = broker.run(script(), str(tmp_path))
+        assert returncode == 1
+        assert errors == ["Error: run_atpg failed (fake)."]
+        # the session stays usable for the next job
+        assert broker.run(script(job="set_faults -model stuck\nreport_summaries\n"), str(tmp_path)) == (0, [])
+        assert next(iter(broker.sessions.values())).jobs == 2
+    finally:
+        broker.close()
+
+def test_setup_error_closes_session(tmp_path):
+    broker = SessionBroker(fake_tmax("--fail", "run_drc"), max_sessions=1)
+    try:
+        returncode, errors = broker.run(script(), str(tmp_path))
+        assert returncode == 1
+        assert "session setup failed" in errors[0]
+        assert not broker.sessions
+    finally:
+        broker.close()
+
+def test_socket_streams_output(tmp_path):
+    socket_path = str(tmp_path / "broker.sock")
+    tool = fake_tmax("--delay", "0.1")
+    server = threading.Thread(target=serve, args=(socket_path, tool), daemon=True)
+    server.start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+    chunks = []
+    try:
+        job = "report_summaries\nreport_summaries\nreport_summaries\nexit\n"
+        response = submit({"script": script(job=job), "cwd": str(tmp_path)}, socket_path,
+                          lambda text: chunks.append((time.monotonic(), text)))
+        done = time.monotonic()
+        assert response == {"returncode": 0, "errors": []}
+        # each summary arrives while the job runs, not all at its end
+        summaries = [when for when, text in chunks if "%" in text]
+        assert len(summaries) >= 3
+        assert summaries[0] < done - 0.15
+    finally:
+        submit({"stop": True}, socket_path)
+        server.join(timeout=30)
+    assert not os.path.exists(socket_path)
@@ -52,10 +52,10 @@ set filename [format "%s%s"  $my_toplevel "_dft.spef"]
 write_parasitics -output [format "%s%s"  "./Netlist/" $filename]
 
 set filename [format "%s%s"  $my_toplevel "_dft.scan_path"]
-redirect [format "%s%s"  "./rpt/" $filename] { report_constraint -all_violators -verbose }
+redirect [format "%s%s"  "./rpt/" $filename] { report_scan_path -view existing_design -chain all }
 
 set filename [format "%s%s"  $my_toplevel "_dft.cell"]
-redirect [format "%s%s"  "./rpt/" $filename] { report_constraint -all_violators -verbose }
+redirect [format "%s%s"  "./rpt/" $filename] { report_scan_path -view existing_design -cell all }
 
 redirect [format "%s%s"  "./rpt/" violation.rpt] { report_constraint -all_violators -verbose }
 redirect [format "%s%s"  [format "%s%s"  "./rpt/" $my_toplevel] ".area"] { report_area }